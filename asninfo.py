@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Announced prefixes and AS path length of ASn nodes
+
+Prefixes of an ASn are merged into sorted address intervals per IP version,
+overlapping and nested prefixes are counted once. Path lengths of all RIS
+collectors are summed into an average and a max. Every ASn of a batch is
+requested in one concurrent sweep through ripeapi, repeat runs are served by its cache
+"""
+
+from functools import reduce
+
+import ripeapi
+from fetch import DEF_WORKERS
+from rpsllex import format_asn
+
+# node attribute and its GraphML type
+NODE_ATTRIBUTES = (("ipv4_prefixes", "int",),
+                   ("ipv6_prefixes", "int",),
+                   ("ipv4_addresses", "long",),
+                   ("ipv6_48", "long",),
+                   ("path_length", "double",),
+                   ("path_length_max", "int",),)
+
+IPV6_48_BITS = 80
+
+
+def _merge_interval(intervals, interval):
+
+    if 0 < len(intervals) and interval[0] <= intervals[-1][1]:
+        intervals[-1] = (intervals[-1][0], max(intervals[-1][1], interval[1]),)
+    else:
+        intervals.append(interval)
+
+    return intervals
+
+
+def get_prefix_intervals(prefixes):
+    """
+    Returns dict of IP version to list of prefixes as (first, last + 1) address intervals,
+    prefixes that are not parsable are skipped
+    """
+
+    # inet_pton parses several times faster than ipaddress, socket is loaded only by enriched runs
+    import socket
+
+    intervals = {4: list(), 6: list()}
+
+    for prefix in prefixes:
+        address, _, length = prefix.partition("/")
+
+        try:
+            packed = socket.inet_pton(socket.AF_INET6 if ":" in address else socket.AF_INET, address)
+            address_bits = len(packed) * 8
+            host_bits = address_bits - int(length) if length != "" else 0
+        except (OSError, ValueError):
+            continue
+
+        if not 0 <= host_bits <= address_bits:
+            continue
+
+        first = int.from_bytes(packed, "big") >> host_bits << host_bits
+        intervals[4 if address_bits == 32 else 6].append((first, first + (1 << host_bits),))
+
+    return intervals
+
+
+def aggregate_intervals(intervals):
+    """
+    Returns sorted list of disjoint intervals covering the same addresses, adjacent ones are joined
+    """
+
+    return reduce(_merge_interval, sorted(intervals), list())
+
+
+def count_addresses(intervals):
+
+    return sum(map(lambda interval: interval[1] - interval[0], aggregate_intervals(intervals)))
+
+
+def get_prefix_summary(prefixes):
+    """
+    Returns dict of prefix counts, IPv4 addresses and IPv6 /48 networks of the prefixes
+    """
+
+    intervals = get_prefix_intervals(prefixes)
+
+    return {"ipv4_prefixes": len(intervals[4]),
+            "ipv6_prefixes": len(intervals[6]),
+            "ipv4_addresses": count_addresses(intervals[4]),
+            "ipv6_48": count_addresses(intervals[6]) >> IPV6_48_BITS}
+
+
+def get_path_length_summary(path_stats):
+    """
+    Returns dict of average and max AS path length over all collectors, None without paths
+    """
+
+    paths = sum(map(lambda stat: stat[1], path_stats))
+
+    if paths == 0:
+        return {"path_length": None, "path_length_max": None}
+
+    return {"path_length": round(sum(map(lambda stat: stat[2], path_stats)) / paths, 2),
+            "path_length_max": max(map(lambda stat: stat[4], path_stats))}
+
+
+def get_asn_info_many(asns, workers=DEF_WORKERS):
+    """
+    Returns dict of ASn to dict of NODE_ATTRIBUTES, ASn failed on RIPE errors are skipped
+    """
+
+    asn_names = dict(map(lambda asn: (format_asn(asn), asn,), asns))
+
+    prefixes = ripeapi.get_announced_prefixes_many(asn_names, workers=workers)
+    path_lengths = ripeapi.get_as_path_length_many(asn_names, workers=workers)
+
+    asn_info = dict()
+
+    for asn_name, asn in asn_names.items():
+        if prefixes.get(asn_name) is None or path_lengths.get(asn_name) is None:
+            continue
+
+        asn_info[asn] = dict(get_prefix_summary(prefixes[asn_name]), **get_path_length_summary(path_lengths[asn_name]))
+
+    return asn_info
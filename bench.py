@@ -0,0 +1,680 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks of RPSL expansion and link building
+
+RIPE responses are replayed from fixtures put into the ripeapi cache stores while
+the cache is in offline mode, so nothing is requested from RIPE. Fixtures are synthetic
+(large as-set trees, deeply nested peering-sets, long EXCEPT/AND chains) or recorded
+from a dotlinks.py cache file. Every benchmark reports the best time, throughput and
+peak memory, results can be saved as a baseline and compared with it later.
+
+Startup of dotlinks.py is measured in fresh interpreters: import, --help and a single ASn
+served from a cache file in offline mode, the time over a bare interpreter is kept within a budget.
+
+The set algebra evaluator of rpsl.split_peering is also compared with the boolean.py DNF
+path it replaced, the DNF path is run only if boolean.py is installed
+"""
+
+import sys
+import getopt
+import json
+import pickle
+import os
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from functools import reduce
+
+import cache
+import ripeapi
+import rpsl
+import rpslpolicy
+import dotlinks
+import asninfo
+from rpsllex import RE_ASSET_ANY, ASN_ANY, TOK_ASSET, TOK_OPERATOR, is_asn, asn_to_int, format_asn, tokenize
+
+USAGE_MSG = """
+Benchmark of as-expression evaluation
+(c) elsv-v.ru 2018
+
+Usage:
+    bench.py [-m <members>] [-r <repeat>] [-d <members>] [-f <fixtures>]
+             [-b <baseline>] [-s <baseline>] [-t <tolerance>]
+    bench.py -R <fixtures> [-c <cache>] [-m <members>]
+    bench.py -S [-B <budget>] [-m <members>] [-r <repeat>]
+
+Options:
+    -m|--members <members> - Members in each synthetic as-set, default is %d
+    -r|--repeat <repeat> - Best of <repeat> runs is reported, default is %d
+    -d|--dnf-max <members> - Skip the DNF path for bigger as-sets, default is %d
+    -f|--fixtures <fixtures> - Replay RIPE responses from JSON <fixtures>
+                               instead of synthetic ones
+    -b|--baseline <baseline> - Compare results with JSON <baseline>
+    -s|--save <baseline> - Save results as JSON <baseline>
+    -t|--tolerance <tolerance> - Slowdown ratio reported as a regression, default is %g
+    -R|--record <fixtures> - Write synthetic fixtures or, with -c, responses
+                             from the dotlinks.py cache file <cache> to JSON <fixtures>
+    -S|--startup - Measure startup of dotlinks.py instead of the suite
+    -B|--budget <budget> - Startup seconds over a bare interpreter, default is %g
+
+Exit code is %d when a benchmark is slower than the baseline or the startup budget
+"""
+
+SUCCESS = 0
+ERR_IO = 2
+ERR_GETOPT = 3
+ERR_REGRESSION = 5
+
+DEF_MEMBERS = 1000
+DEF_REPEAT = 3
+DEF_DNF_MAX = 20
+DEF_SEED = 2018
+DEF_TOLERANCE = 0.2
+DEF_TREE_FANOUT = 8
+DEF_TREE_DEPTH = 3
+DEF_NEST_DEPTH = 8
+DEF_CHAIN = 32
+DEF_AUTNUMS = 200
+DEF_STARTUP_BUDGET = 0.06
+DEF_STARTUP_REPEAT = 10
+
+STARTUP_ASN = "AS1"
+
+BENCH_THRESHOLDS = (10, 30, 60,)
+BENCH_PREFIXES = 20000
+
+BENCH_ASSETS = ("AS-BENCH-A", "AS-BENCH-B", "AS-BENCH-C",)
+
+BENCH_EXPRESSIONS = ("AS-BENCH-A OR AS-BENCH-B",
+                     "(AS-BENCH-A OR AS-BENCH-B) EXCEPT AS-BENCH-C",
+                     "AS-BENCH-A AND AS-BENCH-B",
+                     "(AS-BENCH-A EXCEPT AS-BENCH-C) OR (AS-BENCH-B AND AS-BENCH-C) OR AS1",)
+
+
+FIXTURE_STORES = {"whois": ripeapi._cache_whois,
+                  "asn-neighbours": ripeapi._cache_neighbours,
+                  "as-set": ripeapi._cache_members,
+                  "peering-set": ripeapi._cache_peerings}
+
+
+def make_assets(members_count, seed=DEF_SEED):
+    """
+    Stores BENCH_ASSETS with members_count overlapping ASn each into the ripeapi cache
+    """
+
+    asn_random = random.Random(seed)
+    asn_range = range(1, members_count * 3)
+
+    for asset_name in BENCH_ASSETS:
+        ripeapi._cache_members[asset_name] = set(map(format_asn, asn_random.sample(asn_range, members_count)))
+
+    rpsl._cache_closure.clear()
+    rpsl._cache_asset_deep.clear()
+
+
+def split_peering_dnf(peering):
+    """
+    as-sets are substituted by OR of members, EXCEPT is AND NOT,
+    then positive literals of DNF terms are collected
+    """
+
+    import boolean
+
+    asn_list = set()
+    peering_tokens = tokenize(peering)
+    asset_members = dict()
+
+    for asset_name in set(map(lambda token: token[1], filter(lambda token: token[0] == TOK_ASSET, peering_tokens))):
+        asset_asn_list = rpsl.uncover_asset(asset_name)
+
+        if asset_asn_list is None:
+            return None
+        elif ASN_ANY in asset_asn_list:
+            return {ASN_ANY}
+
+        if 0 < len(asset_asn_list):
+            asset_members[asset_name] = "(" + " OR ".join(map(format_asn, asset_asn_list)) + ")"
+
+    def token_logic(token):
+        token_type, token_word = token
+
+        if token_type == TOK_OPERATOR and token_word == "EXCEPT":
+            return "AND NOT"
+        elif token_type == TOK_ASSET:
+            return asset_members.get(token_word, token_word)
+
+        return token_word
+
+    asn_expr = boolean.BooleanAlgebra()
+
+    try:
+        asnexpr_list = asn_expr.dnf(asn_expr.parse(" ".join(map(token_logic, peering_tokens))))
+
+        def reduce_asnexpr(_asn_list, _expr):
+            present_asn = set(map(str, filter(lambda literal: type(literal) is not asn_expr.NOT, _expr.literals)))
+            if RE_ASSET_ANY in present_asn:
+                return {ASN_ANY}
+
+            return _asn_list.union(map(asn_to_int, filter(is_asn, present_asn)))
+
+        if type(asnexpr_list) is asn_expr.OR:
+            asn_list = reduce(reduce_asnexpr, asnexpr_list.args, asn_list)
+        elif asnexpr_list == asn_expr.TRUE:
+            asn_list = {ASN_ANY}
+        elif asnexpr_list != asn_expr.FALSE:
+            asn_list = reduce_asnexpr(asn_list, asnexpr_list)
+
+    except boolean.ParseError:
+        asn_list.clear()
+
+    return asn_list
+
+
+def make_fixtures(members_count=DEF_MEMBERS, seed=DEF_SEED, tree_fanout=DEF_TREE_FANOUT,
+                  tree_depth=DEF_TREE_DEPTH, nest_depth=DEF_NEST_DEPTH, chain=DEF_CHAIN, autnums=DEF_AUTNUMS):
+    """
+    Returns synthetic fixtures: dict of endpoint to dict of resource to response as in the cache stores
+    """
+
+    asn_random = random.Random(seed)
+    asn_range = range(1, members_count * 3)
+
+    fixtures = {"whois": dict(), "asn-neighbours": dict(), "as-set": dict(), "peering-set": dict()}
+    assets = fixtures["as-set"]
+
+    def make_tree(asset_name, depth):
+        if depth == tree_depth:
+            assets[asset_name] = set(map(format_asn, asn_random.sample(asn_range, members_count)))
+            return
+
+        assets[asset_name] = set(map(lambda child: "{}-{}".format(asset_name, child), range(tree_fanout)))
+        assets[asset_name].add(format_asn(asn_random.choice(asn_range)))
+
+        for child_name in assets[asset_name]:
+            if not is_asn(child_name):
+                make_tree(child_name, depth + 1)
+
+    make_tree("AS-TREE", 0)
+
+    for chain_index in range(chain):
+        assets["AS-CHAIN-{}".format(chain_index)] = set(map(format_asn, asn_random.sample(asn_range,
+                                                                                          members_count)))
+
+    for nest_index in range(nest_depth):
+        fixtures["peering-set"]["PRNG-NEST-{}".format(nest_index)] = {
+            "AS-CHAIN-{} EXCEPT AS-CHAIN-{}".format(nest_index % chain, (nest_index + 1) % chain)}
+
+        if nest_index + 1 < nest_depth:
+            fixtures["peering-set"]["PRNG-NEST-{}".format(nest_index)].add("PRNG-NEST-{}".format(nest_index + 1))
+
+    for asn in range(1, autnums + 1):
+        asn_peers = asn_random.sample(range(1, autnums + 1), min(autnums, 8))
+        fixtures["whois"][format_asn(asn)] = {
+            "aut-num": {format_asn(asn)},
+            "import": set(map(lambda peer: "from {} accept ANY".format(format_asn(peer)), asn_peers[:4])).union(
+                {"from AS-CHAIN-{} AND AS-CHAIN-{} accept ANY".format(asn % chain, (asn + 1) % chain)}),
+            "export": set(map(lambda peer: "to {} announce {}".format(format_asn(peer), format_asn(asn)),
+                              asn_peers[2:6])),
+            "mp-import": {"afi ipv6.unicast from PRNG-NEST-{} accept ANY".format(asn % nest_depth)}}
+        fixtures["asn-neighbours"][format_asn(asn)] = list(map(
+            lambda peer: (peer, asn_random.choice(("left", "right", "uncertain",)), asn_random.randint(1, 100),),
+            asn_peers))
+
+    return fixtures
+
+
+def get_bench_expressions(chain=DEF_CHAIN):
+    """
+    Pathological as-expressions over AS-CHAIN-* as-sets of the synthetic fixtures
+    """
+
+    chain_names = list(map(lambda chain_index: "AS-CHAIN-{}".format(chain_index), range(chain)))
+
+    return (" EXCEPT ".join(chain_names),
+            " AND ".join(chain_names),
+            reduce(lambda expr, asset_name: "({} AND {}) OR {}".format(expr, asset_name, asset_name),
+                   chain_names[1:], chain_names[0]),
+            reduce(lambda expr, asset_name: "({} EXCEPT {})".format(asset_name, expr),
+                   chain_names[1:], chain_names[0]),)
+
+
+def _to_json(value):
+
+    if isinstance(value, (set, frozenset,)):
+        return sorted(value)
+    elif isinstance(value, dict):
+        return dict(map(lambda item: (item[0], _to_json(item[1])), value.items()))
+
+    return value
+
+
+def _from_json(endpoint, value):
+
+    if endpoint == "whois":
+        return dict(map(lambda item: (item[0], set(item[1])), value.items()))
+    elif endpoint == "asn-neighbours":
+        return list(map(tuple, value))
+
+    return set(value)
+
+
+def save_fixtures(fixtures_name, fixtures):
+
+    with open(fixtures_name, "w") as fixtures_file:
+        json.dump(_to_json(fixtures), fixtures_file, indent=1, sort_keys=True)
+
+
+def load_fixtures(fixtures_name):
+
+    with open(fixtures_name) as fixtures_file:
+        fixtures = json.load(fixtures_file)
+
+    return dict(map(lambda endpoint: (endpoint, dict(map(lambda item: (item[0], _from_json(endpoint, item[1])),
+                                                         fixtures.get(endpoint, dict()).items()))),
+                    FIXTURE_STORES))
+
+
+def record_fixtures(cache_name):
+    """
+    Returns fixtures with RIPE responses stored in a dotlinks.py cache file
+    """
+
+    fixtures = dict(map(lambda endpoint: (endpoint, dict(),), FIXTURE_STORES))
+
+    cache_db = sqlite3.connect(cache_name)
+
+    try:
+        for endpoint, resource, value in cache_db.execute("SELECT endpoint, resource, value FROM cache"):
+            if endpoint in fixtures:
+                fixtures[endpoint][resource] = pickle.loads(value)
+    finally:
+        cache_db.close()
+
+    return fixtures
+
+
+def replay_fixtures(fixtures):
+    """
+    Puts fixtures into the ripeapi cache stores, the cache is switched to offline mode,
+    so a missed response is a RIPE error and not a request
+    """
+
+    cache.open_cache(":memory:", offline=True)
+    rpsl.clear_cache()
+    rpsl._cache_asexpr.clear()
+
+    for endpoint, responses in fixtures.items():
+        for resource, response in responses.items():
+            FIXTURE_STORES[endpoint][resource] = response
+
+
+def measure(bench_func, bench_arg, repeat=DEF_REPEAT, setup=None):
+    """
+    Returns (best time in seconds, result of the last run)
+    """
+
+    best = None
+    result = None
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        started = time.perf_counter()
+        result = bench_func(bench_arg)
+        elapsed = time.perf_counter() - started
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, result
+
+
+def measure_peak(bench_func, bench_arg, setup=None):
+    """
+    Returns peak memory in bytes allocated by one more run
+    """
+
+    if setup is not None:
+        setup()
+
+    tracemalloc.start()
+
+    try:
+        bench_func(bench_arg)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _uncover_tree(asset_name):
+
+    return len(rpsl.uncover_asset(asset_name))
+
+
+def _split_peerings(expressions):
+
+    return sum(map(lambda expression: len(rpsl.split_peering(expression)), expressions))
+
+
+def _get_whois_peerases(whois_objects):
+
+    return sum(map(lambda whois_object: sum(map(lambda peering_rule: len(rpsl.get_peerases(peering_rule) or ()),
+                                                set().union(whois_object.get("import", ()),
+                                                            whois_object.get("mp-import", ())))),
+                   whois_objects))
+
+
+def _get_whois_record_peers(whois_objects):
+
+    return sum(map(lambda whois_object: sum(map(lambda peering_rule: len(rpslpolicy.get_record_peers(peering_rule)
+                                                                         or ()),
+                                                set().union(whois_object.get("import", ()),
+                                                            whois_object.get("mp-import", ())))),
+                   whois_objects))
+
+
+def _get_dot_links(asn_links):
+
+    return sum(map(len, dotlinks.get_dot_links(asn_links, opt_all=True).values()))
+
+
+def _get_weighted_links(asn_links):
+
+    return len(dotlinks.get_weighted_links(asn_links, BENCH_THRESHOLDS, opt_all=True))
+
+
+def make_prefixes(prefixes_count=BENCH_PREFIXES, seed=DEF_SEED):
+    """
+    Returns list of overlapping IPv4 and IPv6 prefixes like announced by a big provider
+    """
+
+    random.seed(seed)
+
+    def make_prefix(_):
+        if random.random() < 0.8:
+            return "{}.{}.{}.0/{}".format(random.randrange(1, 8), random.randrange(256), random.randrange(256),
+                                          random.choice((16, 19, 22, 24,)))
+
+        return "2001:db8:{:x}::/{}".format(random.randrange(1 << 16), random.choice((32, 40, 48,)))
+
+    return list(map(make_prefix, range(prefixes_count)))
+
+
+def _get_prefix_summary(prefixes):
+
+    asninfo.get_prefix_summary(prefixes)
+
+    return len(prefixes)
+
+
+def _clear_rpsl():
+
+    rpsl.clear_cache()
+    rpsl._cache_asexpr.clear()
+
+
+def run_suite(fixtures, repeat=DEF_REPEAT):
+    """
+    Returns dict of benchmark name to {"time", "items", "rate", "peak"},
+    items are ASn or links produced by one run
+    """
+
+    replay_fixtures(fixtures)
+
+    asn_links = dict()
+    for asn in sorted(map(asn_to_int, filter(is_asn, fixtures["whois"]))):
+        asn_record = dotlinks.get_asn_links(asn)
+        if asn_record is not None:
+            asn_links[asn] = asn_record
+
+    benchmarks = (("uncover_asset", _uncover_tree, "AS-TREE",),
+                  ("split_peering", _split_peerings, get_bench_expressions(),),
+                  ("get_peerases", _get_whois_peerases, list(fixtures["whois"].values()),),
+                  ("get_record_peers", _get_whois_record_peers, list(fixtures["whois"].values()),),
+                  ("get_dot_links", _get_dot_links, asn_links,),
+                  ("get_weighted_links", _get_weighted_links, asn_links,),
+                  ("get_prefix_summary", _get_prefix_summary, make_prefixes(),),)
+
+    results = dict()
+
+    for bench_name, bench_func, bench_arg in benchmarks:
+        if bench_name == "uncover_asset" and bench_arg not in fixtures["as-set"]:
+            continue
+        elif bench_name == "split_peering" and "AS-CHAIN-0" not in fixtures["as-set"]:
+            continue
+
+        bench_time, items = measure(bench_func, bench_arg, repeat, _clear_rpsl)
+        bench_peak = measure_peak(bench_func, bench_arg, _clear_rpsl)
+
+        results[bench_name] = {"time": bench_time, "items": items, "rate": items / max(bench_time, 1e-9),
+                               "peak": bench_peak}
+
+    cache.close_cache()
+
+    return results
+
+
+def compare_baseline(results, baseline, tolerance=DEF_TOLERANCE):
+    """
+    Returns list of benchmark names slower than the baseline by more than tolerance
+    """
+
+    return list(filter(lambda bench_name: bench_name in baseline and
+                       baseline[bench_name]["time"] * (1 + tolerance) < results[bench_name]["time"], results))
+
+
+def print_results(results, baseline=None):
+
+    for bench_name, result in results.items():
+        line = "{:<18} {:>10.6f}s {:>10} items {:>14.0f}/s {:>10.1f} KiB".format(
+            bench_name, result["time"], result["items"], result["rate"], result["peak"] / 1024)
+
+        if baseline is not None and bench_name in baseline:
+            line += " x{:.2f}".format(result["time"] / max(baseline[bench_name]["time"], 1e-9))
+
+        print(line)
+
+
+def bench_asexpr(members_count=DEF_MEMBERS, repeat=DEF_REPEAT, dnf_max=DEF_DNF_MAX):
+
+    try:
+        import boolean
+    except ImportError:
+        boolean = None
+
+    make_assets(members_count)
+
+    for asset_name in BENCH_ASSETS:
+        rpsl.uncover_asset(asset_name)
+
+    for expression in BENCH_EXPRESSIONS:
+        eval_time, eval_result = measure(rpsl.split_peering, expression, repeat, rpsl._cache_asexpr.clear)
+        print("{:<72} setalg {:>10.6f}s {:>6} ASn".format(expression, eval_time, len(eval_result)))
+
+        if boolean is not None and members_count <= dnf_max:
+            dnf_time, dnf_result = measure(split_peering_dnf, expression, repeat)
+            print("{:<72} dnf    {:>10.6f}s {:>6} ASn x{:.0f}".format("", dnf_time, len(dnf_result),
+                                                                     dnf_time / max(eval_time, 1e-9)))
+
+
+def write_startup_cache(cache_name, fixtures):
+    """
+    Stores fixtures into a dotlinks.py cache file
+    """
+
+    cache.open_cache(cache_name)
+
+    try:
+        for endpoint, responses in fixtures.items():
+            for resource, response in responses.items():
+                FIXTURE_STORES[endpoint][resource] = response
+    finally:
+        cache.close_cache()
+        cache.clear_stores()
+
+
+def measure_startup(command, repeat=DEF_STARTUP_REPEAT, input_text=None):
+    """
+    Returns best wall time in seconds of the command run in a new process
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, input=input_text, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       universal_newlines=True)
+        elapsed = time.perf_counter() - started
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def bench_startup(members_count=DEF_MEMBERS, repeat=DEF_STARTUP_REPEAT, budget=DEF_STARTUP_BUDGET):
+    """
+    Prints startup times of dotlinks.py, returns list of runs over the budget
+    """
+
+    dotlinks_name = os.path.abspath(dotlinks.__file__)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_name = os.path.join(cache_dir, "startup.sqlite3")
+        write_startup_cache(cache_name, make_fixtures(members_count))
+
+        interpreter_time = measure_startup((sys.executable, "-c", "pass",), repeat)
+        print("{:<18} {:>10.6f}s".format("interpreter", interpreter_time))
+
+        runs = (("import", (sys.executable, "-c", "import dotlinks",), None,),
+                ("help", (sys.executable, dotlinks_name, "-h",), None,),
+                ("cached_asn", (sys.executable, dotlinks_name, "-a", "-c", cache_name, "-o",), STARTUP_ASN + "\n",),)
+
+        over_budget = list()
+
+        for run_name, command, input_text in runs:
+            run_time = measure_startup(command, repeat, input_text) - interpreter_time
+            print("{:<18} {:>10.6f}s".format(run_name, run_time))
+
+            if budget < run_time:
+                over_budget.append(run_name)
+
+    return over_budget
+
+
+def main():
+
+    opt_list = "m:r:d:f:b:s:t:R:c:SB:"
+    lopt_list = ("members=", "repeat=", "dnf-max=", "fixtures=", "baseline=", "save=", "tolerance=", "record=",
+                 "cache=", "startup", "budget=",)
+
+    members_count = DEF_MEMBERS
+    repeat = DEF_REPEAT
+    dnf_max = DEF_DNF_MAX
+    tolerance = DEF_TOLERANCE
+    fixtures_name = None
+    baseline_name = None
+    save_name = None
+    record_name = None
+    cache_name = None
+    opt_startup = False
+    budget = DEF_STARTUP_BUDGET
+    repeat_startup = DEF_STARTUP_REPEAT
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], opt_list, lopt_list)
+
+        for opt, arg in opts:
+            if opt in ("-m", "--members"):
+                members_count = int(arg)
+            elif opt in ("-r", "--repeat"):
+                repeat = repeat_startup = int(arg)
+            elif opt in ("-d", "--dnf-max"):
+                dnf_max = int(arg)
+            elif opt in ("-f", "--fixtures"):
+                fixtures_name = arg
+            elif opt in ("-b", "--baseline"):
+                baseline_name = arg
+            elif opt in ("-s", "--save"):
+                save_name = arg
+            elif opt in ("-t", "--tolerance"):
+                tolerance = float(arg)
+            elif opt in ("-R", "--record"):
+                record_name = arg
+            elif opt in ("-c", "--cache"):
+                cache_name = arg
+            elif opt in ("-S", "--startup"):
+                opt_startup = True
+            elif opt in ("-B", "--budget"):
+                budget = float(arg)
+
+        if members_count < 1 or repeat < 1:
+            raise getopt.GetoptError("members and repeat must be positive")
+
+        if cache_name is not None and record_name is None:
+            raise getopt.GetoptError("cache is used only to record fixtures", "cache")
+
+    except (getopt.GetoptError, ValueError):
+        print(USAGE_MSG % (DEF_MEMBERS, DEF_REPEAT, DEF_DNF_MAX, DEF_TOLERANCE, DEF_STARTUP_BUDGET, ERR_REGRESSION))
+        return ERR_GETOPT
+
+    if opt_startup:
+        try:
+            over_budget = bench_startup(members_count, repeat_startup, budget)
+        except (IOError, sqlite3.Error) as err:
+            print("Startup cache error: {}".format(err), file=sys.stderr)
+            return ERR_IO
+
+        if 0 < len(over_budget):
+            print("Over startup budget: {}".format(", ".join(over_budget)), file=sys.stderr)
+            return ERR_REGRESSION
+
+        return SUCCESS
+
+    try:
+        if record_name is not None:
+            if cache_name is not None:
+                save_fixtures(record_name, record_fixtures(cache_name))
+            else:
+                save_fixtures(record_name, make_fixtures(members_count))
+            return SUCCESS
+
+        if fixtures_name is not None:
+            fixtures = load_fixtures(fixtures_name)
+        else:
+            fixtures = make_fixtures(members_count)
+
+        baseline = None
+        if baseline_name is not None:
+            with open(baseline_name) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        results = run_suite(fixtures, repeat)
+        print_results(results, baseline)
+
+        if save_name is not None:
+            with open(save_name, "w") as save_file:
+                json.dump(results, save_file, indent=1, sort_keys=True)
+
+    except (IOError, ValueError, sqlite3.Error, pickle.UnpicklingError) as err:
+        print("Fixtures error: {}".format(err), file=sys.stderr)
+        return ERR_IO
+
+    if fixtures_name is None:
+        bench_asexpr(members_count, repeat, dnf_max)
+
+    if baseline is not None:
+        regressions = compare_baseline(results, baseline, tolerance)
+        if 0 < len(regressions):
+            print("Regression: {}".format(", ".join(regressions)), file=sys.stderr)
+            return ERR_REGRESSION
+
+    return SUCCESS
+
+
+if __name__ == '__main__':
+    exit(main())
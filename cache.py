@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Response cache stores for utils.in_cache
+
+A CacheStore is a dict-like store of one endpoint. It keeps values in memory
+and, after open_cache(), also in a shared SQLite file keyed by endpoint
+and resource, so the next run is served from disk. Every endpoint has its own TTL,
+expired values are still kept as a stale copy to serve when refetch fails.
+The file is bounded by entries and bytes with least recently used eviction,
+values in memory are bounded the same way by utils.LRUStore.
+In offline mode values are served from the file regardless of TTL
+and nothing is requested from the network.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+
+from utils import LRUStore, DEF_CACHE_ENTRIES, DEF_CACHE_BYTES
+
+DEF_MAX_ENTRIES = 500000
+DEF_MAX_BYTES = 1 << 30
+DEF_EVICT_EVERY = 1000
+DEF_ACCESS_BATCH = 1000
+
+_stores = list()
+_backend = {"cache": None, "offline": False, "detached": None}
+
+
+class SQLiteCache:
+
+    def __init__(self, path, max_entries=DEF_MAX_ENTRIES, max_bytes=DEF_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        # access times of read values, written with the next put, eviction or close,
+        # so a warm run reading from the file does not write on every read
+        self._accessed = dict()
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                         "endpoint TEXT NOT NULL, "
+                         "resource TEXT NOT NULL, "
+                         "updated REAL NOT NULL, "
+                         "accessed REAL NOT NULL, "
+                         "value BLOB NOT NULL, "
+                         "PRIMARY KEY (endpoint, resource))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, endpoint, resource):
+        """
+        Returns (value, updated) pair or None when the resource is not stored
+        """
+
+        with self._lock:
+            row = self._db.execute("SELECT value, updated FROM cache WHERE endpoint = ? AND resource = ?",
+                                   (endpoint, resource,)).fetchone()
+            if row is None:
+                return None
+
+            self._accessed[(endpoint, resource,)] = time.time()
+
+            if DEF_ACCESS_BATCH <= len(self._accessed):
+                self._db.execute("BEGIN")
+                self._write_accessed()
+                self._db.execute("COMMIT")
+
+        return pickle.loads(row[0]), row[1]
+
+    def _write_accessed(self):
+
+        self._db.executemany("UPDATE cache SET accessed = ? WHERE endpoint = ? AND resource = ?",
+                             map(lambda item: (item[1], item[0][0], item[0][1],), self._accessed.items()))
+        self._accessed.clear()
+
+    def put(self, endpoint, resource, value):
+
+        now = time.time()
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._write_accessed()
+            self._db.execute("INSERT OR REPLACE INTO cache (endpoint, resource, updated, accessed, value) "
+                             "VALUES (?, ?, ?, ?, ?)", (endpoint, resource, now, now, blob,))
+            self._db.execute("COMMIT")
+
+            self._writes += 1
+            if DEF_EVICT_EVERY <= self._writes:
+                self._evict()
+
+    def delete(self, endpoint, resource):
+
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE endpoint = ? AND resource = ?", (endpoint, resource,))
+
+    def _evict(self):
+
+        self._writes = 0
+
+        self._db.execute("BEGIN")
+        self._write_accessed()
+        self._db.execute("COMMIT")
+
+        entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()
+
+        while self.max_entries < entries or self.max_bytes < size:
+            evict_count = max(entries - self.max_entries, entries // 10, 1)
+            self._db.execute("DELETE FROM cache WHERE rowid IN "
+                             "(SELECT rowid FROM cache ORDER BY accessed LIMIT ?)", (evict_count,))
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) "
+                                             "FROM cache").fetchone()
+
+    def close(self):
+
+        with self._lock:
+            self._evict()
+            self._db.close()
+
+
+class CacheStore:
+    """
+    Dict-like store of one endpoint for utils.in_cache, ttl is in seconds, None is forever
+    """
+
+    def __init__(self, endpoint, ttl=None, max_entries=DEF_CACHE_ENTRIES, max_bytes=DEF_CACHE_BYTES):
+        self.endpoint = endpoint
+        self.ttl = ttl
+
+        self._memory = LRUStore(max_entries, max_bytes)
+        self._stale = LRUStore(max_entries, max_bytes)
+
+        _stores.append(self)
+
+    def _load(self, key):
+
+        cache = _backend["cache"]
+        if cache is None or key in self._stale:
+            return
+
+        stored = cache.get(self.endpoint, str(key))
+        if stored is None:
+            return
+
+        value, updated = stored
+        if _backend["offline"] or self.ttl is None or time.time() < updated + self.ttl:
+            self._memory[key] = value
+        else:
+            self._stale[key] = value
+
+    def __contains__(self, key):
+
+        if key not in self._memory:
+            self._load(key)
+
+        return key in self._memory
+
+    def __getitem__(self, key):
+
+        try:
+            return self._memory[key]
+        except KeyError:
+            self._load(key)
+
+        return self._memory[key]
+
+    def __setitem__(self, key, value):
+
+        self._memory[key] = value
+        self._stale.pop(key, None)
+
+        cache = _backend["cache"]
+        if cache is not None:
+            cache.put(self.endpoint, str(key), value)
+
+    def __len__(self):
+        return len(self._memory)
+
+    def expire(self, key):
+        """
+        Drops the key from memory and the file with its stale copy, the next call requests it again
+        """
+
+        self._memory.pop(key)
+        self._stale.pop(key)
+
+        cache = _backend["cache"]
+        if cache is not None:
+            cache.delete(self.endpoint, str(key))
+
+    def stale(self, key):
+        """
+        Returns expired value of the key or None
+        """
+
+        return self._stale.get(key)
+
+    def get_stats(self):
+        return self._memory.get_stats()
+
+    def clear(self):
+        self._memory.clear()
+        self._stale.clear()
+
+
+def open_cache(path, offline=False, max_entries=DEF_MAX_ENTRIES, max_bytes=DEF_MAX_BYTES):
+
+    close_cache()
+
+    try:
+        _backend["cache"] = SQLiteCache(path, max_entries=max_entries, max_bytes=max_bytes)
+    except sqlite3.Error:
+        raise IOError(0, "Cache open error", path)
+
+    _backend["offline"] = offline
+
+    clear_stores()
+
+
+def clear_stores():
+    """
+    Drops values kept in memory, they are loaded from the cache file again with respect to ttl
+    """
+
+    for store in _stores:
+        store.clear()
+
+
+def close_cache():
+
+    if _backend["cache"] is not None:
+        _backend["cache"].close()
+
+    _backend["cache"] = None
+    _backend["offline"] = False
+
+
+def detach_cache():
+    """
+    For a forked process: stops using the file inherited from the parent without closing it
+    and turns offline mode on, so only values already in memory are served
+    """
+
+    _backend["detached"] = _backend["cache"]
+    _backend["cache"] = None
+    _backend["offline"] = True
+
+
+def is_offline():
+    return _backend["offline"]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Provider catalog isps.sqlite3 storage of AS links
+
+Input ASn are read from the ases table, computed links and peer sets of every ASn
+are written into links and peers tables, see isps.sql. All rows of a run are
+written by executemany in one transaction instead of a commit per row.
+Links and peers keep the power of RIPE neighbours, so the visibility threshold
+can be tuned by queries without requesting RIPE again. Announced prefix counts and
+AS path lengths of ASn from asninfo are kept in the ases_info table
+"""
+
+import sqlite3
+
+CATALOG_SCHEMA = ("CREATE TABLE IF NOT EXISTS links ("
+                  "rlinks INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, "
+                  "asn_a INTEGER NOT NULL, "
+                  "asn_b INTEGER NOT NULL, "
+                  "type TEXT NOT NULL, "
+                  "power INTEGER, "
+                  "UNIQUE (asn_a, asn_b))",
+                  "CREATE INDEX IF NOT EXISTS links_asn_b ON links (asn_b)",
+                  "CREATE TABLE IF NOT EXISTS peers ("
+                  "rpeers INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL, "
+                  "asn INTEGER NOT NULL, "
+                  "peer INTEGER NOT NULL, "
+                  "type TEXT NOT NULL, "
+                  "power INTEGER, "
+                  "UNIQUE (asn, type, peer))",
+                  "CREATE INDEX IF NOT EXISTS peers_peer ON peers (peer)",
+                  "CREATE TABLE IF NOT EXISTS ases_info ("
+                  "asn INTEGER PRIMARY KEY NOT NULL, "
+                  "ipv4_prefixes INTEGER, "
+                  "ipv6_prefixes INTEGER, "
+                  "ipv4_addresses INTEGER, "
+                  "ipv6_48 INTEGER, "
+                  "path_length REAL, "
+                  "path_length_max INTEGER)",)
+
+# columns added to catalogs made before them
+CATALOG_COLUMNS = (("links", "power", "INTEGER",),
+                   ("peers", "power", "INTEGER",),)
+
+RECORD_POWER = "power"
+
+ASN_INFO_COLUMNS = ("ipv4_prefixes", "ipv6_prefixes", "ipv4_addresses", "ipv6_48", "path_length", "path_length_max",)
+
+
+def open_catalog(path):
+
+    try:
+        catalog = sqlite3.connect(path)
+        catalog.execute("PRAGMA journal_mode=WAL")
+        catalog.execute("PRAGMA foreign_keys=ON")
+
+        with catalog:
+            for statement in CATALOG_SCHEMA:
+                catalog.execute(statement)
+
+            for table, column, column_type in CATALOG_COLUMNS:
+                columns = list(map(lambda row: row[1], catalog.execute("PRAGMA table_info({})".format(table))))
+                if column not in columns:
+                    catalog.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, column_type))
+
+    except sqlite3.Error:
+        raise IOError(0, "Catalog open error", path)
+
+    return catalog
+
+
+def get_catalog_asns(catalog):
+    """
+    Generator of ASn from the ases table in the catalog order
+    """
+
+    for asn, in catalog.execute("SELECT asn FROM ases WHERE asn IS NOT NULL ORDER BY rases"):
+        yield asn
+
+
+def _get_peer_rows(asn_links):
+
+    for asn, asn_record in asn_links.items():
+        peer_power = asn_record.get(RECORD_POWER, dict())
+
+        for record_type, peers in asn_record.items():
+            if record_type == RECORD_POWER:
+                continue
+
+            for peer in peers:
+                yield asn, peer, record_type, peer_power.get(peer)
+
+
+def store_links(catalog, links, asn_links):
+    """
+    Replaces links with iterable of (link type, link) pairs or (link type, link, threshold, power)
+    from dotlinks.get_weighted_links and peers of ASn in asn_links with their link records
+    in one transaction
+    """
+
+    with catalog:
+        catalog.execute("DELETE FROM links")
+        catalog.executemany("INSERT INTO links (asn_a, asn_b, type, power) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (asn_a, asn_b) DO UPDATE SET type = excluded.type, power = excluded.power",
+                            map(lambda link: (link[1][0], link[1][1], link[0], link[3] if 3 < len(link) else None,),
+                                links))
+
+        catalog.executemany("DELETE FROM peers WHERE asn = ?", map(lambda asn: (asn,), asn_links))
+
+        catalog.executemany("INSERT OR IGNORE INTO peers (asn, peer, type, power) VALUES (?, ?, ?, ?)",
+                            _get_peer_rows(asn_links))
+
+
+def store_asn_info(catalog, asn_info):
+    """
+    Replaces rows of ASn in dict of ASn to asninfo node attributes in one transaction
+    """
+
+    with catalog:
+        catalog.executemany("INSERT OR REPLACE INTO ases_info (asn, {}) VALUES (?, {})".format(
+            ", ".join(ASN_INFO_COLUMNS), ", ".join("?" * len(ASN_INFO_COLUMNS))),
+            map(lambda item: (item[0],) + tuple(map(item[1].get, ASN_INFO_COLUMNS)), asn_info.items()))
@@ -6,12 +6,30 @@ Generate DOT format list of AS links from RIPE data
 import sys
 import fileinput
 import getopt
-import re
-from functools import reduce
+import json
+import time
+from functools import reduce, partial
 # import logging
 
 import rpsl
+import rpsllex
+import rpslpolicy
 import ripeapi
+import fetch
+import cache
+import ripedb
+import snapshot
+import linkwriter
+import linkstate
+import catalog
+import instrument
+import expand
+import asninfo
+from instrument import timed
+
+DEF_RETRY_ROUNDS = 3
+DEF_RETRY_DELAY = 5.0
+ERR_PARTIAL = 5
 
 USAGE_MSG = """
 Make DOT format list of AS links 
@@ -19,13 +37,50 @@ using data from RIPE stats and DB
 (c) elsv-v.ru 2018
 
 Usage:
-    dotlinks.py [-a] <file>|STDIN
+    dotlinks.py [-a] [-w <workers>] [-r <rate>] [-c <cache> [-o]] [-d <index>] [-s <snapshot>]
+                [-O <output>] [-F <format>] [-i <state>] [-D <catalog>] [-p] [-J <report>]
+                [-P <processes>] [-t <thresholds>] [-R [-x <rounds>] [-k <checkpoint>] [-u <report>]] [-e]
+                [<file>|STDIN]
 
 Options:
     -a|--all  - Generate all links even with ASn not presents in input
+    -w|--workers <workers> - Number of concurrent RIPE requests, default is %d
+    -r|--rate <rate> - Max RIPE requests per second, default is %g
+    -c|--cache <cache> - Keep RIPE responses in SQLite file <cache> between runs
+    -o|--offline - Use only responses from the cache, make no RIPE requests
+    -d|--dump <index> - Look for aut-num, as-set and peering-set objects in index
+                        of RIPE DB dumps made by ripedb.py before RIPE requests
+    -s|--snapshot <snapshot> - Take as-set closures and neighbours from snapshot
+                               made by snapshot.py before other sources
+    -O|--output <output> - Write links to <output> instead of STDOUT
+    -F|--format <format> - Links format is one of %s, default is %s
+    -i|--incremental <state> - Keep ASn records and links in SQLite file <state>,
+                               resolve again only ASn with changed aut-num objects
+    -D|--database <catalog> - Store links and peers into the provider catalog <catalog>,
+                              ASn are read from its ases table if no input file is given
+    -p|--profile - Print calls and time of stages, cache hit ratios and
+                   RIPE traffic per endpoint to STDERR at the end
+    -J|--profile-json <report> - Write the same report as JSON to <report>
+    -P|--processes <processes> - Evaluate policies in <processes> forked processes,
+                                 RIPE data is fetched by the main process first
+    -t|--thresholds <power>[,<power>...] - Classify links for every RIPE neighbour power threshold,
+                                           default is %d, links are written with threshold and power
+    -R|--resilient - Do not break on ASn failed on RIPE errors, resolve them again after the input
+                     in up to %d rounds and write links of all resolved ASn, no rounds in offline mode
+    -x|--retries <rounds> - Number of resilient mode rounds, 0 resolves failed ASn only once
+    -k|--checkpoint <checkpoint> - Keep records of resolved ASn in SQLite file <checkpoint>,
+                                   an interrupted run resumes without resolving them again
+    -u|--unresolved <report> - Write ASn, as-sets and peering-sets left unresolved as JSON to <report>
+    -e|--enrich - Write announced prefix counts, address space and AS path length of input ASn
+                  as node attributes after links and into the catalog, not for the csv format
+
+Links are written as soon as both ASn are resolved, in the incremental mode
+all links are written at the end. In the resilient mode unresolved ASn, as-sets
+and peering-sets are printed to STDERR, exit code is %d if any ASn is left
 
 Input file (or STDIN) format is an ASn in each line
-"""
+""" % (fetch.DEF_WORKERS, ripeapi.DEF_RATE, ", ".join(linkwriter.FORMATS), linkwriter.FORMAT_DOT,
+       ripeapi.DEF_POWER_MIN, DEF_RETRY_ROUNDS, ERR_PARTIAL)
 
 SUCCESS = 0
 ERR_IO = 2
@@ -33,17 +88,25 @@ ERR_GETOPT = 3
 ERR_GETASN = 4
 
 
-def get_whois_asn_list(import_records):
+def get_whois_asn_list(policy_lines):
+    """
+    Returns set of peer ASn of (policy text, Policy or False) lines from rpslpolicy.compile_autnum,
+    {ASN_ANY} or None on RIPE error
+    """
 
     def lambda_get_peerases(asn_list, record):
         if asn_list is None:
             return None
-        elif rpsl.RE_ASSET_ANY in asn_list:
-            return {rpsl.RE_ASSET_ANY}
+        elif rpsl.ASN_ANY in asn_list:
+            return {rpsl.ASN_ANY}
+
+        record_asn_list = rpslpolicy.get_line_peers(record)
+        if record_asn_list is None:
+            return None
 
-        return asn_list.union(rpsl.get_peerases(record))
+        return asn_list.union(record_asn_list)
 
-    return reduce(lambda_get_peerases, import_records, set())
+    return reduce(lambda_get_peerases, policy_lines, set())
 
 
 _rtype_uplinks = "uplinks"
@@ -53,6 +116,7 @@ _rtype_import = "import"
 _rtype_export = "export"
 _rtype_mpimport = "mp-import"
 _rtype_mpexport = "mp-export"
+_rtype_power = "power"
 
 _ltype_uplinksrir = "uplinks_rir"
 _ltype_downlinksrir = "downlins_rir"
@@ -64,78 +128,574 @@ _ltype_uplinksext = "uplinks_ext"
 _ltype_downlinksext = "downlinks_ext"
 _ltype_peersext = "peers_ext"
 
+_ltype_internal = (_ltype_uplinksrir, _ltype_downlinksrir, _ltype_peersrir,
+                   _ltype_uplinks, _ltype_downlinks, _ltype_peers,)
+_ltype_external = (_ltype_uplinksext, _ltype_downlinksext, _ltype_peersext,)
+
+
+_rtype_policy = (_rtype_import, _rtype_export, _rtype_mpimport, _rtype_mpexport,)
+_rtype_mentioned = _rtype_policy + (_rtype_downlinks, _rtype_uplinks, _rtype_peers,)
+
+
+def get_mentioned_asn(asn_record):
+
+    return set().union(*map(lambda rtype: asn_record[rtype], _rtype_mentioned))
+
+
+def get_link_type(asn_links, asn, asnpeer, is_visible=True):
+    """
+    Returns (link type, link) of the pair, without is_visible RIPE neighbours
+    of the pair are not taken into account
+    """
+
+    asn_record = asn_links[asn]
+    asnpeer_record = asn_links[asnpeer]
+
+    in_import = asnpeer in asn_record[_rtype_import]
+    in_export = asn in asnpeer_record[_rtype_export]
+    in_mpimport = asnpeer in asn_record[_rtype_mpimport]
+    in_mpexport = asn in asnpeer_record[_rtype_mpexport]
+
+    is_rir_mutual = (in_import and in_export and in_mpimport and in_mpexport) or \
+                    (in_import and in_export and not in_mpimport and not in_mpexport) or \
+                    (not in_import and not in_export and in_mpimport and in_mpexport)
+
+    is_uplink = is_visible and asn in asnpeer_record[_rtype_downlinks] and asnpeer in asn_record[_rtype_uplinks]
+    is_downlink = is_visible and asn in asnpeer_record[_rtype_uplinks] and asnpeer in asn_record[_rtype_downlinks]
+
+    if is_uplink and is_rir_mutual:
+        return _ltype_uplinksrir, (asn, asnpeer,)
+    elif is_downlink and is_rir_mutual:
+        return _ltype_downlinksrir, (asnpeer, asn,)
+    elif is_rir_mutual:
+        return _ltype_peersrir, tuple(sorted((asnpeer, asn,)))
+    elif is_uplink:
+        return _ltype_uplinks, (asn, asnpeer,)
+    elif is_downlink:
+        return _ltype_downlinks, (asnpeer, asn,)
+
+    return _ltype_peers, tuple(sorted((asnpeer, asn,)))
+
+
+def get_external_links(asn_links):
+    """
+    Generator of (link type, link) pairs for links with ASn not in asn_links,
+    known from one side only, so they are classified by RIPE neighbours of that side
+    """
+
+    for asn, asn_record in asn_links.items():
+        for asnpeer in get_mentioned_asn(asn_record):
+            if asnpeer in asn_links or asnpeer == rpsl.ASN_ANY:
+                continue
+            elif asnpeer in asn_record[_rtype_uplinks]:
+                yield _ltype_uplinksext, (asn, asnpeer,)
+            elif asnpeer in asn_record[_rtype_downlinks]:
+                yield _ltype_downlinksext, (asnpeer, asn,)
+            else:
+                yield _ltype_peersext, tuple(sorted((asnpeer, asn,)))
+
+
+def get_peer_power(neighbours_power):
+    """
+    Returns dict of neighbour ASn to its power from ripeapi.get_neighbours_power
+    """
+
+    peer_power = dict()
+
+    for peer_asn, _, power in neighbours_power:
+        peer_power[peer_asn] = max(power, peer_power.get(peer_asn, power))
+
+    return peer_power
+
+
+def _get_power(asn_record, asnpeer):
+
+    return asn_record.get(_rtype_power, dict()).get(asnpeer, 0)
+
+
+def _is_policy_mentioned(asn_record, asnpeer):
+
+    return any(map(lambda rtype: asnpeer in asn_record[rtype], _rtype_policy))
+
+
+def get_link_power(asn_links, asn, asnpeer):
+    """
+    Returns the lower of powers both sides give each other in RIPE neighbours, 0 if one side has none
+    """
+
+    return min(_get_power(asn_links[asn], asnpeer), _get_power(asn_links[asnpeer], asn))
+
+
+def get_threshold_links(asn_links, asn, asnpeer, thresholds):
+    """
+    Returns list of (link type, link, threshold, power) of the pair for sorted thresholds not below
+    the power_min the records are made with. The pair is classified at most twice: with neighbours
+    up to the link power and by policies only above it. A pair known from neighbours only is not
+    a link above the power of both sides
+    """
+
+    asn_record = asn_links[asn]
+    asnpeer_record = asn_links[asnpeer]
+
+    link_power = get_link_power(asn_links, asn, asnpeer)
+
+    if _is_policy_mentioned(asn_record, asnpeer) or _is_policy_mentioned(asnpeer_record, asn):
+        mention_power = None
+    else:
+        mention_power = max(_get_power(asn_record, asnpeer), _get_power(asnpeer_record, asn))
+
+    link_visible = None
+    link_hidden = None
+    threshold_links = list()
+
+    for threshold in thresholds:
+        if mention_power is not None and mention_power <= threshold:
+            break
+        elif threshold < link_power:
+            if link_visible is None:
+                link_visible = get_link_type(asn_links, asn, asnpeer)
+            link_type, link = link_visible
+        else:
+            if link_hidden is None:
+                link_hidden = get_link_type(asn_links, asn, asnpeer, is_visible=False)
+            link_type, link = link_hidden
+
+        threshold_links.append((link_type, link, threshold, link_power,))
+
+    return threshold_links
+
+
+def get_external_threshold_links(asn_links, thresholds):
+    """
+    get_external_links for every threshold, generator of (link type, link, threshold, power)
+    with the power the known side gives the external ASn
+    """
+
+    for asn, asn_record in asn_links.items():
+        for asnpeer in get_mentioned_asn(asn_record):
+            if asnpeer in asn_links or asnpeer == rpsl.ASN_ANY:
+                continue
+
+            power = _get_power(asn_record, asnpeer)
+            is_policy = _is_policy_mentioned(asn_record, asnpeer)
+
+            for threshold in thresholds:
+                if threshold < power and asnpeer in asn_record[_rtype_uplinks]:
+                    yield _ltype_uplinksext, (asn, asnpeer,), threshold, power
+                elif threshold < power and asnpeer in asn_record[_rtype_downlinks]:
+                    yield _ltype_downlinksext, (asnpeer, asn,), threshold, power
+                elif threshold < power or is_policy:
+                    yield _ltype_peersext, tuple(sorted((asnpeer, asn,))), threshold, power
+
+
+class LinkBuilder:
+    """
+    Incremental get_dot_links, every added ASn is linked with ASn added before it,
+    candidates are found by mentioned ASn of both sides. With thresholds links are
+    (link type, link, threshold, power) for every threshold like get_weighted_links
+    """
+
+    def __init__(self, thresholds=None):
+        self.asn_links = dict()
+        self.thresholds = thresholds
+        self._mentioned_by = dict()
+
+    @timed("dotlinks.LinkBuilder.add")
+    def add(self, asn, asn_record):
+        """
+        Returns list of (link type, link) pairs for links of asn with ASn added before
+        """
+
+        asn_mentioned = get_mentioned_asn(asn_record)
+
+        asn_peers = set(self._mentioned_by.pop(asn, ()))
+        asn_peers.update(filter(lambda asnpeer: asnpeer in self.asn_links, asn_mentioned))
+
+        self.asn_links[asn] = asn_record
+
+        for asnpeer in asn_mentioned:
+            if asnpeer not in self.asn_links:
+                self._mentioned_by.setdefault(asnpeer, list()).append(asn)
+
+        if self.thresholds is not None:
+            return [threshold_link for asnpeer in asn_peers
+                    for threshold_link in get_threshold_links(self.asn_links, asnpeer, asn, self.thresholds)]
+
+        return list(map(lambda asnpeer: get_link_type(self.asn_links, asnpeer, asn), asn_peers))
+
+    def external_links(self):
 
-def get_dot_links(asn_links):
+        if self.thresholds is not None:
+            return get_external_threshold_links(self.asn_links, self.thresholds)
 
-    asn_list = set(asn_links.keys())
-    asn_doted = set()
+        return get_external_links(self.asn_links)
+
+
+@timed("dotlinks.get_dot_links")
+def get_dot_links(asn_links, opt_all=False):
+    """
+    Candidate pairs are found via ASn mentioned by each side, not by the full cross product.
+    A pair is classified once as (earlier, later) in asn_links order.
+    With opt_all links with ASn not present in asn_links are added as external
+    """
 
     dot_links = {_ltype_uplinksrir: set(), _ltype_downlinksrir: set(), _ltype_peersrir: set(),
                  _ltype_uplinks: set(), _ltype_downlinks: set(), _ltype_peers: set(),
                  _ltype_uplinksext: set(), _ltype_downlinksext: set(), _ltype_peersext: set()}
 
-    for asn in asn_list:
-        asn_doted.add(asn)
-        peer_asn_list = asn_list.difference(asn_doted)
-
-        asn_peers = set()
-        for asnpeer in peer_asn_list:
-            is_peering = asnpeer in (asn_links[asn][_rtype_import] | asn_links[asn][_rtype_export] |
-                                     asn_links[asn][_rtype_mpimport] | asn_links[asn][_rtype_mpexport] |
-                                     asn_links[asn][_rtype_downlinks] | asn_links[asn][_rtype_uplinks] |
-                                     asn_links[asn][_rtype_peers]) or \
-                         asn in (asn_links[asnpeer][_rtype_import] | asn_links[asnpeer][_rtype_export] |
-                                 asn_links[asnpeer][_rtype_mpimport] | asn_links[asnpeer][_rtype_mpexport] |
-                                 asn_links[asnpeer][_rtype_downlinks] | asn_links[asnpeer][_rtype_uplinks] |
-                                 asn_links[asnpeer][_rtype_peers])
-            if is_peering:
-                asn_peers.add(asnpeer)
+    link_builder = LinkBuilder()
+
+    for asn, asn_record in asn_links.items():
+        for link_type, link in link_builder.add(asn, asn_record):
+            dot_links[link_type].add(link)
+
+    if opt_all:
+        for link_type, link in link_builder.external_links():
+            dot_links[link_type].add(link)
+
+    return dot_links
+
+
+@timed("dotlinks.get_weighted_links")
+def get_weighted_links(asn_links, thresholds, opt_all=False):
+    """
+    Weighted edge list of links classified for all thresholds in one pass over candidate pairs:
+    list of (link type, link, threshold, power), power is the weight of the link in RIPE neighbours.
+    Records are expected to be made with power_min not above the lowest threshold
+    """
+
+    link_builder = LinkBuilder(tuple(sorted(set(thresholds))))
+    weighted_links = list()
+
+    for asn, asn_record in asn_links.items():
+        weighted_links.extend(link_builder.add(asn, asn_record))
+
+    if opt_all:
+        weighted_links.extend(link_builder.external_links())
+
+    return weighted_links
+
+
+@timed("dotlinks.patch_dot_links")
+def patch_dot_links(dot_links, asn_links, asn_changed):
+    """
+    Removes links with changed ASn and ASn not in asn_links, then links changed ASn again.
+    Returns (removed, added) lists of (link type, link) pairs
+    """
+
+    asn_order = dict(map(lambda asn_item: (asn_item[1], asn_item[0]), enumerate(asn_links)))
+
+    links_removed = list()
+
+    for link_type, links in dot_links.items():
+        links_stale = set(filter(lambda link: link[0] in asn_changed or link[1] in asn_changed or
+                                 link[0] not in asn_order or link[1] not in asn_order, links))
+        links.difference_update(links_stale)
+        links_removed.extend(map(lambda link: (link_type, link,), links_stale))
+
+    asn_pairs = set()
+
+    for asn, asn_record in asn_links.items():
+        if asn in asn_changed:
+            asn_peers = filter(lambda asnpeer: asnpeer in asn_order, get_mentioned_asn(asn_record))
+        else:
+            asn_peers = set().union(*map(lambda rtype: asn_changed.intersection(asn_record[rtype]),
+                                         _rtype_mentioned))
+
+        for asnpeer in asn_peers:
+            if asnpeer != asn:
+                if asn_order[asn] < asn_order[asnpeer]:
+                    asn_pairs.add((asn, asnpeer,))
+                else:
+                    asn_pairs.add((asnpeer, asn,))
+
+    links_added = list(map(lambda asn_pair: get_link_type(asn_links, *asn_pair), asn_pairs))
+
+    for link_type, link in links_added:
+        dot_links[link_type].add(link)
+
+    return links_removed, links_added
+
+
+def print_dot_links(dot_links, opt_all, output=sys.stdout, link_format=linkwriter.FORMAT_DOT):
+
+    if not opt_all:
+        dot_links = dict(filter(lambda dot_link: dot_link[0] not in _ltype_external, dot_links.items()))
+
+    link_writer = linkwriter.LinkWriter(output, link_format)
+    link_writer.write_dot_links(dot_links)
+    link_writer.close()
+
+
+def read_asn_list(input_flow_name):
+    """
+    Generator of unique ASn from the input, one ASn in each line
+    """
+
+    asn_read = set()
+
+    for line in fileinput.input(input_flow_name):
+        asn = rpsllex.parse_asn(line.strip())
+
+        if asn is not None and asn not in asn_read:
+            asn_read.add(asn)
+            yield asn
+
+
+@timed("dotlinks.get_asn_links")
+def get_asn_links(asn):
+    """
+    Returns link record of the ASn from whois policy and RIPE neighbours or None on RIPE error
+    """
+
+    asn_name = rpsllex.format_asn(asn)
+
+    whois_asn = ripeapi.get_whois_top(asn_name)
+    if whois_asn is None:
+        return None
+
+    autnum_policy = rpslpolicy.get_autnum_policy(asn_name, whois_asn)
+
+    asn_record = {_rtype_import: set(), _rtype_export: set(), _rtype_mpimport: set(), _rtype_mpexport: set()}
+
+    for record_type in rpslpolicy.POLICY_ATTRIBUTES:
+        asn_list = get_whois_asn_list(autnum_policy[record_type])
+
+        if asn_list is None:
+            return None
+        elif record_type == "default":
+            asn_record[_rtype_export].update(asn_list)
+        elif record_type == "mp-default":
+            asn_record[_rtype_mpexport].update(asn_list)
+        else:
+            asn_record[record_type].update(asn_list)
+
+    neighbours_power = ripeapi.get_neighbours_power(asn_name)
+    if neighbours_power is None:
+        return None
+
+    peers = ripeapi.get_neighbours(asn_name)
+
+    asn_record[_rtype_uplinks] = peers["left"]
+    asn_record[_rtype_downlinks] = peers["right"]
+    asn_record[_rtype_peers] = peers["uncertain"]
+    asn_record[_rtype_power] = get_peer_power(neighbours_power)
+
+    return asn_record
+
+
+def get_asn_links_incremental(link_state, asn):
+    """
+    Returns (link record, last updated, whois hash, is changed) of the ASn or None on RIPE error.
+    Stored record is reused if the aut-num last updated time or its hash is the same
+    """
+
+    asn_name = rpsllex.format_asn(asn)
+    asn_stored = link_state.get_asn(asn)
+
+    last_updated = ripeapi.get_whois_last_updated(asn_name)
+    if last_updated is None:
+        return None
+
+    if asn_stored is not None and last_updated != "" and last_updated == asn_stored[0]:
+        return asn_stored[2], last_updated, asn_stored[1], False
+
+    # a cached aut-num may be older than the new last updated time, it is stored
+    # only with the object requested again, otherwise the change is never seen
+    if last_updated != "":
+        ripeapi.expire_whois(asn_name)
+
+    whois_asn = ripeapi.get_whois_top(asn_name)
+    if whois_asn is None:
+        return None
+
+    whois_hash = linkstate.get_whois_hash(whois_asn)
+
+    if asn_stored is not None and whois_hash == asn_stored[1]:
+        return asn_stored[2], last_updated, whois_hash, False
+
+    asn_record = get_asn_links(asn)
+    if asn_record is None:
+        return None
+
+    return asn_record, last_updated, whois_hash, True
+
+
+def run_incremental(state_name, asn_input, opt_all, opt_workers, output, link_format, isps_catalog=None):
+
+    link_state = linkstate.LinkState(state_name)
+
+    asn_links = dict()
+    asn_changed = set()
+    asn_rows = list()
+
+    asn_stream = fetch.fetch_stream(asn_input, partial(get_asn_links_incremental, link_state), workers=opt_workers)
+
+    try:
+        for asn, asn_resolved in asn_stream:
+            if asn_resolved is None:
+                print("Break because is fatal error when get links via RIPE API", file=sys.stderr)
+                return ERR_GETASN
+
+            asn_record, last_updated, whois_hash, is_changed = asn_resolved
+            asn_links[asn] = asn_record
+
+            if is_changed:
+                asn_changed.add(asn)
+                asn_rows.append((asn, last_updated, whois_hash, asn_record,))
             else:
+                asn_rows.append((asn, last_updated, whois_hash, None,))
+
+        dot_links = link_state.get_links(_ltype_internal)
+        links_removed, links_added = patch_dot_links(dot_links, asn_links, asn_changed)
+        link_state.update(asn_rows, links_removed, links_added)
+
+    finally:
+        # threads of the stream still use the link state and the cache on break
+        asn_stream.close()
+        link_state.close()
+
+    if opt_all:
+        for link_type, link in get_external_links(asn_links):
+            dot_links.setdefault(link_type, set()).add(link)
+
+    print_dot_links(dot_links, opt_all, output, link_format)
+
+    if isps_catalog is not None:
+        catalog.store_links(isps_catalog, ((link_type, link,) for link_type, links in dot_links.items()
+                                           for link in links), asn_links)
+
+    return SUCCESS
+
+
+def get_resilient_stream(asn_input, resolve_stream, asn_failed, link_checkpoint=None,
+                         retry_rounds=DEF_RETRY_ROUNDS, retry_delay=DEF_RETRY_DELAY):
+    """
+    Generator of (ASn, link record) of resolved ASn from resolve_stream(ASn iterable).
+    ASn failed on RIPE errors are resolved again after the input in up to retry_rounds rounds
+    with a growing delay, ASn still failed are left in asn_failed list.
+    Records of the checkpoint are taken instead of resolving, resolved ones are added to it
+    """
+
+    asn_stored = dict()
+    asn_ready = list()
+
+    if link_checkpoint is not None:
+        asn_stored = link_checkpoint.get_records()
+
+    def lambda_is_new(asn):
+        if asn in asn_stored:
+            asn_ready.append(asn)
+            return False
+        return True
+
+    def resolve(asn_list):
+        for asn, asn_record in resolve_stream(filter(lambda_is_new, asn_list)):
+            while 0 < len(asn_ready):
+                asn_next = asn_ready.pop(0)
+                yield asn_next, asn_stored[asn_next]
+
+            if asn_record is None:
+                asn_failed.append(asn)
                 continue
 
-            is_rir_mutual = (asnpeer in asn_links[asn][_rtype_import] and
-                             asn in asn_links[asnpeer][_rtype_export] and
-                             asnpeer in asn_links[asn][_rtype_mpimport] and
-                             asn in asn_links[asnpeer][_rtype_mpexport]) or \
-                            (asnpeer in asn_links[asn][_rtype_import] and
-                             asn in asn_links[asnpeer][_rtype_export] and
-                             asnpeer not in asn_links[asn][_rtype_mpimport] and
-                             asn not in asn_links[asnpeer][_rtype_mpexport]) or \
-                            (asnpeer not in asn_links[asn][_rtype_import] and
-                             asn not in asn_links[asnpeer][_rtype_export] and
-                             asnpeer in asn_links[asn][_rtype_mpimport] and
-                             asn in asn_links[asnpeer][_rtype_mpexport])
-
-            is_uplink = asn in asn_links[asnpeer][_rtype_downlinks] and asnpeer in asn_links[asn][_rtype_uplinks]
-            is_downlink = asn in asn_links[asnpeer][_rtype_uplinks] and asnpeer in asn_links[asn][_rtype_downlinks]
-            # is_peer = asn in asn_links[asnpeer][_rtype_peers] and asnpeer in asn_links[asn][_rtype_peers]
-
-            if is_uplink and is_rir_mutual:
-                dot_links[_ltype_uplinksrir].add((asn, asnpeer,))
-            elif is_downlink and is_rir_mutual:
-                dot_links[_ltype_downlinksrir].add((asnpeer, asn,))
-            elif is_rir_mutual:
-                dot_links[_ltype_peersrir].add(sorted((asnpeer, asn,)))
-            elif is_uplink:
-                dot_links[_ltype_uplinks].add((asn, asnpeer,))
-            elif is_downlink:
-                dot_links[_ltype_downlinks].add((asnpeer, asn,))
-            else:
-                dot_links[_ltype_peers].add(sorted((asnpeer, asn,)))
+            if link_checkpoint is not None:
+                link_checkpoint.add(asn, asn_record)
 
-    return dot_links
+            yield asn, asn_record
 
+        while 0 < len(asn_ready):
+            asn_next = asn_ready.pop(0)
+            yield asn_next, asn_stored[asn_next]
 
-def print_dot_links(dot_links, opt_all):
-    return
+    yield from resolve(asn_input)
 
+    for retry_round in range(retry_rounds):
+        if len(asn_failed) == 0:
+            break
 
-def main(opt_all=False):
+        time.sleep(retry_delay * (2 ** retry_round))
 
-    opt_list = "a"
-    lopt_list = ("all",)
+        asn_retry = list(asn_failed)
+        asn_failed.clear()
+
+        yield from resolve(asn_retry)
+
+
+def get_unresolved_report(asn_failed):
+    """
+    Returns dict of ASn, as-sets and peering-sets left unresolved
+    """
+
+    return dict(rpsl.get_unresolved(), asn=list(map(rpsllex.format_asn, sorted(asn_failed))))
+
+
+def print_unresolved(unresolved_report, output=sys.stderr):
+
+    for object_class in ("asn", "as-set", "peering-set",):
+        if 0 < len(unresolved_report[object_class]):
+            print("Unresolved {} ({}): {}".format(object_class, len(unresolved_report[object_class]),
+                                                  ", ".join(unresolved_report[object_class])), file=output)
+
+
+def format_io_error(err):
+    """
+    Returns message of the input, output, cache or catalog error with its file if known
+    """
+
+    message = err.strerror or str(err) or "I/O error"
+
+    if err.filename is None:
+        return "I/O error: {}".format(message)
+
+    return "I/O error in '{}': {}".format(err.filename, message)
+
+
+def write_profile(opt_profile, profile_name):
+
+    report = instrument.get_report(ripeapi.get_stats())
+
+    if opt_profile:
+        instrument.print_report(report)
+
+    if profile_name is not None:
+        try:
+            with open(profile_name, "w") as profile_file:
+                json.dump(report, profile_file, indent=1, sort_keys=True)
+        except IOError:
+            print("Profile write error in '{}'".format(profile_name), file=sys.stderr)
+
+
+def main(opt_all=False, opt_workers=fetch.DEF_WORKERS):
+
+    opt_list = "aw:r:c:od:O:F:i:D:pJ:P:s:t:Rx:k:u:e"
+    lopt_list = ("all", "workers=", "rate=", "cache=", "offline", "dump=", "output=", "format=", "incremental=",
+                 "database=", "profile", "profile-json=", "processes=", "snapshot=", "thresholds=",
+                 "resilient", "retries=", "checkpoint=", "unresolved=", "enrich",)
 
     input_flow_name = "-"
+    output_name = None
+    output = sys.stdout
+    link_format = linkwriter.FORMAT_DOT
+    cache_name = None
+    dump_name = None
+    snapshot_name = None
+    links_snapshot = None
+    state_name = None
+    catalog_name = None
+    isps_catalog = None
+    opt_offline = False
+    opt_profile = False
+    profile_name = None
+    opt_processes = None
+    thresholds = None
+    opt_resilient = False
+    retry_rounds = DEF_RETRY_ROUNDS
+    checkpoint_name = None
+    link_checkpoint = None
+    unresolved_name = None
+    opt_enrich = False
+    asn_stream = None
 
     err_id = SUCCESS
 
@@ -145,78 +705,231 @@ def main(opt_all=False):
         for opt, arg in opts:
             if opt in ("-a", "--all"):
                 opt_all = True
+            elif opt in ("-w", "--workers"):
+                opt_workers = int(arg)
+                if opt_workers < 1:
+                    raise getopt.GetoptError("workers must be positive", opt)
+            elif opt in ("-r", "--rate"):
+                opt_rate = float(arg)
+                if opt_rate <= 0:
+                    raise getopt.GetoptError("rate must be positive", opt)
+                ripeapi.configure(rate=opt_rate, burst=max(1, int(opt_rate * 2)))
+            elif opt in ("-c", "--cache"):
+                cache_name = arg
+            elif opt in ("-o", "--offline"):
+                opt_offline = True
+            elif opt in ("-d", "--dump"):
+                dump_name = arg
+            elif opt in ("-s", "--snapshot"):
+                snapshot_name = arg
+            elif opt in ("-O", "--output"):
+                output_name = arg
+            elif opt in ("-F", "--format"):
+                link_format = arg
+                if link_format not in linkwriter.FORMATS:
+                    raise getopt.GetoptError("unknown format", opt)
+            elif opt in ("-i", "--incremental"):
+                state_name = arg
+            elif opt in ("-D", "--database"):
+                catalog_name = arg
+            elif opt in ("-p", "--profile"):
+                opt_profile = True
+            elif opt in ("-J", "--profile-json"):
+                profile_name = arg
+            elif opt in ("-P", "--processes"):
+                opt_processes = int(arg)
+                if opt_processes < 1:
+                    raise getopt.GetoptError("processes must be positive", opt)
+            elif opt in ("-t", "--thresholds"):
+                thresholds = tuple(sorted(set(map(int, arg.split(",")))))
+                if thresholds[0] < 0:
+                    raise getopt.GetoptError("thresholds must not be negative", opt)
+            elif opt in ("-R", "--resilient"):
+                opt_resilient = True
+            elif opt in ("-x", "--retries"):
+                retry_rounds = int(arg)
+                if retry_rounds < 0:
+                    raise getopt.GetoptError("retries must not be negative", opt)
+            elif opt in ("-k", "--checkpoint"):
+                checkpoint_name = arg
+            elif opt in ("-u", "--unresolved"):
+                unresolved_name = arg
+            elif opt in ("-e", "--enrich"):
+                opt_enrich = True
+
+        if opt_offline and cache_name is None:
+            raise getopt.GetoptError("offline mode requires cache", "offline")
+
+        if opt_processes is not None and (state_name is not None or not expand.is_supported()):
+            raise getopt.GetoptError("processes are not supported in incremental mode or without fork", "processes")
+
+        if thresholds is not None and state_name is not None:
+            raise getopt.GetoptError("thresholds are not supported in incremental mode", "thresholds")
+
+        if opt_resilient and state_name is not None:
+            raise getopt.GetoptError("resilient mode is not supported in incremental mode", "resilient")
+
+        if not opt_resilient and (checkpoint_name is not None or unresolved_name is not None):
+            raise getopt.GetoptError("checkpoint and unresolved report require resilient mode", "resilient")
+
+        if opt_offline:
+            retry_rounds = 0
+
+        if opt_enrich and (state_name is not None or link_format == linkwriter.FORMAT_CSV):
+            raise getopt.GetoptError("enrichment is not supported in incremental mode or csv format", "enrich")
 
         if len(args) > 0:
             input_flow_name = args[-1]
 
-        asn_links = dict()
+        if thresholds is not None:
+            ripeapi.configure(power_min=thresholds[0])
 
-        for line in fileinput.input(input_flow_name):
+        if opt_profile or profile_name is not None:
+            instrument.reset()
+            ripeapi.reset_stats()
+            instrument.enable()
 
-            asn = line.strip()
-            if not re.match(rpsl.RE_ASN, asn, re.IGNORECASE):
-                continue
+        if cache_name is not None:
+            cache.open_cache(cache_name, offline=opt_offline)
 
-            whois_asn = ripeapi.get_whois_top(asn)
+        if dump_name is not None:
+            ripeapi.use_dump(ripedb.DumpIndex(dump_name))
 
-            if whois_asn is not None:
-                asn_links[asn] = dict()
+        if snapshot_name is not None:
+            links_snapshot = snapshot.Snapshot(snapshot_name)
+            rpsl.use_snapshot(links_snapshot)
+            ripeapi.use_snapshot(links_snapshot)
 
-                for record_type in ("import", "export", "default", "mp-import", "mp-export", "mp-default",):
+        if output_name is not None:
+            output = open(output_name, "w")
 
-                    if record_type in whois_asn:
-                        asn_list = get_whois_asn_list(whois_asn[record_type])
-                    else:
-                        asn_list = set()
+        if catalog_name is not None:
+            isps_catalog = catalog.open_catalog(catalog_name)
 
-                    if asn_list is None:
-                        err_id = ERR_GETASN
-                        break
-                    else:
-                        if record_type == "default":
-                            asn_links[asn][_rtype_export].update(asn_list)
-                        elif record_type == "mp-default":
-                            asn_links[asn][_rtype_mpexport].update(asn_list)
-                        else:
-                            asn_links[asn][record_type] = set()
-                            asn_links[asn][record_type].update(asn_list)
+        if isps_catalog is not None and len(args) == 0:
+            asn_input = catalog.get_catalog_asns(isps_catalog)
+        else:
+            asn_input = read_asn_list(input_flow_name)
 
-                if err_id != SUCCESS:
-                    break
+        if state_name is not None:
+            err_id = run_incremental(state_name, asn_input, opt_all, opt_workers, output, link_format, isps_catalog)
+            return err_id
 
-                peers = ripeapi.get_neighbours(asn)
-                if peers is not None:
+        link_builder = LinkBuilder(thresholds)
+        link_writer = linkwriter.LinkWriter(output, link_format, weighted=thresholds is not None,
+                                            node_attributes=asninfo.NODE_ATTRIBUTES if opt_enrich else None)
 
-                    def lambda_asn_prefix(asnum):
-                        return "AS{}".format(asnum)
+        links_all = list()
 
-                    asn_links[asn][_rtype_uplinks] = set(map(lambda_asn_prefix, peers["left"]))
-                    asn_links[asn][_rtype_downlinks] = set(map(lambda_asn_prefix, peers["right"]))
-                    asn_links[asn][_rtype_peers] = set(map(lambda_asn_prefix, peers["uncertain"]))
-                else:
-                    err_id = ERR_GETASN
-                    break
+        if opt_processes is not None:
+            resolve_stream = partial(expand.expand_stream, expand_func=get_asn_links, workers=opt_workers,
+                                     processes=opt_processes)
+        else:
+            resolve_stream = partial(fetch.fetch_stream, fetch_func=get_asn_links, workers=opt_workers)
 
-            else:
+        asn_failed = list()
+
+        if opt_resilient:
+            rpsl.reset_unresolved()
+
+            if checkpoint_name is not None:
+                link_checkpoint = linkstate.Checkpoint(checkpoint_name)
+
+            asn_stream = get_resilient_stream(asn_input, resolve_stream, asn_failed, link_checkpoint,
+                                              retry_rounds, DEF_RETRY_DELAY)
+        else:
+            asn_stream = resolve_stream(asn_input)
+
+        for asn, asn_record in asn_stream:
+            if asn_record is None:
                 err_id = ERR_GETASN
                 break
 
-        if err_id != SUCCESS:
-            print("Break because is fatal error when get links via RIPE API")
-        else:
-            dot_links = get_dot_links(asn_links)
-            print_dot_links(dot_links, opt_all)
+            asn_links = link_builder.add(asn, asn_record)
+            link_writer.write_links(asn_links)
+            link_writer.flush()
+
+            if isps_catalog is not None:
+                links_all.extend(asn_links)
+
+        if opt_all and err_id == SUCCESS:
+            asn_links = list(link_builder.external_links())
+            link_writer.write_links(asn_links)
+            links_all.extend(asn_links)
+
+        if 0 < len(asn_failed):
+            err_id = ERR_PARTIAL
+
+        asn_info = None
+
+        if opt_enrich and err_id in (SUCCESS, ERR_PARTIAL,):
+            asn_info = asninfo.get_asn_info_many(link_builder.asn_links, workers=opt_workers)
+            link_writer.write_nodes(asn_info)
 
-    except IOError:
-        print("Input read error in '{}'".format(input_flow_name))
+        if isps_catalog is not None and err_id == SUCCESS:
+            if thresholds is not None:
+                links_all = filter(lambda link: link[2] == thresholds[0], links_all)
+            catalog.store_links(isps_catalog, links_all, link_builder.asn_links)
+            if asn_info is not None:
+                catalog.store_asn_info(isps_catalog, asn_info)
+
+        link_writer.close()
+
+        if opt_resilient:
+            unresolved_report = get_unresolved_report(asn_failed)
+            print_unresolved(unresolved_report)
+
+            if unresolved_name is not None:
+                try:
+                    with open(unresolved_name, "w") as unresolved_file:
+                        json.dump(unresolved_report, unresolved_file, indent=1, sort_keys=True)
+                except IOError:
+                    print("Unresolved report write error in '{}'".format(unresolved_name), file=sys.stderr)
+
+            if link_checkpoint is not None and err_id == SUCCESS:
+                link_checkpoint.clear()
+
+        if err_id == ERR_PARTIAL:
+            print("Links are partial because of RIPE API errors", file=sys.stderr)
+            if isps_catalog is not None:
+                print("Catalog is not updated with partial links", file=sys.stderr)
+        elif err_id != SUCCESS:
+            print("Break because is fatal error when get links via RIPE API", file=sys.stderr)
+
+    except IOError as err:
+        print(format_io_error(err), file=sys.stderr)
         err_id = ERR_IO
 
-    except getopt.GetoptError:
+    except (getopt.GetoptError, ValueError):
         print(USAGE_MSG)
         err_id = ERR_GETOPT
 
     finally:
+        # the stream is stopped before the cache and the dump its threads and workers use are closed
+        if asn_stream is not None:
+            asn_stream.close()
+
         fileinput.close()
+        cache.close_cache()
+        ripeapi.use_dump(None)
+        rpsl.use_snapshot(None)
+        ripeapi.use_snapshot(None)
+
+        if links_snapshot is not None:
+            links_snapshot.close()
+
+        if output is not sys.stdout:
+            output.close()
+
+        if isps_catalog is not None:
+            isps_catalog.close()
+
+        if link_checkpoint is not None:
+            link_checkpoint.close()
+
+        if instrument.is_enabled():
+            instrument.disable()
+            write_profile(opt_profile, profile_name)
 
     return err_id
 
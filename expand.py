@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel expansion of aut-num policies in a pool of forked processes
+
+One pool is forked for the whole stream and ASn are taken by chunks. RIPE data of a chunk
+is fetched by threads of the parent first: aut-num objects, neighbours and every as-set
+and peering-set mentioned by policies, nested sets are walked but not uncovered.
+Then batches of ASn are sent to the workers with the RIPE objects they need,
+workers compile policies, uncover as-sets and peering-sets and evaluate policies,
+so RIPE requests are made only by the parent and the CPU-bound part runs on all cores.
+Closures stay in the memory of a worker for the next batches, compiled aut-num policies
+come back with the records and are kept by the parent.
+A worker is offline, an ASn it can not expand from its objects is expanded again by the parent
+"""
+
+import os
+from itertools import chain
+
+import rpsl
+import rpslpolicy
+import ripeapi
+import cache
+import fetch
+from rpsllex import TOK_ASSET, TOK_PEERINGSET, format_asn, tokenize
+
+DEF_PROCESSES = os.cpu_count() or 1
+DEF_CHUNK = 1024
+DEF_TASKS_PER_PROCESS = 4
+
+
+def is_supported():
+    import multiprocessing
+
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def prefetch_asn(asn):
+    """
+    Fetches RIPE data of the ASn and walks sets mentioned by its policies,
+    returns set of (endpoint, resource) keys of fetched objects or None on RIPE error
+    """
+
+    asn_name = format_asn(asn)
+
+    whois_asn = ripeapi.get_whois_top(asn_name)
+    if whois_asn is None or ripeapi.get_neighbours_power(asn_name) is None:
+        return None
+
+    object_keys = {("whois", asn_name,), ("asn-neighbours", asn_name,)}
+
+    for attribute in rpslpolicy.POLICY_ATTRIBUTES:
+        for policy in whois_asn.get(attribute, ()):
+            for token_type, token in tokenize(policy):
+                if token_type == TOK_ASSET:
+                    asset_names = rpsl.walk_asset(token)
+                    if asset_names is None:
+                        return None
+                elif token_type == TOK_PEERINGSET:
+                    # compiled policies keep peering-set names upper cased
+                    peeringset_walked = rpsl.walk_peeringset(token.upper())
+                    if peeringset_walked is None:
+                        return None
+
+                    object_keys.update(map(lambda peeringset_name: ("peering-set", peeringset_name,),
+                                           peeringset_walked[0]))
+                    asset_names = peeringset_walked[1]
+                else:
+                    continue
+
+                object_keys.update(map(lambda asset_name: ("as-set", asset_name,), asset_names))
+
+    return object_keys
+
+
+_worker = {"expand_func": None}
+
+
+def _init_worker(expand_func):
+
+    cache.detach_cache()
+    ripeapi.use_dump(None)
+
+    _worker["expand_func"] = expand_func
+
+
+def _expand_asn(asn):
+    """
+    Returns (expand_func(ASn), aut-num policy compiled by it or None) in a worker
+    """
+
+    return _worker["expand_func"](asn), rpslpolicy.find_autnum_policy(format_asn(asn))
+
+
+def _expand_batch(batch):
+    """
+    Returns list of _expand_asn of the ASn of the batch in a worker, RIPE objects of the batch are cached first
+    """
+
+    asn_list, objects = batch
+
+    ripeapi.put_cached_objects(objects)
+
+    return list(map(_expand_asn, asn_list))
+
+
+def _get_batches(asn_fetched, batch_size):
+    """
+    Returns list of (ASn list, RIPE objects) batches of prefetched ASn
+    """
+
+    asn_ready = list(filter(lambda item: item[1] is not None, asn_fetched))
+    batches = list()
+
+    for start in range(0, len(asn_ready), batch_size):
+        asn_batch = asn_ready[start:start + batch_size]
+        object_keys = set(chain.from_iterable(map(lambda item: item[1], asn_batch)))
+
+        batches.append((list(map(lambda item: item[0], asn_batch)), ripeapi.get_cached_objects(object_keys),))
+
+    return batches
+
+
+def expand_stream(asn_input, expand_func, workers=fetch.DEF_WORKERS, processes=DEF_PROCESSES, chunk=DEF_CHUNK):
+    """
+    Generator of (ASn, expand_func(ASn)) pairs in the input order like fetch.fetch_stream,
+    expand_func must be a module level function. ASn failed on RIPE errors get None
+    """
+
+    import multiprocessing
+
+    fork_context = multiprocessing.get_context("fork")
+    asn_chunk = list()
+
+    with fork_context.Pool(processes, initializer=_init_worker, initargs=(expand_func,)) as pool:
+
+        def expand_chunk():
+            asn_fetched = list(fetch.fetch_stream(asn_chunk, prefetch_asn, workers=workers))
+            batch_size = max(1, len(asn_fetched) // (processes * DEF_TASKS_PER_PROCESS))
+
+            asn_records = chain.from_iterable(pool.imap(_expand_batch, _get_batches(asn_fetched, batch_size)))
+
+            for asn, object_keys in asn_fetched:
+                if object_keys is None:
+                    yield asn, None
+                    continue
+
+                asn_record, autnum_policy = next(asn_records)
+                if asn_record is None:
+                    asn_record = expand_func(asn)
+                elif autnum_policy is not None:
+                    rpslpolicy.store_autnum_policy(format_asn(asn), autnum_policy)
+
+                yield asn, asn_record
+
+        for asn in asn_input:
+            asn_chunk.append(asn)
+
+            if chunk <= len(asn_chunk):
+                yield from expand_chunk()
+                asn_chunk.clear()
+
+        if 0 < len(asn_chunk):
+            yield from expand_chunk()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent fetch stage for a stream of ASn
+
+Items are resolved by a bounded thread pool and returned in the input order,
+at most a window of items is in flight, so a long input is never held in memory.
+Nested as-set and peering-set objects are stored by ripeapi in its cache,
+so workers resolving ASn with the same sets share fetched objects.
+"""
+
+from collections import deque
+
+DEF_WORKERS = 8
+DEF_WINDOW_FACTOR = 4
+
+
+def fetch_stream(items, fetch_func, workers=DEF_WORKERS, window=None):
+    """
+    Generator of (item, fetch_func(item)) pairs in the order of items
+    """
+
+    # concurrent.futures brings logging with it, --help does not need either
+    from concurrent.futures import ThreadPoolExecutor
+
+    if window is None:
+        window = workers * DEF_WINDOW_FACTOR
+
+    in_flight = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for item in items:
+                in_flight.append((item, pool.submit(fetch_func, item),))
+
+                if window <= len(in_flight):
+                    item_done, item_future = in_flight.popleft()
+                    yield item_done, item_future.result()
+
+            while 0 < len(in_flight):
+                item_done, item_future = in_flight.popleft()
+                yield item_done, item_future.result()
+
+        finally:
+            for _, item_future in in_flight:
+                item_future.cancel()
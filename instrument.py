@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of hot paths
+
+Stages are functions wrapped by timed(), their calls and cumulative wall time
+are counted, time of a stage includes nested stages and is summed over worker threads.
+utils.in_cache counts hits and misses of every store.
+Everything is off until enable(), a disabled stage costs one dict lookup per call.
+Hooks added by add_hook() are called with (stage, elapsed seconds) after every timed call
+"""
+
+import sys
+import threading
+import time
+from functools import wraps
+
+_state = {"enabled": False}
+_lock = threading.Lock()
+
+_hooks = list()
+_stages = dict()
+_caches = dict()
+
+
+def enable():
+    _state["enabled"] = True
+
+
+def disable():
+    _state["enabled"] = False
+
+
+def is_enabled():
+    return _state["enabled"]
+
+
+def add_hook(hook):
+    """
+    Hook is called with (stage, elapsed seconds) while instrumentation is enabled
+    """
+
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def reset():
+
+    with _lock:
+        _stages.clear()
+        _caches.clear()
+
+
+def _record(stage, elapsed):
+
+    with _lock:
+        if stage not in _stages:
+            _stages[stage] = [0, 0.0]
+
+        stage_stats = _stages[stage]
+        stage_stats[0] += 1
+        stage_stats[1] += elapsed
+
+    for hook in _hooks:
+        hook(stage, elapsed)
+
+
+def timed(stage):
+
+    def get_decorator(timed_func):
+
+        @wraps(timed_func)
+        def calling_func(*args, **kwargs):
+            if not _state["enabled"]:
+                return timed_func(*args, **kwargs)
+
+            started = time.perf_counter()
+            try:
+                return timed_func(*args, **kwargs)
+            finally:
+                _record(stage, time.perf_counter() - started)
+
+        return calling_func
+
+    return get_decorator
+
+
+def count_cache(store_name, hit):
+
+    with _lock:
+        if store_name not in _caches:
+            _caches[store_name] = [0, 0]
+
+        _caches[store_name][0 if hit else 1] += 1
+
+
+def get_report(endpoints=None):
+    """
+    Returns dict with stages, cache stores and endpoints, endpoints are ripeapi.get_stats()
+    """
+
+    with _lock:
+        stages = dict(map(lambda stage: (stage[0], {"calls": stage[1][0], "time": stage[1][1]}), _stages.items()))
+        caches = dict(map(lambda store: (store[0], {"hits": store[1][0], "misses": store[1][1],
+                                                    "hit_ratio": store[1][0] / max(1, sum(store[1]))}),
+                          _caches.items()))
+
+    return {"stages": stages, "caches": caches, "endpoints": endpoints or dict()}
+
+
+def print_report(report, output=sys.stderr):
+
+    print("{:<32} {:>10} {:>12}".format("Stage", "Calls", "Time, s"), file=output)
+    for stage, stage_stats in sorted(report["stages"].items(), key=lambda stage: -stage[1]["time"]):
+        print("{:<32} {:>10} {:>12.3f}".format(stage, stage_stats["calls"], stage_stats["time"]), file=output)
+
+    print("\n{:<32} {:>10} {:>10} {:>8}".format("Cache", "Hits", "Misses", "Ratio"), file=output)
+    for store_name, store_stats in sorted(report["caches"].items()):
+        print("{:<32} {:>10} {:>10} {:>8.1%}".format(store_name, store_stats["hits"], store_stats["misses"],
+                                                     store_stats["hit_ratio"]), file=output)
+
+    print("\n{:<32} {:>10} {:>8} {:>12} {:>12}".format("Endpoint", "Requests", "Errors", "Latency, s", "Bytes"),
+          file=output)
+    for endpoint, endpoint_stats in sorted(report["endpoints"].items()):
+        print("{:<32} {:>10} {:>8} {:>12.3f} {:>12}".format(endpoint, endpoint_stats["requests"],
+                                                           endpoint_stats["errors"], endpoint_stats["latency"],
+                                                           endpoint_stats.get("bytes", 0)), file=output)
@@ -34,6 +34,58 @@ CREATE TABLE ases (
 );
 
 
+-- Table: links
+DROP TABLE IF EXISTS links;
+
+CREATE TABLE links (
+    rlinks INTEGER PRIMARY KEY AUTOINCREMENT
+                   UNIQUE
+                   NOT NULL,
+    asn_a  INTEGER NOT NULL,
+    asn_b  INTEGER NOT NULL,
+    type   TEXT    NOT NULL,
+    power  INTEGER,
+    UNIQUE (
+        asn_a,
+        asn_b
+    )
+);
+
+
+-- Table: peers
+DROP TABLE IF EXISTS peers;
+
+CREATE TABLE peers (
+    rpeers INTEGER PRIMARY KEY AUTOINCREMENT
+                   UNIQUE
+                   NOT NULL,
+    asn    INTEGER NOT NULL,
+    peer   INTEGER NOT NULL,
+    type   TEXT    NOT NULL,
+    power  INTEGER,
+    UNIQUE (
+        asn,
+        type,
+        peer
+    )
+);
+
+
+-- Table: ases_info
+DROP TABLE IF EXISTS ases_info;
+
+CREATE TABLE ases_info (
+    asn             INTEGER PRIMARY KEY
+                            NOT NULL,
+    ipv4_prefixes   INTEGER,
+    ipv6_prefixes   INTEGER,
+    ipv4_addresses  INTEGER,
+    ipv6_48         INTEGER,
+    path_length     REAL,
+    path_length_max INTEGER
+);
+
+
 -- Table: dir
 DROP TABLE IF EXISTS dir;
 
@@ -46,5 +98,21 @@ CREATE TABLE dir (
 );
 
 
+-- Index: links_asn_b
+DROP INDEX IF EXISTS links_asn_b;
+
+CREATE INDEX links_asn_b ON links (
+    asn_b
+);
+
+
+-- Index: peers_peer
+DROP INDEX IF EXISTS peers_peer;
+
+CREATE INDEX peers_peer ON peers (
+    peer
+);
+
+
 COMMIT TRANSACTION;
 PRAGMA foreign_keys = on;
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP/JSON service of AS links
+
+ASn of the input are resolved like in dotlinks.py, link records and classified links
+are kept in memory, so queries are answered without RIPE requests.
+The graph is resolved again in the background every refresh interval and replaced
+as a whole, queries are served from the previous graph meanwhile.
+Clients are served by an asyncio event loop, RIPE requests are made by worker threads
+
+Queries:
+    GET /status - number of ASn and links, time of the last refresh, ASn failed on RIPE errors
+    GET /asn/<ASn> - links and link record of the ASn
+    GET /link/<ASn>/<ASn> - link type of the pair
+    GET /filters/<ASn>/<peer ASn> - filters and actions of the ASn policies for the peer
+"""
+
+import sys
+import fileinput
+import getopt
+import asyncio
+import json
+import time
+from urllib.parse import unquote
+
+import rpsl
+import rpsllex
+import rpslpolicy
+import ripeapi
+import fetch
+import cache
+import ripedb
+import snapshot
+import dotlinks
+
+USAGE_MSG = """
+Local HTTP/JSON service of AS links
+using data from RIPE stats and DB
+(c) elsv-v.ru 2018
+
+Usage:
+    linkserver.py [-a] [-w <workers>] [-r <rate>] [-c <cache> [-o]] [-d <index>] [-s <snapshot>]
+                  [-H <host>] [-p <port>] [-I <interval>] <file>
+
+Options:
+    -a|--all  - Keep all links even with ASn not presents in input
+    -w|--workers <workers> - Number of concurrent RIPE requests, default is %d
+    -r|--rate <rate> - Max RIPE requests per second, default is %g
+    -c|--cache <cache> - Keep RIPE responses in SQLite file <cache> between runs
+    -o|--offline - Use only responses from the cache, make no RIPE requests
+    -d|--dump <index> - Look for aut-num, as-set and peering-set objects in index
+                        of RIPE DB dumps made by ripedb.py before RIPE requests
+    -s|--snapshot <snapshot> - Take as-set closures and neighbours from snapshot
+                               made by snapshot.py before other sources
+    -H|--host <host> - Listen address, default is %s
+    -p|--port <port> - Listen port, default is %d
+    -I|--interval <interval> - Resolve the graph again every <interval> seconds, default is %d
+
+Queries:
+    GET /status
+    GET /asn/<ASn>
+    GET /link/<ASn>/<ASn>
+    GET /filters/<ASn>/<peer ASn>
+
+Input file format is an ASn in each line, it is read again on every refresh
+"""
+
+SUCCESS = 0
+ERR_IO = 2
+ERR_GETOPT = 3
+ERR_GETASN = 4
+
+DEF_HOST = "127.0.0.1"
+DEF_PORT = 8179
+DEF_INTERVAL = 86400
+DEF_REQUEST_MAX = 1 << 16
+
+_http_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                 503: "Service Unavailable"}
+
+
+class LinkGraph:
+    """
+    Link records of ASn and classified links with an index by ASn and by pair,
+    peerings of compiled aut-num policies of ASn are kept for filter queries
+    """
+
+    def __init__(self, asn_links, links, unresolved=(), autnum_peerings=None):
+        self.asn_links = asn_links
+        self.autnum_peerings = autnum_peerings or dict()
+        self.unresolved = tuple(unresolved)
+        self.resolved = time.time()
+
+        self._pairs = dict()
+        self._asn_index = dict()
+
+        for link_type, link in links:
+            self._pairs[link] = link_type
+
+            for asn in set(link):
+                self._asn_index.setdefault(asn, list()).append((link_type, link,))
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def get_link(self, asn_a, asn_b):
+        """
+        Returns (link type, link) of the pair in any order or None
+        """
+
+        for link in ((asn_a, asn_b,), (asn_b, asn_a,),):
+            if link in self._pairs:
+                return self._pairs[link], link
+
+        return None
+
+    def get_filters(self, asn, asnpeer):
+        """
+        Returns rpslpolicy.select_peer_filters of the ASn for the peer, None if its peerings
+        were not resolved on RIPE error. Peerings are resolved by build_graph, so no RIPE request is made
+        """
+
+        if self.autnum_peerings[asn] is None:
+            return None
+
+        return rpslpolicy.select_peer_filters(self.autnum_peerings[asn], asnpeer)
+
+    def get_asn(self, asn):
+        """
+        Returns (link record, list of (link type, link)) of the ASn or None
+        """
+
+        if asn not in self.asn_links and asn not in self._asn_index:
+            return None
+
+        return self.asn_links.get(asn), self._asn_index.get(asn, list())
+
+
+def build_graph(asn_input, opt_all=False, opt_workers=fetch.DEF_WORKERS):
+    """
+    Resolves ASn like dotlinks.py does, aut-num objects and neighbours of the whole input
+    are requested as one batch first. ASn failed on RIPE errors are skipped and listed
+    in unresolved of the graph. Returns LinkGraph or None when no ASn is resolved
+    """
+
+    asn_list = list(asn_input)
+    asn_names = list(map(rpsllex.format_asn, asn_list))
+
+    whois_fetched = ripeapi.get_whois_many(asn_names, workers=opt_workers)
+    neighbours_fetched = ripeapi.get_neighbours_many(asn_names, workers=opt_workers)
+
+    unresolved = list(filter(lambda asn: whois_fetched[rpsllex.format_asn(asn)] is None or
+                             neighbours_fetched[rpsllex.format_asn(asn)] is None, asn_list))
+
+    asn_failed = set(unresolved)
+
+    link_builder = dotlinks.LinkBuilder()
+    links = list()
+
+    for asn, asn_record in fetch.fetch_stream(filter(lambda asn: asn not in asn_failed, asn_list),
+                                              dotlinks.get_asn_links, workers=opt_workers):
+        if asn_record is None:
+            unresolved.append(asn)
+            continue
+
+        links.extend(link_builder.add(asn, asn_record))
+
+    if 0 < len(asn_list) and len(unresolved) == len(asn_list):
+        return None
+
+    if opt_all:
+        links.extend(link_builder.external_links())
+
+    # queries are answered on the event loop, so peerings are resolved here, in the refresh thread
+    autnum_peerings = dict()
+
+    for asn in link_builder.asn_links:
+        asn_name = rpsllex.format_asn(asn)
+        whois_asn = ripeapi.get_whois_top(asn_name)
+
+        if whois_asn is not None:
+            autnum_peerings[asn] = rpslpolicy.get_autnum_peerings(rpslpolicy.get_autnum_policy(asn_name, whois_asn))
+
+    return LinkGraph(link_builder.asn_links, links, unresolved, autnum_peerings)
+
+
+def _format_link(link_type, link):
+
+    return {"type": link_type, "source": rpsllex.format_asn(link[0]), "target": rpsllex.format_asn(link[1])}
+
+
+def _format_peers(peers):
+
+    if isinstance(peers, dict):
+        return dict(map(lambda peer: (rpsllex.format_asn(peer[0]), peer[1],), sorted(peers.items())))
+
+    return sorted(map(rpsllex.format_asn, peers))
+
+
+def _format_record(asn_record):
+
+    return dict(map(lambda record: (record[0], _format_peers(record[1])), asn_record.items()))
+
+
+def _format_filter(autnum_filter):
+
+    return dict(zip(("attribute", "policy", "keyword", "filter", "action",), autnum_filter))
+
+
+class LinkServer:
+
+    def __init__(self, input_flow_name, opt_all=False, opt_workers=fetch.DEF_WORKERS, interval=DEF_INTERVAL):
+        self.input_flow_name = input_flow_name
+        self.opt_all = opt_all
+        self.opt_workers = opt_workers
+        self.interval = interval
+
+        self.graph = None
+        self.refresh_errors = 0
+
+    def _build(self):
+
+        cache.clear_stores()
+        rpsl.clear_cache()
+
+        try:
+            return build_graph(dotlinks.read_asn_list(self.input_flow_name), self.opt_all, self.opt_workers)
+        finally:
+            fileinput.close()
+
+    async def refresh(self):
+        """
+        Resolves the graph in a worker thread and replaces the served one, returns False on RIPE error
+        """
+
+        graph = await asyncio.get_running_loop().run_in_executor(None, self._build)
+
+        if graph is None:
+            self.refresh_errors += 1
+            return False
+
+        self.graph = graph
+
+        return True
+
+    async def refresh_forever(self):
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                if not await self.refresh():
+                    print("Refresh failed, previous graph is served", file=sys.stderr)
+            except IOError as err:
+                self.refresh_errors += 1
+                print("Refresh failed: {}".format(err), file=sys.stderr)
+
+    def query(self, path):
+        """
+        Returns (HTTP status, JSON object) of the query path
+        """
+
+        graph = self.graph
+        parts = list(filter(None, unquote(path.split("?", 1)[0]).split("/")))
+
+        if parts == ["status"]:
+            return 200, {"asns": 0 if graph is None else len(graph.asn_links),
+                         "links": 0 if graph is None else len(graph),
+                         "resolved": None if graph is None else graph.resolved,
+                         "unresolved": [] if graph is None else list(map(rpsllex.format_asn, graph.unresolved)),
+                         "refresh_errors": self.refresh_errors}
+
+        if graph is None:
+            return 503, {"error": "graph is not resolved yet"}
+
+        asn_list = list(map(lambda part: rpsllex.parse_asn(part.upper()) if rpsllex.is_asn(part) else None,
+                            parts[1:]))
+
+        if len(parts) == 0 or None in asn_list:
+            return 400, {"error": "bad query"}
+
+        if parts[0] == "asn" and len(asn_list) == 1:
+            asn_found = graph.get_asn(asn_list[0])
+            if asn_found is None:
+                return 404, {"error": "ASn not found"}
+
+            asn_record, asn_links = asn_found
+
+            return 200, {"asn": rpsllex.format_asn(asn_list[0]),
+                         "record": None if asn_record is None else _format_record(asn_record),
+                         "links": list(map(lambda link: _format_link(*link), sorted(asn_links)))}
+
+        elif parts[0] == "link" and len(asn_list) == 2:
+            link_found = graph.get_link(*asn_list)
+            if link_found is None:
+                return 404, {"error": "link not found"}
+
+            return 200, _format_link(*link_found)
+
+        elif parts[0] == "filters" and len(asn_list) == 2:
+            if asn_list[0] not in graph.autnum_peerings:
+                return 404, {"error": "ASn not found"}
+
+            autnum_filters = graph.get_filters(*asn_list)
+            if autnum_filters is None:
+                return 503, {"error": "RIPE error"}
+
+            return 200, {"asn": rpsllex.format_asn(asn_list[0]), "peer": rpsllex.format_asn(asn_list[1]),
+                         "filters": list(map(_format_filter, autnum_filters))}
+
+        return 400, {"error": "bad query"}
+
+    async def handle(self, reader, writer):
+        """
+        Serves HTTP/1.1 requests of one connection, keep-alive is supported
+        """
+
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                request = lines[0].split()
+                headers = dict(map(lambda line: (line.partition(":")[0].strip().lower(),
+                                                 line.partition(":")[2].strip()), filter(None, lines[1:])))
+
+                if len(request) != 3:
+                    status, reply = 400, {"error": "bad request"}
+                elif request[0] != "GET":
+                    status, reply = 405, {"error": "only GET is supported"}
+                else:
+                    status, reply = self.query(request[1])
+
+                keep_alive = len(request) == 3 and request[2] == "HTTP/1.1" and \
+                    headers.get("connection", "").lower() != "close"
+
+                body = json.dumps(reply).encode("utf-8")
+                writer.write("HTTP/1.1 {} {}\r\n"
+                             "Content-Type: application/json\r\n"
+                             "Content-Length: {}\r\n"
+                             "Connection: {}\r\n\r\n".format(status, _http_reasons.get(status, ""), len(body),
+                                                             "keep-alive" if keep_alive else "close")
+                             .encode("latin-1") + body)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEF_HOST, port=DEF_PORT):
+        """
+        Resolves the graph, then serves queries and refreshes the graph until cancelled
+        """
+
+        if not await self.refresh():
+            return ERR_GETASN
+
+        server = await asyncio.start_server(self.handle, host, port, limit=DEF_REQUEST_MAX)
+        refresher = asyncio.ensure_future(self.refresh_forever())
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+
+        return SUCCESS
+
+
+def main():
+
+    opt_list = "aw:r:c:od:H:p:I:s:"
+    lopt_list = ("all", "workers=", "rate=", "cache=", "offline", "dump=", "host=", "port=", "interval=",
+                 "snapshot=",)
+
+    opt_all = False
+    opt_workers = fetch.DEF_WORKERS
+    cache_name = None
+    dump_name = None
+    snapshot_name = None
+    links_snapshot = None
+    opt_offline = False
+    host = DEF_HOST
+    port = DEF_PORT
+    interval = DEF_INTERVAL
+
+    err_id = SUCCESS
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], opt_list, lopt_list)
+
+        for opt, arg in opts:
+            if opt in ("-a", "--all"):
+                opt_all = True
+            elif opt in ("-w", "--workers"):
+                opt_workers = int(arg)
+                if opt_workers < 1:
+                    raise getopt.GetoptError("workers must be positive", opt)
+            elif opt in ("-r", "--rate"):
+                opt_rate = float(arg)
+                if opt_rate <= 0:
+                    raise getopt.GetoptError("rate must be positive", opt)
+                ripeapi.configure(rate=opt_rate, burst=max(1, int(opt_rate * 2)))
+            elif opt in ("-c", "--cache"):
+                cache_name = arg
+            elif opt in ("-o", "--offline"):
+                opt_offline = True
+            elif opt in ("-d", "--dump"):
+                dump_name = arg
+            elif opt in ("-s", "--snapshot"):
+                snapshot_name = arg
+            elif opt in ("-H", "--host"):
+                host = arg
+            elif opt in ("-p", "--port"):
+                port = int(arg)
+            elif opt in ("-I", "--interval"):
+                interval = float(arg)
+                if interval <= 0:
+                    raise getopt.GetoptError("interval must be positive", opt)
+
+        if opt_offline and cache_name is None:
+            raise getopt.GetoptError("offline mode requires cache", "offline")
+
+        if len(args) != 1:
+            raise getopt.GetoptError("input file is required")
+
+        if cache_name is not None:
+            cache.open_cache(cache_name, offline=opt_offline)
+
+        if dump_name is not None:
+            ripeapi.use_dump(ripedb.DumpIndex(dump_name))
+
+        if snapshot_name is not None:
+            links_snapshot = snapshot.Snapshot(snapshot_name)
+            rpsl.use_snapshot(links_snapshot)
+            ripeapi.use_snapshot(links_snapshot)
+
+        link_server = LinkServer(args[0], opt_all, opt_workers, interval)
+        err_id = asyncio.run(link_server.serve(host, port))
+
+        if err_id != SUCCESS:
+            print("Break because is fatal error when get links via RIPE API", file=sys.stderr)
+
+    except IOError as err:
+        print("I/O error: {}".format(err), file=sys.stderr)
+        err_id = ERR_IO
+
+    except (getopt.GetoptError, ValueError):
+        print(USAGE_MSG % (fetch.DEF_WORKERS, ripeapi.DEF_RATE, DEF_HOST, DEF_PORT, DEF_INTERVAL))
+        err_id = ERR_GETOPT
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        cache.close_cache()
+        ripeapi.use_dump(None)
+        rpsl.use_snapshot(None)
+        ripeapi.use_snapshot(None)
+
+        if links_snapshot is not None:
+            links_snapshot.close()
+
+    return err_id
+
+
+if __name__ == '__main__':
+    exit(main())
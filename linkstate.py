@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+State of dotlinks runs for the incremental mode
+
+For every ASn the last updated time and a hash of its aut-num object are kept
+together with the link record built from it. Links between input ASn are kept too,
+so a run with few changed aut-num objects patches them instead of building all again.
+Checkpoint keeps records of ASn resolved by a resilient run, so an interrupted run resumes
+without resolving them again
+"""
+
+import json
+import pickle
+import sqlite3
+import threading
+import time
+
+DEF_MAX_AGE = 604800
+DEF_CHECKPOINT_BATCH = 64
+
+
+def get_whois_hash(whois_object):
+
+    # hashlib loads OpenSSL, only incremental runs need it
+    import hashlib
+
+    whois_items = sorted(map(lambda whois_item: (whois_item[0], sorted(whois_item[1]),), whois_object.items()))
+
+    return hashlib.sha1(json.dumps(whois_items).encode("utf-8")).hexdigest()
+
+
+class LinkState:
+
+    def __init__(self, path, max_age=DEF_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS asns ("
+                         "asn INTEGER PRIMARY KEY, "
+                         "last_updated TEXT, "
+                         "whois_hash TEXT, "
+                         "resolved REAL NOT NULL, "
+                         "record BLOB NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS links ("
+                         "link_type TEXT NOT NULL, "
+                         "asn_a INTEGER NOT NULL, "
+                         "asn_b INTEGER NOT NULL, "
+                         "PRIMARY KEY (asn_a, asn_b, link_type))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS links_asn_b ON links (asn_b)")
+        self._db.commit()
+
+    def get_asn(self, asn):
+        """
+        Returns (last updated, whois hash, link record) of the ASn resolved not before max_age or None
+        """
+
+        with self._lock:
+            row = self._db.execute("SELECT last_updated, whois_hash, resolved, record FROM asns WHERE asn = ?",
+                                   (asn,)).fetchone()
+
+        if row is None or row[2] + self.max_age < time.time():
+            return None
+
+        return row[0], row[1], pickle.loads(row[3])
+
+    def get_links(self, link_types):
+        """
+        Returns dict of link type to set of links, every type from link_types is present
+        """
+
+        dot_links = dict(map(lambda link_type: (link_type, set(),), link_types))
+
+        with self._lock:
+            for link_type, asn_a, asn_b in self._db.execute("SELECT link_type, asn_a, asn_b FROM links"):
+                dot_links.setdefault(link_type, set()).add((asn_a, asn_b,))
+
+        return dot_links
+
+    def update(self, asn_rows, links_removed, links_added):
+        """
+        Stores (asn, last updated, whois hash, record or None to keep it) rows and patches links in one transaction
+        """
+
+        now = time.time()
+
+        with self._lock, self._db:
+            for asn, last_updated, whois_hash, asn_record in asn_rows:
+                if asn_record is None:
+                    self._db.execute("UPDATE asns SET last_updated = ?, whois_hash = ? WHERE asn = ?",
+                                     (last_updated, whois_hash, asn,))
+                else:
+                    self._db.execute("INSERT OR REPLACE INTO asns (asn, last_updated, whois_hash, resolved, record) "
+                                     "VALUES (?, ?, ?, ?, ?)",
+                                     (asn, last_updated, whois_hash, now,
+                                      pickle.dumps(asn_record, pickle.HIGHEST_PROTOCOL),))
+
+            self._db.executemany("DELETE FROM links WHERE link_type = ? AND asn_a = ? AND asn_b = ?",
+                                 map(lambda link: (link[0], link[1][0], link[1][1],), links_removed))
+            self._db.executemany("INSERT OR REPLACE INTO links (link_type, asn_a, asn_b) VALUES (?, ?, ?)",
+                                 map(lambda link: (link[0], link[1][0], link[1][1],), links_added))
+
+    def close(self):
+
+        with self._lock:
+            self._db.close()
+
+
+class Checkpoint:
+
+    def __init__(self, path, batch=DEF_CHECKPOINT_BATCH, max_age=DEF_MAX_AGE):
+        self.path = path
+        self.batch = batch
+        self.max_age = max_age
+        self._pending = list()
+
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS checkpoint ("
+                         "asn INTEGER PRIMARY KEY, "
+                         "resolved REAL NOT NULL, "
+                         "record BLOB NOT NULL)")
+        self._db.commit()
+
+    def get_records(self):
+        """
+        Returns dict of ASn to link record resolved not before max_age
+        """
+
+        rows = self._db.execute("SELECT asn, record FROM checkpoint WHERE resolved >= ?",
+                                (time.time() - self.max_age,))
+
+        return dict(map(lambda row: (row[0], pickle.loads(row[1]),), rows))
+
+    def add(self, asn, asn_record):
+        """
+        Records are committed in batches, not one transaction per ASn
+        """
+
+        self._pending.append((asn, time.time(), pickle.dumps(asn_record, pickle.HIGHEST_PROTOCOL),))
+
+        if self.batch <= len(self._pending):
+            self.flush()
+
+    def flush(self):
+
+        if len(self._pending) == 0:
+            return
+
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO checkpoint (asn, resolved, record) VALUES (?, ?, ?)",
+                                 self._pending)
+
+        self._pending.clear()
+
+    def clear(self):
+        """
+        Drops all records, a completed run does not need them
+        """
+
+        self._pending.clear()
+
+        with self._db:
+            self._db.execute("DELETE FROM checkpoint")
+
+    def close(self):
+
+        self.flush()
+        self._db.close()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Writers of AS link lists
+
+Formats are DOT with a style for each link type, JSON Lines, CSV edge list and GraphML.
+A link is a (link type, (ASn, ASn)) pair from dotlinks, ASn are ints. A weighted link
+from dotlinks.get_weighted_links has threshold and power after them. Nodes with attributes,
+like asninfo prefix counts and path lengths, are written after links, CSV edge list has no nodes.
+Lines are collected in a buffer and written in big chunks, not one write per link
+"""
+
+import json
+
+from rpsllex import format_asn
+
+FORMAT_DOT = "dot"
+FORMAT_JSONL = "jsonl"
+FORMAT_CSV = "csv"
+FORMAT_GRAPHML = "graphml"
+
+FORMATS = (FORMAT_DOT, FORMAT_JSONL, FORMAT_CSV, FORMAT_GRAPHML,)
+
+DEF_BUFFER_SIZE = 1 << 16
+
+DOT_STYLES = {"uplinks_rir": "color=\"black\", style=\"bold\"",
+              "downlins_rir": "color=\"black\", style=\"bold\"",
+              "peers_rir": "color=\"darkgreen\", style=\"bold\", dir=\"none\"",
+              "uplinks": "color=\"black\"",
+              "downlinks": "color=\"black\"",
+              "peers": "color=\"darkgreen\", dir=\"none\"",
+              "uplinks_ext": "color=\"gray\", style=\"dashed\"",
+              "downlinks_ext": "color=\"gray\", style=\"dashed\"",
+              "peers_ext": "color=\"gray\", style=\"dashed\", dir=\"none\""}
+
+_graphml_header = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n" \
+                  "<graphml xmlns=\"http://graphml.graphdrawing.org/xmlns\">\n" \
+                  "  <key id=\"type\" for=\"edge\" attr.name=\"type\" attr.type=\"string\"/>\n" \
+                  "  <graph id=\"links\" edgedefault=\"directed\">\n"
+_graphml_weighted_header = "<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n" \
+                           "<graphml xmlns=\"http://graphml.graphdrawing.org/xmlns\">\n" \
+                           "  <key id=\"type\" for=\"edge\" attr.name=\"type\" attr.type=\"string\"/>\n" \
+                           "  <key id=\"threshold\" for=\"edge\" attr.name=\"threshold\" attr.type=\"int\"/>\n" \
+                           "  <key id=\"power\" for=\"edge\" attr.name=\"power\" attr.type=\"int\"/>\n" \
+                           "  <graph id=\"links\" edgedefault=\"directed\">\n"
+_graphml_footer = "  </graph>\n</graphml>\n"
+
+
+def _escape(text):
+
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _format_value(value):
+
+    return json.dumps(value) if isinstance(value, str) else str(value)
+
+
+def _format_dot(link_type, link, nodes, weight=()):
+
+    style = DOT_STYLES.get(link_type, "")
+    if 0 < len(weight):
+        style += ", threshold={}, power={}".format(*weight)
+
+    return "    \"{}\" -> \"{}\" [class=\"{}\", {}];\n".format(format_asn(link[0]), format_asn(link[1]),
+                                                            link_type, style)
+
+
+def _format_jsonl(link_type, link, nodes, weight=()):
+
+    if 0 < len(weight):
+        return "{{\"type\": {}, \"source\": \"{}\", \"target\": \"{}\", \"threshold\": {}, " \
+               "\"power\": {}}}\n".format(json.dumps(link_type), format_asn(link[0]), format_asn(link[1]), *weight)
+
+    return "{{\"type\": {}, \"source\": \"{}\", \"target\": \"{}\"}}\n".format(json.dumps(link_type),
+                                                                          format_asn(link[0]), format_asn(link[1]))
+
+
+def _format_csv(link_type, link, nodes, weight=()):
+
+    return ",".join((format_asn(link[0]), format_asn(link[1]), link_type,) + tuple(map(str, weight))) + "\n"
+
+
+def _format_graphml(link_type, link, nodes, weight=()):
+
+    graphml = ""
+
+    # nodes is None when nodes are written later with their attributes
+    for asn in link if nodes is not None else ():
+        if asn not in nodes:
+            nodes.add(asn)
+            graphml += "    <node id=\"{}\"/>\n".format(format_asn(asn))
+
+    data = "<data key=\"type\">{}</data>".format(_escape(link_type))
+    if 0 < len(weight):
+        data += "<data key=\"threshold\">{}</data><data key=\"power\">{}</data>".format(*weight)
+
+    return graphml + "    <edge source=\"{}\" target=\"{}\">{}</edge>\n".format(
+        format_asn(link[0]), format_asn(link[1]), data)
+
+
+def _format_dot_node(asn, attributes):
+
+    if len(attributes) == 0:
+        return ""
+
+    return "    \"{}\" [{}];\n".format(format_asn(asn), ", ".join(map(
+        lambda item: "{}={}".format(item[0], _format_value(item[1])), attributes.items())))
+
+
+def _format_jsonl_node(asn, attributes):
+
+    if len(attributes) == 0:
+        return ""
+
+    return json.dumps(dict(node=format_asn(asn), **attributes)) + "\n"
+
+
+def _format_graphml_node(asn, attributes):
+
+    return "    <node id=\"{}\">{}</node>\n".format(format_asn(asn), "".join(map(
+        lambda item: "<data key=\"{}\">{}</data>".format(item[0], _escape(str(item[1]))), attributes.items())))
+
+
+_formats = {FORMAT_DOT: ("digraph links {\n", _format_dot, "}\n",),
+            FORMAT_JSONL: ("", _format_jsonl, "",),
+            FORMAT_CSV: ("source,target,type\n", _format_csv, "",),
+            FORMAT_GRAPHML: (_graphml_header, _format_graphml, _graphml_footer,)}
+
+_weighted_headers = {FORMAT_CSV: "source,target,type,threshold,power\n",
+                     FORMAT_GRAPHML: _graphml_weighted_header}
+
+_node_formats = {FORMAT_DOT: _format_dot_node,
+                 FORMAT_JSONL: _format_jsonl_node,
+                 FORMAT_GRAPHML: _format_graphml_node}
+
+
+class LinkWriter:
+
+    def __init__(self, output, link_format=FORMAT_DOT, buffer_size=DEF_BUFFER_SIZE, weighted=False,
+                 node_attributes=None):
+        """
+        node_attributes is a tuple of (attribute, GraphML type) of nodes written by write_nodes
+        """
+
+        if link_format not in _formats:
+            raise ValueError("unknown link format '{}'".format(link_format))
+        elif node_attributes is not None and link_format not in _node_formats:
+            raise ValueError("link format '{}' has no nodes".format(link_format))
+
+        self.output = output
+        self.buffer_size = buffer_size
+
+        self._header, self._format_link, self._footer = _formats[link_format]
+
+        if weighted:
+            self._header = _weighted_headers.get(link_format, self._header)
+
+        # GraphML nodes with attributes are declared once by write_nodes, not with the first link
+        self._nodes_deferred = node_attributes is not None and link_format == FORMAT_GRAPHML
+
+        if self._nodes_deferred:
+            self._header = self._header.replace("  <graph ", "".join(map(
+                lambda item: "  <key id=\"{0}\" for=\"node\" attr.name=\"{0}\" attr.type=\"{1}\"/>\n".format(*item),
+                node_attributes)) + "  <graph ", 1)
+
+        self._format_node = _node_formats.get(link_format)
+        self._buffer = list()
+        self._buffered = 0
+        self._nodes = set()
+
+        self._write(self._header)
+
+    def _write(self, text):
+
+        self._buffer.append(text)
+        self._buffered += len(text)
+
+        if self.buffer_size <= self._buffered:
+            self.flush()
+
+    def write_links(self, links):
+        """
+        Writes iterable of (link type, link) pairs or weighted (link type, link, threshold, power)
+        """
+
+        for link_item in links:
+            if self._nodes_deferred:
+                self._nodes.update(link_item[1])
+                self._write(self._format_link(link_item[0], link_item[1], None, link_item[2:]))
+            else:
+                self._write(self._format_link(link_item[0], link_item[1], self._nodes, link_item[2:]))
+
+    def write_nodes(self, nodes_attributes):
+        """
+        Writes dict of ASn to dict of attributes, None values are skipped
+        """
+
+        if self._format_node is None:
+            raise ValueError("link format has no nodes")
+
+        asn_list = set(nodes_attributes).union(self._nodes) if self._nodes_deferred else nodes_attributes
+
+        for asn in sorted(asn_list):
+            attributes = dict(filter(lambda item: item[1] is not None, nodes_attributes.get(asn, dict()).items()))
+            self._write(self._format_node(asn, attributes))
+
+    def write_dot_links(self, dot_links):
+        """
+        Writes dict of link type to set of links from dotlinks.get_dot_links, links are sorted
+        """
+
+        for link_type, links in dot_links.items():
+            self.write_links(map(lambda link: (link_type, link,), sorted(links)))
+
+    def flush(self):
+
+        self.output.write("".join(self._buffer))
+        self.output.flush()
+
+        self._buffer.clear()
+        self._buffered = 0
+
+    def close(self):
+        """
+        Writes the footer, the output is not closed
+        """
+
+        self._write(self._footer)
+        self.flush()
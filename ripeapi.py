@@ -1,78 +1,377 @@
 # -*- coding: utf-8 -*-
 """
 RIPE API https://stat.ripe.net/data/ wrapper
+
+All requests go through one pooled keep-alive session, a token bucket
+rate limiter and a retry loop with exponential backoff and jitter
+for transient errors. Per-endpoint counters are available via get_stats().
+get_whois_many(), get_neighbours_many(), get_announced_prefixes_many()
+and get_as_path_length_many() resolve a batch of ASn at once
 """
 
-import requests
 import json
+import random
+import threading
+import time
 from functools import reduce
 
 from utils import in_cache
+from instrument import timed
+from cache import CacheStore, is_offline
+from fetch import fetch_stream, DEF_WORKERS
+from rpsllex import asn_to_int
 
 RIPE_API_URL = "https://stat.ripe.net/data/"
 RIPE_SEARCH_URL = "https://rest.db.ripe.net/ripe/"
 
 DEF_POWER_MIN = 10
 
-_cache_members = dict()
+DEF_POOL_SIZE = 16
+DEF_TIMEOUT = 30
+DEF_RATE = 8.0
+DEF_BURST = 16
+DEF_RETRIES = 4
+DEF_BACKOFF = 0.5
+DEF_BACKOFF_MAX = 30.0
 
+RETRY_STATUS = (429, 500, 502, 503, 504,)
 
-def _ripe_get(data_path, data_parameters):
+CACHE_TTL = {"whois": 86400,
+             "asn-neighbours": 21600,
+             "as-set": 604800,
+             "peering-set": 604800,
+             "announced-prefixes": 21600,
+             "as-path-length": 86400}
+
+_cache_whois = CacheStore("whois", CACHE_TTL["whois"])
+_cache_neighbours = CacheStore("asn-neighbours", CACHE_TTL["asn-neighbours"])
+_cache_members = CacheStore("as-set", CACHE_TTL["as-set"])
+_cache_peerings = CacheStore("peering-set", CACHE_TTL["peering-set"])
+_cache_prefixes = CacheStore("announced-prefixes", CACHE_TTL["announced-prefixes"])
+_cache_path_length = CacheStore("as-path-length", CACHE_TTL["as-path-length"])
+
+_object_stores = dict(map(lambda store: (store.endpoint, store,),
+                         (_cache_whois, _cache_neighbours, _cache_members, _cache_peerings,)))
+
+_dump = {"index": None, "snapshot": None}
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket, rate is tokens per second, burst is the bucket size
+    """
+
+    def __init__(self, rate=DEF_RATE, burst=DEF_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if 1 <= self._tokens:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+_client = {"session": None,
+           "limiter": TokenBucket(),
+           "pool_size": DEF_POOL_SIZE,
+           "timeout": DEF_TIMEOUT,
+           "retries": DEF_RETRIES,
+           "backoff": DEF_BACKOFF,
+           "backoff_max": DEF_BACKOFF_MAX,
+           "power_min": DEF_POWER_MIN}
+_client_lock = threading.Lock()
+
+_stats = dict()
+_stats_lock = threading.Lock()
+
+
+def configure(rate=None, burst=None, pool_size=None, timeout=None, retries=None, backoff=None, backoff_max=None,
+              power_min=None):
+
+    with _client_lock:
+        if rate is not None or burst is not None:
+            limiter = _client["limiter"]
+            _client["limiter"] = TokenBucket(rate if rate is not None else limiter.rate,
+                                             burst if burst is not None else limiter.burst)
+        if pool_size is not None:
+            _client["pool_size"] = pool_size
+            _client["session"] = None
+
+        for option, value in (("timeout", timeout), ("retries", retries),
+                              ("backoff", backoff), ("backoff_max", backoff_max), ("power_min", power_min),):
+            if value is not None:
+                _client[option] = value
+
+
+def _get_session():
+
+    # requests takes most of the startup time, it is imported by the first session,
+    # so a run answered from the cache or a local dump does not load it at all
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _client_lock:
+        if _client["session"] is None:
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=_client["pool_size"])
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _client["session"] = session
+
+        return _client["session"]
+
+
+def _backoff_delay(attempt, response=None):
+
+    if response is not None and response.status_code == 429:
+        try:
+            return min(_client["backoff_max"], float(response.headers.get("Retry-After")))
+        except (TypeError, ValueError):
+            pass
+
+    delay = min(_client["backoff_max"], _client["backoff"] * (2 ** attempt))
+
+    return random.uniform(delay / 2, delay)
+
+
+def _count(endpoint, latency, retries, failed, received=0):
+
+    with _stats_lock:
+        if endpoint not in _stats:
+            _stats[endpoint] = {"requests": 0, "retries": 0, "errors": 0, "latency": 0.0, "latency_max": 0.0,
+                                "bytes": 0}
+
+        endpoint_stats = _stats[endpoint]
+        endpoint_stats["requests"] += 1
+        endpoint_stats["retries"] += retries
+        endpoint_stats["errors"] += 1 if failed else 0
+        endpoint_stats["latency"] += latency
+        endpoint_stats["latency_max"] = max(endpoint_stats["latency_max"], latency)
+        endpoint_stats["bytes"] += received
+
+
+def get_stats():
+    """
+    Returns dict of endpoint to requests, retries, errors, total and max latency in seconds, bytes received
+    """
+
+    with _stats_lock:
+        return {endpoint: dict(endpoint_stats) for endpoint, endpoint_stats in _stats.items()}
+
+
+def reset_stats():
+
+    with _stats_lock:
+        _stats.clear()
+
+
+@timed("ripeapi.http_get")
+def _http_get(endpoint, url, params=None):
 
     data = None
 
-    try:
-        data = requests.get(RIPE_API_URL + data_path + '/data.json', params=data_parameters).json()
-    except requests.exceptions.RequestException:
-        pass
-    except json.decoder.JSONDecodeError:
-        pass
+    if is_offline():
+        return data
+
+    session = _get_session()
+    retries = _client["retries"]
+
+    from requests.exceptions import RequestException
+
+    attempt = 0
+    latency = 0.0
+    received = 0
+
+    while True:
+        response = None
+        _client["limiter"].acquire()
+
+        started = time.monotonic()
+        try:
+            response = session.get(url, params=params, timeout=_client["timeout"])
+        except RequestException:
+            pass
+        latency += time.monotonic() - started
+
+        if response is not None:
+            received += len(response.content)
+
+        if response is not None and response.status_code not in RETRY_STATUS:
+            try:
+                data = response.json()
+            except (json.decoder.JSONDecodeError, ValueError):
+                pass
+            break
+
+        if retries <= attempt:
+            break
+
+        time.sleep(_backoff_delay(attempt, response))
+        attempt += 1
+
+    _count(endpoint, latency, attempt, data is None, received)
 
     return data
 
 
+def _ripe_get(data_path, data_parameters):
+
+    return _http_get(data_path, RIPE_API_URL + data_path + '/data.json', data_parameters)
+
+
 def _ripe_search(data_path, data_name):
 
-    data = None
+    return _http_get(data_path, RIPE_SEARCH_URL + data_path + '/' + data_name + ".json")
+
+
+def use_dump(index):
+    """
+    Answer aut-num, as-set and peering-set lookups from ripedb.DumpIndex first, None turns it off
+    """
+
+    _dump["index"] = index
+
+
+def use_snapshot(snapshot):
+    """
+    Answer neighbours lookups from snapshot.Snapshot first, None turns it off
+    """
+
+    _dump["snapshot"] = snapshot
+
+
+def _get_object(object_class, object_name):
+    """
+    Returns list of (attribute, value) pairs of RIPE DB object, empty list when
+    there is no such object or None on request error
+    """
+
+    index = _dump["index"]
+    if index is not None:
+        attributes = index.get(object_class, object_name)
+        if attributes is not None:
+            return attributes
+
+    if object_class == "aut-num":
+        data = _ripe_get("whois", {"resource": object_name})
+    else:
+        data = _ripe_search(object_class, object_name)
+
+    if data is None:
+        return None
 
     try:
-        data = requests.get(RIPE_SEARCH_URL + data_path + '/' + data_name + ".json").json()
-    except requests.exceptions.RequestException:
-        pass
-    except json.decoder.JSONDecodeError:
-        pass
+        if object_class == "aut-num":
+            return list(map(lambda record: (record["key"], record["value"],), data["data"]["records"][0]))
 
-    return data
+        return list(map(lambda record: (record["name"], record["value"],),
+                        data["objects"]["object"][0]["attributes"]["attribute"]))
 
+    except (KeyError, TypeError, IndexError):
+        return list()
 
+
+@in_cache(_cache_whois)
 def get_whois_top(asn):
 
+    records = _get_object("aut-num", asn)
+
+    if records is None:
+        return None
+
     whois_object = {}
 
-    data = _ripe_get("whois", {"resource": asn})
+    for record_type, record_value in records:
+        if record_type not in whois_object:
+            whois_object[record_type] = set()
+
+        whois_object[record_type].add(record_value)
+
+    return whois_object
+
+
+def expire_whois(asn):
+    """
+    Drops the cached aut-num of the ASn, the next get_whois_top requests it again
+    """
+
+    _cache_whois.expire(asn)
+
+
+def get_cached_objects(object_keys):
+    """
+    Returns dict of (endpoint, resource) to cached aut-num, neighbours, as-set or peering-set
+    of the keys, endpoints are whois, asn-neighbours, as-set and peering-set, keys not cached are skipped
+    """
+
+    objects = dict()
+
+    for endpoint, resource in object_keys:
+        try:
+            objects[(endpoint, resource,)] = _object_stores[endpoint][resource]
+        except KeyError:
+            continue
+
+    return objects
+
+
+def put_cached_objects(objects):
+    """
+    Caches objects of get_cached_objects, like ones sent to another process
+    """
+
+    for (endpoint, resource), value in objects.items():
+        _object_stores[endpoint][resource] = value
+
+
+def get_whois_last_updated(asn):
+    """
+    Returns last updated time of the aut-num object as RIPE string, empty string if unknown or None on error
+    """
+
+    data = _ripe_get("whois-object-last-updated", {"object": asn, "type": "aut-num", "source": "ripe"})
+
+    if data is None:
+        return None
 
     try:
-        if data is None:
-            whois_object = None
-        else:
-            for record in data["data"]["records"][0]:
-                record_type = record["key"]
-                record_value = record["value"]
+        return data["data"]["last_updated"] or ""
+    except (KeyError, TypeError):
+        return ""
 
-                if record_type not in whois_object:
-                    whois_object[record_type] = set()
 
-                whois_object[record_type].add(record_value)
+def get_neighbours_power(asn):
+    """
+    Returns list of (asn, type, power) for all neighbours, nothing is filtered by power.
+    Neighbours in the snapshot are read from its mapped file, they are not cached
+    """
 
-    except KeyError or TypeError:
-        whois_object.clear()
+    snapshot = _dump["snapshot"]
+    if snapshot is not None:
+        neighbours = snapshot.get_neighbours_power(asn_to_int(asn))
+        if neighbours is not None:
+            return neighbours
 
-    return whois_object
+    return _get_neighbours_power(asn)
 
 
-def get_neighbours(asn, power_min=DEF_POWER_MIN):
+@in_cache(_cache_neighbours)
+def _get_neighbours_power(asn):
 
-    neighbours = {"left": set(), "right": set(), "uncertain": set()}
+    neighbours = list()
 
     data = _ripe_get("asn-neighbours", {"resource": asn})
 
@@ -81,75 +380,159 @@ def get_neighbours(asn, power_min=DEF_POWER_MIN):
             neighbours = None
         else:
             for neighbour in data["data"]["neighbours"]:
-                power = neighbour["power"]
-                peer_type = neighbour["type"]
-                peer_asn = neighbour["asn"]
+                neighbours.append((neighbour["asn"], neighbour["type"], neighbour["power"],))
 
-                if power_min < power:
-                    neighbours[peer_type].add(peer_asn)
+    except (KeyError, TypeError):
+        neighbours.clear()
+
+    return neighbours
 
-    except KeyError or TypeError:
-        neighbours["left"].clear()
-        neighbours["right"].clear()
-        neighbours["uncertain"].clear()
+
+def get_neighbours(asn, power_min=None):
+    """
+    Returns dict of neighbour type to set of ASn with power above power_min, configure() sets
+    the default. Powers stay in the cache, so another threshold needs no RIPE request
+    """
+
+    if power_min is None:
+        power_min = _client["power_min"]
+
+    neighbours = {"left": set(), "right": set(), "uncertain": set()}
+
+    neighbours_power = get_neighbours_power(asn)
+
+    if neighbours_power is None:
+        return None
+
+    for peer_asn, peer_type, power in neighbours_power:
+        if power_min < power and peer_type in neighbours:
+            neighbours[peer_type].add(peer_asn)
 
     return neighbours
 
 
-@in_cache(_cache_members)
-def get_asset_members(asset):
+def _get_many(get_func, cache_store, asns, workers):
+    """
+    RIPE stat answers one resource per request, so a batch is deduplicated,
+    cached ASn are answered at once and the rest are requested concurrently
+    """
+
+    asn_unique = list(dict.fromkeys(asns))
+
+    asn_cached = list(filter(lambda asn: asn in cache_store, asn_unique))
+    results = dict(map(lambda asn: (asn, get_func(asn),), asn_cached))
+
+    results.update(fetch_stream(filter(lambda asn: asn not in results, asn_unique), get_func, workers=workers))
+
+    return results
+
+
+def get_whois_many(asns, workers=DEF_WORKERS):
+    """
+    Returns dict of ASn to get_whois_top(ASn), failed ASn have None
+    and may be skipped or requested again without the rest of the batch
+    """
+
+    return _get_many(get_whois_top, _cache_whois, asns, workers)
+
 
-    members = set()
+def get_neighbours_many(asns, power_min=None, workers=DEF_WORKERS):
+    """
+    Returns dict of ASn to get_neighbours(ASn, power_min), failed ASn have None
+    """
 
-    data = _ripe_search("as-set", asset)
+    neighbours_power = _get_many(get_neighbours_power, _cache_neighbours, asns, workers)
+
+    return dict(map(lambda asn: (asn, None if neighbours_power[asn] is None else get_neighbours(asn, power_min),),
+                    neighbours_power))
+
+
+@in_cache(_cache_prefixes)
+def get_announced_prefixes(asn):
+    """
+    Returns list of prefixes announced by the ASn or None on RIPE error
+    """
+
+    data = _ripe_get("announced-prefixes", {"resource": asn})
+
+    if data is None:
+        return None
 
     try:
-        if data is None:
-            members = None
-        else:
-            records = data["objects"]["object"][0]["attributes"]["attribute"]
+        return list(map(lambda prefix: prefix["prefix"], data["data"]["prefixes"]))
+    except (KeyError, TypeError):
+        return list()
+
 
-            def find_members(_members, record):
-                record_type = record["name"]
-                record_value = record["value"]
+@in_cache(_cache_path_length)
+def get_as_path_length(asn):
+    """
+    Returns list of (collector, paths, length sum, min, max) of AS paths to the ASn
+    with prepends stripped or None on RIPE error
+    """
 
-                if record_type == "members":
-                    return _members.union(set(record_value.split(',')))
-                else:
-                    return _members
+    data = _ripe_get("as-path-length", {"resource": asn})
 
-            members.update(reduce(find_members, records, set()))
+    if data is None:
+        return None
+
+    try:
+        return list(map(lambda stat: (stat["location"], stat["count"], stat["stripped"]["sum"],
+                                      stat["stripped"]["min"], stat["stripped"]["max"],),
+                        data["data"]["stats"]))
+    except (KeyError, TypeError):
+        return list()
+
+
+def get_announced_prefixes_many(asns, workers=DEF_WORKERS):
+    """
+    Returns dict of ASn to get_announced_prefixes(ASn), failed ASn have None
+    """
+
+    return _get_many(get_announced_prefixes, _cache_prefixes, asns, workers)
 
-    except KeyError or TypeError:
-        members.clear()
 
-    return members
+def get_as_path_length_many(asns, workers=DEF_WORKERS):
+    """
+    Returns dict of ASn to get_as_path_length(ASn), failed ASn have None
+    """
+
+    return _get_many(get_as_path_length, _cache_path_length, asns, workers)
 
 
 @in_cache(_cache_members)
-def get_peeringset_expr(peeringset):
-    peerings = set()
+def get_asset_members(asset):
 
-    data = _ripe_search("peering-set", peeringset)
+    records = _get_object("as-set", asset)
 
-    try:
-        if data is None:
-            peerings = None
+    if records is None:
+        return None
+
+    def find_members(_members, record):
+        record_type, record_value = record
+
+        if record_type == "members":
+            return _members.union(filter(None, map(str.strip, record_value.split(','))))
         else:
-            records = data["objects"]["object"][0]["attributes"]["attribute"]
+            return _members
+
+    return reduce(find_members, records, set())
 
-            def find_peerings(_peerings, record):
-                record_type = record["name"]
-                record_value = record["value"]
 
-                if record_type == "peering" or record_type == "mp-peering":
-                    return _peerings.union({record_value})
-                else:
-                    return _peerings
+@in_cache(_cache_peerings)
+def get_peeringset_expr(peeringset):
+
+    records = _get_object("peering-set", peeringset)
 
-            peerings.update(reduce(find_peerings, records, set()))
+    if records is None:
+        return None
 
-    except KeyError or TypeError:
-        peerings.clear()
+    def find_peerings(_peerings, record):
+        record_type, record_value = record
+
+        if record_type == "peering" or record_type == "mp-peering":
+            return _peerings.union({record_value})
+        else:
+            return _peerings
 
-    return peerings
+    return reduce(find_peerings, records, set())
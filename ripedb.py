@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Local RIPE database from split dump files
+
+Dumps like ripe.db.aut-num.gz, ripe.db.as-set.gz and ripe.db.peering-set.gz
+are parsed as a stream of RPSL objects and stored into an SQLite index keyed
+by object class and name. ripeapi answers aut-num, as-set and peering-set
+lookups from the index after ripeapi.use_dump()
+"""
+
+import sys
+import getopt
+import json
+import sqlite3
+import threading
+
+USAGE_MSG = """
+Build local index of RIPE database split dumps
+(c) elsv-v.ru 2018
+
+Usage:
+    ripedb.py <index> <dump> [<dump> ...]
+
+Dump files are ripe.db.<class>[.gz] from ftp.ripe.net/ripe/dbase/split/
+"""
+
+SUCCESS = 0
+ERR_IO = 2
+ERR_GETOPT = 3
+
+DEF_BATCH = 10000
+
+INDEXED_CLASSES = ("aut-num", "as-set", "peering-set",)
+
+
+def _open_dump(dump_name):
+
+    if dump_name.endswith(".gz"):
+        import gzip
+
+        return gzip.open(dump_name, "rt", encoding="latin-1")
+
+    return open(dump_name, "rt", encoding="latin-1")
+
+
+def parse_objects(lines):
+    """
+    Generator of RPSL objects, each is a list of (attribute, value) pairs.
+    Continuation lines are joined to the attribute value, end of line comments are removed
+    """
+
+    attributes = list()
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if line.strip() == "":
+            if 0 < len(attributes):
+                yield attributes
+                attributes = list()
+            continue
+        elif line[0] in "%#":
+            continue
+
+        value = line.split("#", 1)[0]
+
+        if line[0] in " \t+":
+            if 0 < len(attributes):
+                attribute, attribute_value = attributes[-1]
+                attributes[-1] = (attribute, " ".join(filter(None, (attribute_value, value.lstrip("+").strip()))),)
+            continue
+
+        attribute, separator, attribute_value = value.partition(":")
+        if separator == "":
+            continue
+
+        attributes.append((attribute.strip().lower(), attribute_value.strip(),))
+
+    if 0 < len(attributes):
+        yield attributes
+
+
+def read_dump(dump_name, object_classes=INDEXED_CLASSES):
+
+    with _open_dump(dump_name) as dump_file:
+        for attributes in parse_objects(dump_file):
+            if attributes[0][0] in object_classes:
+                yield attributes
+
+
+class DumpIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS objects ("
+                         "class TEXT NOT NULL, "
+                         "name TEXT NOT NULL, "
+                         "attributes TEXT NOT NULL, "
+                         "PRIMARY KEY (class, name)) WITHOUT ROWID")
+
+    def load(self, objects, batch=DEF_BATCH):
+        """
+        Stores objects from a generator in batches, returns number of objects stored
+        """
+
+        count = 0
+        rows = list()
+
+        def flush():
+            self._db.executemany("INSERT OR REPLACE INTO objects (class, name, attributes) VALUES (?, ?, ?)", rows)
+            rows.clear()
+
+        with self._lock, self._db:
+            for attributes in objects:
+                object_class, object_name = attributes[0]
+                rows.append((object_class, object_name.upper(), json.dumps(attributes),))
+                count += 1
+
+                if batch <= len(rows):
+                    flush()
+
+            flush()
+
+        return count
+
+    def get(self, object_class, object_name):
+        """
+        Returns list of (attribute, value) pairs of the object or None
+        """
+
+        with self._lock:
+            row = self._db.execute("SELECT attributes FROM objects WHERE class = ? AND name = ?",
+                                   (object_class, object_name.upper(),)).fetchone()
+
+        if row is None:
+            return None
+
+        return list(map(tuple, json.loads(row[0])))
+
+    def get_names(self, object_class):
+        """
+        Returns sorted list of names of the objects of the class
+        """
+
+        with self._lock:
+            return list(map(lambda row: row[0], self._db.execute("SELECT name FROM objects WHERE class = ? "
+                                                                 "ORDER BY name", (object_class,))))
+
+    def close(self):
+
+        with self._lock:
+            self._db.close()
+
+
+def main():
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "", ())
+
+        if len(args) < 2:
+            raise getopt.GetoptError("index and dump are required")
+
+    except getopt.GetoptError:
+        print(USAGE_MSG)
+        return ERR_GETOPT
+
+    index_name = args[0]
+
+    try:
+        index = DumpIndex(index_name)
+
+        for dump_name in args[1:]:
+            print("{}: {} objects".format(dump_name, index.load(read_dump(dump_name))))
+
+        index.close()
+
+    except (IOError, EOFError, sqlite3.Error) as err:
+        print("Dump read error: {}".format(err))
+        return ERR_IO
+
+    return SUCCESS
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Local stub of RIPE stat and RIPE DB REST API for tests
+
+Objects are kept in dicts of the stub and may be changed between runs, names
+in failing are answered with HTTP 503, names in failing_times and delayed_times
+are answered with HTTP 503 or after delay seconds that many times. start() points ripeapi to the stub,
+turns its retries and rate limit off and drops cached objects, stop() restores ripeapi
+"""
+
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cache
+import ripeapi
+import rpsl
+
+DEF_POLL_INTERVAL = 0.02
+DEF_RATE = 1000.0
+DEF_BACKLOG = 64
+DEF_DELAY = 0.5
+
+
+class _StubServer(ThreadingHTTPServer):
+
+    # connections of all fetch workers at once overflow the default backlog of 5 and wait for SYN retries
+    request_queue_size = DEF_BACKLOG
+
+
+class RipeStub:
+
+    def __init__(self):
+        self.whois = dict()
+        self.last_updated = dict()
+        self.neighbours = dict()
+        self.assets = dict()
+        self.peeringsets = dict()
+        self.prefixes = dict()
+        self.path_stats = dict()
+
+        self.failing = set()
+        self.failing_times = dict()
+        self.delayed_times = dict()
+        self.delay = DEF_DELAY
+        self.calls = dict()
+
+        self._lock = threading.Lock()
+
+        self._server = None
+        self._urls = None
+
+    def _get_data(self, call, resource):
+
+        if call == "whois":
+            if resource not in self.whois:
+                return 404, {}
+
+            records = [{"key": "aut-num", "value": resource}] + \
+                list(map(lambda record: {"key": record[0], "value": record[1]}, self.whois[resource]))
+
+            return 200, {"data": {"records": [records]}}
+
+        elif call == "whois-object-last-updated":
+            return 200, {"data": {"last_updated": self.last_updated.get(resource)}}
+
+        elif call == "asn-neighbours":
+            return 200, {"data": {"neighbours": list(map(lambda neighbour: {"asn": neighbour[0], "type": neighbour[1],
+                                                                             "power": neighbour[2]},
+                                                         self.neighbours.get(resource, ())))}}
+
+        elif call == "announced-prefixes":
+            return 200, {"data": {"prefixes": list(map(lambda prefix: {"prefix": prefix, "timelines": []},
+                                                       self.prefixes.get(resource, ())))}}
+
+        elif call == "as-path-length":
+            return 200, {"data": {"stats": self.path_stats.get(resource, [])}}
+
+        return 404, {}
+
+    def _get_object(self, object_class, object_name):
+
+        if object_class == "as-set" and object_name in self.assets:
+            attributes = [{"name": "members", "value": ", ".join(self.assets[object_name])}]
+        elif object_class == "peering-set" and object_name in self.peeringsets:
+            attributes = list(map(lambda peering: {"name": "peering", "value": peering},
+                                  self.peeringsets[object_name]))
+        else:
+            return 404, {}
+
+        return 200, {"objects": {"object": [{"attributes": {"attribute": [{"name": object_class,
+                                                                             "value": object_name}] + attributes}}]}}
+
+    @staticmethod
+    def _take(times, name):
+        """
+        Decrements the count of the name in times, returns False if it is already zero
+        """
+
+        if times.get(name, 0) <= 0:
+            return False
+
+        times[name] -= 1
+
+        return True
+
+    def get(self, path):
+        """
+        Returns (HTTP status, JSON object) of the request path
+        """
+
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+
+        if parts[0] == "data" and 2 < len(parts):
+            name = query.get("resource", query.get("object", [""]))[0]
+            call = parts[1]
+        elif parts[0] == "ripe" and 2 < len(parts):
+            name = parts[2][:-len(".json")]
+            call = parts[1]
+        else:
+            return 404, {}
+
+        with self._lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+            is_failing = self._take(self.failing_times, name)
+            is_delayed = self._take(self.delayed_times, name)
+
+        if is_delayed:
+            time.sleep(self.delay)
+
+        if name in self.failing or is_failing:
+            return 503, {}
+        elif parts[0] == "data":
+            return self._get_data(call, name)
+
+        return self._get_object(call, name)
+
+    def start(self):
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, data = stub.get(self.path)
+                body = json.dumps(data).encode("utf-8")
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = _StubServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, args=(DEF_POLL_INTERVAL,), daemon=True).start()
+
+        base = "http://127.0.0.1:{}/".format(self._server.server_port)
+
+        self._urls = (ripeapi.RIPE_API_URL, ripeapi.RIPE_SEARCH_URL,)
+        ripeapi.RIPE_API_URL = base + "data/"
+        ripeapi.RIPE_SEARCH_URL = base + "ripe/"
+        ripeapi.configure(rate=DEF_RATE, burst=int(DEF_RATE), retries=0)
+
+        self.reset()
+
+        return self
+
+    def reset(self):
+        """
+        Drops objects cached by ripeapi and rpsl, the next run requests the stub again
+        """
+
+        cache.clear_stores()
+        rpsl.clear_cache()
+
+    def stop(self):
+
+        self._server.shutdown()
+        self._server.server_close()
+
+        ripeapi.RIPE_API_URL, ripeapi.RIPE_SEARCH_URL = self._urls
+        ripeapi.configure(rate=ripeapi.DEF_RATE, burst=ripeapi.DEF_BURST, retries=ripeapi.DEF_RETRIES)
+
+        self.reset()
@@ -40,160 +40,500 @@ import|export: [protocol <protocol1>] [into <protocol2>]
 default: to <peering> [action <action>] [networks <filter>]
 """
 
-import re
-import boolean
 from functools import reduce, partial
 
 from ripeapi import get_asset_members, get_peeringset_expr
-from utils import in_cache
+from utils import in_cache, LRUStore
+from instrument import timed
+import rpsllex
+from rpsllex import RE_ASN, RE_ASSET_NAME, RE_ASSET, RE_ASSET_ANY, RE_PEERINGSET_NAME, RE_PEERINGSET, \
+    RE_ASNEXPR, RE_PEERING, RE_IMPORT_FACTOR, \
+    TOK_ASN, TOK_ASSET, TOK_OPERATOR, TOK_LPAREN, TOK_RPAREN, ASN_ANY, is_asn, is_asset, is_peeringset, \
+    tokenize, asn_to_int
 
 
-RE_ASN = r"AS[0-9]{1,6}"
-RE_ASSET_NAME = r"AS-[A-Z0-9-_]*[A-Z0-9]"
-RE_ASSET = r"(((" + RE_ASN + r"|" + RE_ASSET_NAME + r"):)*" + RE_ASSET_NAME + r")"
-RE_ASSET_ANY = r"AS-ANY"
+DEF_SET_DEEP_MAX = None
+DEF_PEERINGSET_DEEP_MAX = 5
 
-RE_PEERINGSET_NAME = r"PRNG-[A-Z0-9-_]*[A-Z0-9]"
-RE_PEERINGSET = r"(((" + RE_ASN + r"|" + RE_ASSET_NAME + r"):)*" + RE_PEERINGSET_NAME + r")"
+_cache_uncovered = LRUStore()
+_cache_closure = LRUStore()
+_cache_asset_deep = LRUStore()
+_cache_asset_walk = LRUStore()
+_cache_peeringset_walk = LRUStore()
 
-RE_ASNEXPR = r"([\s(]*(" + RE_ASSET + "|" + RE_ASN + \
-             r")([\s)]+(OR|AND|EXCEPT)[\s(]+(" + RE_ASSET + r"|" + RE_ASN + r"))*[\s)]*)"
+_snapshot = {"snapshot": None}
+_unresolved = {"as-set": set(), "peering-set": set()}
 
-RE_PEERING = r"(" + RE_PEERINGSET + r"|" + RE_ASNEXPR + r")"
-RE_IMPORT_FACTOR = r"(from|to)\s+" + RE_PEERING
 
-DEF_SET_DEEP_MAX = 5
+def use_snapshot(snapshot):
+    """
+    Answer full as-set closures from snapshot.Snapshot first, None turns it off
+    """
 
-_cache_uncovered = dict()
+    _snapshot["snapshot"] = snapshot
 
 
-@in_cache(_cache_uncovered)
-def uncover_asset(asset_name, asset_deep_max=DEF_SET_DEEP_MAX, asset_deep=0,
-                  asset_uncovered: set=None, asset_init: set=None):
+def _get_closure(asset_name):
+    """
+    Returns known closure of the as-set from the store or the snapshot or None.
+    A snapshot closure is a memoryview of its mapped file, it is not copied
+    and must not be kept after the call that asked for it
+    """
 
-    uncovered = set()
-    if asset_uncovered is not None:
-        uncovered.update(asset_uncovered)
+    closure = _cache_closure.get(asset_name)
 
-    asn_list = set()
+    if closure is None and _snapshot["snapshot"] is not None:
+        closure = _snapshot["snapshot"].get_closure(asset_name)
 
-    asset_defined = asset_init
+    return closure
 
-    if re.fullmatch(RE_ASSET, asset_name, re.IGNORECASE) or asset_defined is not None:
 
-        if asset_defined is None:
-            asset_defined = get_asset_members(asset_name)
+def _note_resolved(object_class, object_name, object_value):
 
-        if asset_defined is None:
+    if object_value is None:
+        _unresolved[object_class].add(object_name)
+    else:
+        _unresolved[object_class].discard(object_name)
+
+
+def get_unresolved():
+    """
+    Returns dict of object class to sorted names of as-sets and peering-sets failed on RIPE errors
+    and not fetched later
+    """
+
+    return dict(map(lambda item: (item[0], sorted(item[1]),), _unresolved.items()))
+
+
+def reset_unresolved():
+
+    for object_names in _unresolved.values():
+        object_names.clear()
+
+
+def _get_asset_node(asset_name):
+    """
+    Returns (ASn set, member as-set names) of the as-set or None when it can not be fetched
+    """
+
+    asset_defined = get_asset_members(asset_name)
+    _note_resolved("as-set", asset_name, asset_defined)
+
+    if asset_defined is None:
+        return None
+    elif RE_ASSET_ANY in asset_defined:
+        return frozenset({ASN_ANY}), ()
+
+    asn_list = frozenset(map(asn_to_int, filter(is_asn, asset_defined)))
+    asset_list = tuple(set(map(str.upper, filter(is_asset, asset_defined))))
+
+    return asn_list, asset_list
+
+
+def _uncover_asset_closure(asset_root):
+    """
+    Iterative Tarjan SCC over the as-set graph, every strongly connected component
+    gets one shared closure, components are finished in reverse topological order,
+    so closures of member sets are always ready when a component is closed.
+    Closures are kept in a local dict too, so eviction from the store can not lose them midway
+    """
+
+    root_closure = _get_closure(asset_root)
+    if isinstance(root_closure, memoryview):
+        # set algebra of callers needs a frozenset, it is copied once and kept
+        root_closure = frozenset(root_closure)
+        _cache_closure[asset_root] = root_closure
+
+    if root_closure is not None:
+        return root_closure
+
+    closures = dict()
+    asset_index = dict()
+    asset_lowlink = dict()
+    asset_nodes = dict()
+    asset_stack = list()
+    asset_onstack = set()
+
+    def visit(asset_name):
+        asset_node = _get_asset_node(asset_name)
+        if asset_node is None:
             return None
-        elif RE_ASSET_ANY in asset_defined:
-            return {RE_ASSET_ANY}
 
-        asn_list.update(set(filter(lambda asn_filter: re.fullmatch(RE_ASN, asn_filter, re.IGNORECASE),
-                                   asset_defined)))
+        asset_nodes[asset_name] = asset_node
+        asset_index[asset_name] = asset_lowlink[asset_name] = len(asset_index)
+        asset_stack.append(asset_name)
+        asset_onstack.add(asset_name)
 
-        if asset_deep < asset_deep_max:
+        return asset_name, iter(asset_node[1])
 
-            uncovered.add(asset_name)
+    root_visit = visit(asset_root)
+    if root_visit is None:
+        return None
 
-            asset_list = set(filter(lambda asset_filter: re.fullmatch(RE_ASSET, asset_filter, re.IGNORECASE) and
-                                    asset_filter not in uncovered,
-                                    asset_defined))
+    work = [root_visit]
 
-            uncovered.update(asset_list)
+    while 0 < len(work):
+        asset_name, members = work[-1]
 
-            def lambda_uncover_asset(members: set, asset, **kwargs):
-                if members is None:
+        for member in members:
+            if member in closures:
+                continue
+            elif member not in asset_index:
+                member_closure = _get_closure(member)
+                if member_closure is not None:
+                    closures[member] = member_closure
+                    continue
+
+                member_visit = visit(member)
+                if member_visit is None:
                     return None
-                elif RE_ASSET_ANY in members:
-                    return {RE_ASSET_ANY}
-                return members.union(uncover_asset(asset, **kwargs))
+                work.append(member_visit)
+                break
+            elif member in asset_onstack:
+                asset_lowlink[asset_name] = min(asset_lowlink[asset_name], asset_index[member])
+        else:
+            work.pop()
 
-            reduce_uncover_asset = partial(lambda_uncover_asset,
-                                           asset_deep_max=asset_deep_max,
-                                           asset_deep=asset_deep+1,
-                                           asset_uncovered=uncovered)
+            if 0 < len(work):
+                parent_name = work[-1][0]
+                asset_lowlink[parent_name] = min(asset_lowlink[parent_name], asset_lowlink[asset_name])
 
-            asn_members = reduce(reduce_uncover_asset, asset_list, set())
+            if asset_lowlink[asset_name] == asset_index[asset_name]:
+                component = list()
+                while True:
+                    component_name = asset_stack.pop()
+                    asset_onstack.discard(component_name)
+                    component.append(component_name)
+                    if component_name == asset_name:
+                        break
 
-            if asn_members is None:
-                return None
-            elif RE_ASSET_ANY in asn_list:
-                return {RE_ASSET_ANY}
+                component_set = set(component)
+                closure = set()
 
-            asn_list.update(asn_members)
+                for component_name in component:
+                    asn_list, asset_list = asset_nodes[component_name]
+                    closure.update(asn_list)
+                    for member in asset_list:
+                        if member not in component_set:
+                            closure.update(closures[member])
 
-    return asn_list
+                if ASN_ANY in closure:
+                    closure = {ASN_ANY}
 
+                closure = frozenset(closure)
+                for component_name in component:
+                    closures[component_name] = closure
+                    _cache_closure[component_name] = closure
 
-def split_peering(peering):
-    asn_list = set()
+    return closures[asset_root]
 
-    if re.fullmatch(RE_ASN, peering, flags=re.IGNORECASE):
-        return peering
-    elif re.fullmatch(RE_ASSET, peering, flags=re.IGNORECASE):
-        return uncover_asset(peering)
 
-    asn_logic = re.sub(r"([\s(])EXCEPT([\s)])", r"\1AND NOT\2", peering, flags=re.IGNORECASE)
+def _uncover_asset_deep(asset_root, asset_deep_max):
+    """
+    Breadth first walk, ASn of every as-set not deeper than asset_deep_max are collected
+    """
+
+    cache_key = (asset_root, asset_deep_max,)
+    asset_closure = _cache_asset_deep.get(cache_key)
+    if asset_closure is not None:
+        return asset_closure
 
-    asset_list = set(map(lambda findall_list: findall_list[0], re.findall(RE_ASSET, peering, re.IGNORECASE)))
+    asn_list = set()
+    uncovered = {asset_root}
+    asset_level = [asset_root]
 
-    if 0 < len(asset_list):
-        def replace_asset(_asn_logic, _asset_name):
+    for asset_deep in range(asset_deep_max + 1):
+        asset_next = list()
 
-            if _asn_logic is None:
+        for asset_name in asset_level:
+            asset_node = _get_asset_node(asset_name)
+            if asset_node is None:
                 return None
 
-            asset_asn_list = uncover_asset(_asset_name)
+            asn_list.update(asset_node[0])
 
-            if asset_asn_list is None:
-                return None
-            if 0 < len(asset_asn_list):
-                asset_members = "(" + " OR ".join(asset_asn_list) + ")"
-                return re.sub(_asset_name + r"([\s)]|$)", asset_members + r"\1", _asn_logic, count=1,
-                              flags=re.IGNORECASE)
+            if asset_deep < asset_deep_max:
+                for member in asset_node[1]:
+                    if member not in uncovered:
+                        uncovered.add(member)
+                        asset_next.append(member)
+
+        asset_level = asset_next
+
+    if ASN_ANY in asn_list:
+        asn_list = {ASN_ANY}
+
+    asset_closure = frozenset(asn_list)
+    _cache_asset_deep[cache_key] = asset_closure
+
+    return asset_closure
 
-            return _asn_logic
 
-        asn_logic = str(reduce(replace_asset, asset_list, asn_logic))
+@timed("rpsl.uncover_asset")
+def uncover_asset(asset_name, asset_deep_max=DEF_SET_DEEP_MAX):
+    """
+    Returns frozenset of ASn in the as-set, None if any member set can not be fetched.
+    Without asset_deep_max it is the full closure, shared by all callers during the run
+    """
 
-        if asn_logic is None:
+    if not is_asset(asset_name):
+        return frozenset()
+
+    asset_name = asset_name.upper()
+
+    if asset_name == RE_ASSET_ANY:
+        return frozenset({ASN_ANY})
+
+    if asset_deep_max is None:
+        return _uncover_asset_closure(asset_name)
+
+    return _uncover_asset_deep(asset_name, asset_deep_max)
+
+
+def _has_snapshot_closure(asset_name):
+
+    return _snapshot["snapshot"] is not None and _snapshot["snapshot"].get_closure(asset_name) is not None
+
+
+def walk_asset(asset_root):
+    """
+    Fetches members of the as-set and every as-set nested in it without uncovering them.
+    Returns frozenset of names of fetched as-sets or None if any of them can not be fetched,
+    sets in the snapshot are not fetched. Walks are kept, so a shared subtree is walked once
+    """
+
+    asset_root = asset_root.upper()
+
+    walked = _cache_asset_walk.get(asset_root)
+    if walked is not None:
+        return walked
+
+    asset_names = set()
+    uncovered = {asset_root}
+    asset_level = [asset_root]
+
+    while 0 < len(asset_level):
+        asset_name = asset_level.pop()
+
+        if asset_name == RE_ASSET_ANY or _has_snapshot_closure(asset_name):
+            continue
+
+        asset_walked = _cache_asset_walk.get(asset_name)
+        if asset_walked is not None:
+            asset_names.update(asset_walked)
+            continue
+
+        asset_defined = get_asset_members(asset_name)
+        _note_resolved("as-set", asset_name, asset_defined)
+
+        if asset_defined is None:
             return None
 
-    asn_expr = boolean.BooleanAlgebra()
+        asset_names.add(asset_name)
+
+        if RE_ASSET_ANY in asset_defined:
+            continue
+
+        for member in map(str.upper, filter(is_asset, asset_defined)):
+            if member not in uncovered:
+                uncovered.add(member)
+                asset_level.append(member)
+
+    walked = frozenset(asset_names)
+    _cache_asset_walk[asset_root] = walked
+
+    return walked
+
+
+def walk_peeringset(peeringset_root, peeringset_deep_max=DEF_PEERINGSET_DEEP_MAX):
+    """
+    Fetches the peering-set, peering-sets nested in it and as-sets of their peerings like
+    uncover_peeringset does without uncovering them. Returns (peering-set names, as-set names)
+    of fetched objects or None if any of them can not be fetched
+    """
+
+    walked = _cache_peeringset_walk.get(peeringset_root)
+    if walked is not None:
+        return walked
+
+    peeringset_names = set()
+    asset_names = set()
+    uncovered = {peeringset_root}
+    peeringset_level = [peeringset_root]
+
+    for peeringset_deep in range(peeringset_deep_max + 1):
+        peeringset_next = list()
+
+        for peeringset_name in peeringset_level:
+            peerings_expr = get_peeringset_expr(peeringset_name)
+            _note_resolved("peering-set", peeringset_name, peerings_expr)
+
+            if peerings_expr is None:
+                return None
+
+            peeringset_names.add(peeringset_name)
+
+            peerings_found = filter(lambda peering_match: peering_match is not None,
+                                    map(rpsllex.get_pattern("PATTERN_PEERING").search, peerings_expr))
+            peerings_defined = set(map(lambda peering_match: peering_match.group(1), peerings_found))
+
+            for asnexpr in filter(rpsllex.get_pattern("PATTERN_ASNEXPR").fullmatch, peerings_defined):
+                for token_type, token in tokenize(asnexpr):
+                    if token_type != TOK_ASSET:
+                        continue
+
+                    asset_walked = walk_asset(token)
+                    if asset_walked is None:
+                        return None
+
+                    asset_names.update(asset_walked)
+
+            if peeringset_deep < peeringset_deep_max:
+                for member in filter(is_peeringset, peerings_defined):
+                    if member not in uncovered:
+                        uncovered.add(member)
+                        peeringset_next.append(member)
+
+        peeringset_level = peeringset_next
+
+    walked = (frozenset(peeringset_names), frozenset(asset_names),)
+    _cache_peeringset_walk[peeringset_root] = walked
+
+    return walked
+
+
+class ASExprError(ValueError):
+    pass
+
+
+def _parse_asexpr(tokens, position=0):
+    """
+    Recursive descent over <as-expression> tokens, AND and EXCEPT bind
+    tighter than OR, all operators are left associative.
+    Returns (AST, next position), AST nodes are tuples (operator, left, right),
+    (TOK_ASN, int) or (TOK_ASSET, name)
+    """
+
+    def parse_factor(factor_position):
+        if len(tokens) <= factor_position:
+            raise ASExprError("unexpected end")
+
+        token_type, token_word = tokens[factor_position]
+
+        if token_type == TOK_ASN:
+            return (TOK_ASN, asn_to_int(token_word),), factor_position + 1
+        elif token_type == TOK_ASSET:
+            return (TOK_ASSET, token_word.upper(),), factor_position + 1
+        elif token_type == TOK_LPAREN:
+            factor_node, factor_position = _parse_asexpr(tokens, factor_position + 1)
+            if len(tokens) <= factor_position or tokens[factor_position][0] != TOK_RPAREN:
+                raise ASExprError("unbalanced parenthesis")
+            return factor_node, factor_position + 1
+
+        raise ASExprError("unexpected token '{}'".format(token_word))
+
+    def parse_term(term_position):
+        term_node, term_position = parse_factor(term_position)
+
+        while term_position < len(tokens) and tokens[term_position] in ((TOK_OPERATOR, "AND",),
+                                                                        (TOK_OPERATOR, "EXCEPT",),):
+            operator = tokens[term_position][1]
+            right_node, term_position = parse_factor(term_position + 1)
+            term_node = (operator, term_node, right_node,)
+
+        return term_node, term_position
+
+    expr_node, position = parse_term(position)
+
+    while position < len(tokens) and tokens[position] == (TOK_OPERATOR, "OR",):
+        right_node, position = parse_term(position + 1)
+        expr_node = ("OR", expr_node, right_node,)
+
+    return expr_node, position
+
+
+_cache_asexpr = LRUStore()
+
+
+@in_cache(_cache_asexpr)
+def compile_asexpr(peering):
+    """
+    Returns AST of the as-expression, False when it can not be parsed
+    """
+
+    peering_tokens = tokenize(peering)
 
     try:
-        asnexpr_parsed = asn_expr.parse(asn_logic)
-        asnexpr_list = asn_expr.dnf(asnexpr_parsed)
-
-        def reduce_asnexpr(_asn_list, _expr):
-            peer_asn_list = set()
-            present_asn_expr = set(filter(lambda literal: type(literal) is not asn_expr.NOT, _expr.literals))
-            present_asn = set(map(lambda asn: str(asn), present_asn_expr))
-            if 0 < len(present_asn):
-                if RE_ASSET_ANY in present_asn:
-                    return RE_ASSET_ANY
-
-                peer_asn_list = set(filter(lambda asn: re.match(RE_ASN, asn, re.IGNORECASE), present_asn))
-            return _asn_list.union(peer_asn_list)
-
-        if type(asnexpr_list) is asn_expr.OR:
-            asn_list = reduce(reduce_asnexpr, asnexpr_list.args, asn_list)
-        elif asnexpr_list == asn_expr.FALSE:
-            asn_list.clear()
-        elif asnexpr_list == asn_expr.TRUE:
-            asn_list = {RE_ASSET_ANY}
-        else:
-            asn_list = reduce_asnexpr(asn_list, asnexpr_list)
+        expr_node, position = _parse_asexpr(peering_tokens)
+        if position != len(peering_tokens):
+            raise ASExprError("trailing tokens")
+    except ASExprError:
+        return False
 
-    except boolean.ParseError:
-        asn_list.clear()
+    return expr_node
 
-    return asn_list
+
+def eval_asexpr(expr_node):
+    """
+    Set algebra over expanded as-sets: OR is union, AND is intersection,
+    EXCEPT is difference. AS-ANY is the universe, it absorbs OR, is neutral for AND,
+    empties the right side of EXCEPT and stays AS-ANY on the left side of EXCEPT.
+    Returns None if any as-set can not be fetched
+    """
+
+    node_type = expr_node[0]
+
+    if node_type == TOK_ASN:
+        return frozenset({expr_node[1]})
+    elif node_type == TOK_ASSET:
+        return uncover_asset(expr_node[1])
+
+    left = eval_asexpr(expr_node[1])
+    if left is None:
+        return None
+
+    left_any = ASN_ANY in left
+
+    if node_type == "OR" and left_any:
+        return left
+
+    right = eval_asexpr(expr_node[2])
+    if right is None:
+        return None
+
+    right_any = ASN_ANY in right
+
+    if node_type == "OR":
+        return right if right_any else left | right
+    elif node_type == "AND":
+        if left_any:
+            return right
+        return left if right_any else left & right
+
+    if right_any:
+        return frozenset()
+
+    return left if left_any else left - right
+
+
+@timed("rpsl.split_peering")
+def split_peering(peering):
+
+    if is_asn(peering):
+        return {asn_to_int(peering)}
+    elif is_asset(peering):
+        return uncover_asset(peering)
+
+    expr_node = compile_asexpr(peering)
+
+    if expr_node is False:
+        return set()
+
+    return eval_asexpr(expr_node)
 
 
 @in_cache(_cache_uncovered)
-def uncover_peeringset(peeringset_name, peeringset_deep_max=DEF_SET_DEEP_MAX, peeringset_deep=0,
+def uncover_peeringset(peeringset_name, peeringset_deep_max=DEF_PEERINGSET_DEEP_MAX, peeringset_deep=0,
                        peeringset_uncovered: set=None):
 
     uncovered = set()
@@ -202,40 +542,45 @@ def uncover_peeringset(peeringset_name, peeringset_deep_max=DEF_SET_DEEP_MAX, pe
 
     asn_list = set()
 
-    if re.fullmatch(RE_PEERINGSET, peeringset_name, re.IGNORECASE):
+    if is_peeringset(peeringset_name):
         peerings_expr = get_peeringset_expr(peeringset_name)
+        _note_resolved("peering-set", peeringset_name, peerings_expr)
 
         if peerings_expr is None:
             return None
 
-        peerings_defined = set(map(lambda _peering: re.findall(RE_PEERING, _peering, re.IGNORECASE)[0][0],
-                               peerings_expr))
+        peerings_found = filter(lambda peering_match: peering_match is not None,
+                                map(rpsllex.get_pattern("PATTERN_PEERING").search, peerings_expr))
+        peerings_defined = set(map(lambda peering_match: peering_match.group(1), peerings_found))
 
-        asnexpr_list = set(filter(lambda asnexpr_filter: re.fullmatch(RE_ASNEXPR, asnexpr_filter, re.IGNORECASE),
-                           peerings_defined))
+        asnexpr_list = set(filter(rpsllex.get_pattern("PATTERN_ASNEXPR").fullmatch, peerings_defined))
 
         def lambda_split_peering(_asnexpr_asn_list: set, asnexpr):
             if _asnexpr_asn_list is None:
                 return None
-            elif RE_ASSET_ANY in _asnexpr_asn_list:
-                return {RE_ASSET_ANY}
-            return _asnexpr_asn_list.union(split_peering(asnexpr))
+            elif ASN_ANY in _asnexpr_asn_list:
+                return {ASN_ANY}
+
+            asnexpr_asn_list = split_peering(asnexpr)
+            if asnexpr_asn_list is None:
+                return None
+
+            return _asnexpr_asn_list.union(asnexpr_asn_list)
 
         asnexpr_asn_list = reduce(lambda_split_peering, asnexpr_list, set())
 
         if asnexpr_asn_list is None:
             return None
-        elif RE_ASSET_ANY in asnexpr_asn_list:
-            return {RE_ASSET_ANY}
+        elif ASN_ANY in asnexpr_asn_list:
+            return {ASN_ANY}
 
         asn_list.update(asnexpr_asn_list)
 
         if peeringset_deep < peeringset_deep_max:
             uncovered.add(peeringset_name)
 
-            peeringset_list = set(filter(lambda peeringset_filter: re.fullmatch(RE_PEERINGSET, peeringset_filter,
-                                                                                re.IGNORECASE) and
-                                                                   peeringset_filter not in uncovered,
+            peeringset_list = set(filter(lambda peeringset_filter: peeringset_filter not in uncovered and
+                                         is_peeringset(peeringset_filter),
                                          peerings_defined))
 
             uncovered.update(peeringset_list)
@@ -243,10 +588,14 @@ def uncover_peeringset(peeringset_name, peeringset_deep_max=DEF_SET_DEEP_MAX, pe
             def lambda_uncover_peeringset(members: set, peeringset, **kwargs):
                 if members is None:
                     return members
-                elif RE_ASSET_ANY in members:
-                    return {RE_ASSET_ANY}
+                elif ASN_ANY in members:
+                    return {ASN_ANY}
+
+                peeringset_members = uncover_peeringset(peeringset, **kwargs)
+                if peeringset_members is None:
+                    return None
 
-                return members.union(uncover_peeringset(peeringset, **kwargs))
+                return members.union(peeringset_members)
 
             reduce_uncover_peeringset = partial(lambda_uncover_peeringset,
                                                 peeringset_deep_max=peeringset_deep_max,
@@ -257,50 +606,70 @@ def uncover_peeringset(peeringset_name, peeringset_deep_max=DEF_SET_DEEP_MAX, pe
 
             if peeringset_asn_list is None:
                 return None
-            elif RE_ASSET_ANY in peeringset_asn_list:
-                return {RE_ASSET_ANY}
+            elif ASN_ANY in peeringset_asn_list:
+                return {ASN_ANY}
 
             asn_list.update(peeringset_asn_list)
 
     return asn_list
 
 
+@timed("rpsl.get_peerases")
 def get_peerases(peering_rules):
 
     revar_asnexpr = 1
     asn_list = set()
 
-    adv_peering_list = re.findall(RE_IMPORT_FACTOR, peering_rules, re.IGNORECASE)
+    adv_peering_list = rpsllex.get_pattern("PATTERN_IMPORT_FACTOR").findall(peering_rules)
     import_factor_list = set(map(lambda import_factor: import_factor[revar_asnexpr], adv_peering_list))
 
-    peeringset_list = set(filter(lambda import_factor: re.match(RE_PEERINGSET, import_factor, re.IGNORECASE),
-                                 import_factor_list))
+    peeringset_list = set(filter(is_peeringset, import_factor_list))
 
     def get_peeringset_asn(_asn_list: set, peeringset):
         if _asn_list is None:
             return None
-        elif RE_ASSET_ANY in _asn_list:
-            return {RE_ASSET_ANY}
+        elif ASN_ANY in _asn_list:
+            return {ASN_ANY}
 
-        return _asn_list.union(uncover_peeringset(peeringset))
+        peeringset_asn_list = uncover_peeringset(peeringset)
+        if peeringset_asn_list is None:
+            return None
+
+        return _asn_list.union(peeringset_asn_list)
 
     asn_list = reduce(get_peeringset_asn, peeringset_list, asn_list)
 
     if asn_list is None:
         return None
-    elif RE_ASSET_ANY in asn_list:
-        return RE_ASSET_ANY
+    elif ASN_ANY in asn_list:
+        return {ASN_ANY}
 
     expression_list = import_factor_list.difference(peeringset_list)
 
     def get_asn(_asn_list: set, asnexpr):
         if _asn_list is None:
             return _asn_list
-        elif RE_ASSET_ANY in _asn_list:
-            return {RE_ASSET_ANY}
+        elif ASN_ANY in _asn_list:
+            return {ASN_ANY}
+
+        asnexpr_asn_list = split_peering(asnexpr)
+        if asnexpr_asn_list is None:
+            return None
 
-        return _asn_list.union(split_peering(asnexpr))
+        return _asn_list.union(asnexpr_asn_list)
 
     asn_list = reduce(get_asn, expression_list, asn_list)
 
     return asn_list
+
+
+def clear_cache():
+    """
+    Drops uncovered as-sets, members are taken from ripeapi again
+    """
+
+    _cache_uncovered.clear()
+    _cache_closure.clear()
+    _cache_asset_deep.clear()
+    _cache_asset_walk.clear()
+    _cache_peeringset_walk.clear()
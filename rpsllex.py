@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Precompiled RPSL patterns and a single pass tokenizer for AS expressions
+
+Each token is classified once as ASn, as-set, peering-set, operator,
+parenthesis or any other word (router expressions, keywords),
+classification of a word is memoized because the same set members
+repeat across many objects
+"""
+
+import re
+from functools import lru_cache
+
+RE_ASN = r"AS[0-9]{1,10}"
+RE_ASSET_NAME = r"AS-[A-Z0-9-_]*[A-Z0-9]"
+RE_ASSET = r"(((" + RE_ASN + r"|" + RE_ASSET_NAME + r"):)*" + RE_ASSET_NAME + r")"
+RE_ASSET_ANY = r"AS-ANY"
+
+RE_PEERINGSET_NAME = r"PRNG-[A-Z0-9-_]*[A-Z0-9]"
+RE_PEERINGSET = r"(((" + RE_ASN + r"|" + RE_ASSET_NAME + r"):)*" + RE_PEERINGSET_NAME + r")"
+
+RE_ASNEXPR = r"([\s(]*(" + RE_ASSET + "|" + RE_ASN + \
+             r")([\s)]+(OR|AND|EXCEPT)[\s(]+(" + RE_ASSET + r"|" + RE_ASN + r"))*[\s)]*)"
+
+RE_PEERING = r"(" + RE_PEERINGSET + r"|" + RE_ASNEXPR + r")"
+RE_IMPORT_FACTOR = r"(from|to)\s+" + RE_PEERING
+
+# PATTERN_* are compiled on first use by the module __getattr__, a run served
+# from the cache or --help does not pay for the big concatenated expressions
+_pattern_sources = {"PATTERN_ASN": RE_ASN,
+                    "PATTERN_ASSET": RE_ASSET,
+                    "PATTERN_PEERINGSET": RE_PEERINGSET,
+                    "PATTERN_ASNEXPR": RE_ASNEXPR,
+                    "PATTERN_PEERING": RE_PEERING,
+                    "PATTERN_IMPORT_FACTOR": RE_IMPORT_FACTOR}
+
+_PATTERN_TOKEN = re.compile(r"[()]|[^\s()]+")
+
+TOK_ASN = "asn"
+TOK_ASSET = "as-set"
+TOK_PEERINGSET = "peering-set"
+TOK_OPERATOR = "operator"
+TOK_LPAREN = "("
+TOK_RPAREN = ")"
+TOK_WORD = "word"
+
+OPERATORS = ("OR", "AND", "EXCEPT",)
+
+# ASn are ints inside the pipeline, AS-ANY is the reserved last 32-bit ASn
+ASN_ANY = 4294967295
+
+DEF_CLASSIFY_CACHE = 1 << 18
+
+
+def __getattr__(name):
+
+    if name not in _pattern_sources:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+    pattern = re.compile(_pattern_sources[name], re.IGNORECASE)
+    globals()[name] = pattern
+
+    return pattern
+
+
+def get_pattern(name):
+    """
+    Returns compiled PATTERN_* by name
+    """
+
+    return globals().get(name) or __getattr__(name)
+
+
+@lru_cache(maxsize=DEF_CLASSIFY_CACHE)
+def classify(word):
+
+    if get_pattern("PATTERN_ASN").fullmatch(word):
+        return TOK_ASN
+    elif get_pattern("PATTERN_ASSET").fullmatch(word):
+        return TOK_ASSET
+    elif get_pattern("PATTERN_PEERINGSET").fullmatch(word):
+        return TOK_PEERINGSET
+    elif word.upper() in OPERATORS:
+        return TOK_OPERATOR
+    elif word == TOK_LPAREN:
+        return TOK_LPAREN
+    elif word == TOK_RPAREN:
+        return TOK_RPAREN
+
+    return TOK_WORD
+
+
+def is_asn(word):
+    return classify(word) == TOK_ASN
+
+
+def is_asset(word):
+    return classify(word) == TOK_ASSET
+
+
+def is_peeringset(word):
+    return classify(word) == TOK_PEERINGSET
+
+
+def asn_to_int(word):
+    return int(word[2:])
+
+
+def parse_asn(text):
+    """
+    Returns ASn int if the whole text is a 32-bit ASn or None, longer numbers are not cut
+    """
+
+    if get_pattern("PATTERN_ASN").fullmatch(text) is None:
+        return None
+
+    asn = asn_to_int(text)
+
+    return asn if asn < ASN_ANY else None
+
+
+def format_asn(asn):
+
+    if asn == ASN_ANY:
+        return RE_ASSET_ANY
+
+    return "AS{}".format(asn)
+
+
+def tokenize(text):
+    """
+    Returns list of (token type, token) pairs, operators are upper cased
+    """
+
+    tokens = list()
+
+    for word in _PATTERN_TOKEN.findall(text):
+        word_type = classify(word)
+        if word_type == TOK_OPERATOR:
+            word = word.upper()
+        tokens.append((word_type, word,))
+
+    return tokens
+
+
+def find_tokens(text, token_type):
+
+    return set(map(lambda token: token[1], filter(lambda token: token[0] == token_type, tokenize(text))))
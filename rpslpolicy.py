@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled RPSL policies of aut-num objects
+
+import, export, default and their mp- forms are parsed once into a tree
+of named tuples with filters, actions, braces, EXCEPT and REFINE kept,
+so peers and filters for a peer are found without parsing the text again.
+Compiled lines and compiled aut-num objects are pickled into the persistent cache,
+a repeat run does not parse at all.
+
+<policy> ::= [protocol <protocol>] [into <protocol>] [afi <afi-list>] <expression>
+<expression> ::= <term> | <term> EXCEPT <expression> | <term> REFINE <expression>
+<term> ::= <factor> | { <factor> ; ... <factor> [;] }
+<factor> ::= from|to <peering> [action <action>] ... from|to <peering> [action <action>]
+             [accept|announce|networks <filter>] [;]
+"""
+
+import re
+from collections import namedtuple
+from functools import reduce
+
+import rpsl
+from utils import in_cache
+from cache import CacheStore
+from rpsllex import ASN_ANY, TOK_ASN, TOK_ASSET, TOK_OPERATOR, TOK_LPAREN, TOK_RPAREN, TOK_PEERINGSET, \
+    classify
+
+# <peering-set> or <as-expression> [<router-expression-1>] [at <router-expression-2>]
+PolicyPeering = namedtuple("PolicyPeering", ("peeringset", "asexpr", "router", "router_at",))
+PolicyFactor = namedtuple("PolicyFactor", ("peerings", "actions", "filter_keyword", "filter",))
+Policy = namedtuple("Policy", ("protocol", "into", "afi", "terms",))
+
+POLICY_ATTRIBUTES = ("import", "export", "default", "mp-import", "mp-export", "mp-default",)
+
+OPERATOR_EXCEPT = "EXCEPT"
+OPERATOR_REFINE = "REFINE"
+
+_PATTERN_POLICY_TOKEN = re.compile(r"[{};()]|<[^>]*>|[^\s{};<()]+")
+
+_kw_peering = ("from", "to",)
+_kw_filter = ("accept", "announce", "networks",)
+_kw_action = "action"
+_kw_at = "at"
+_kw_operators = (OPERATOR_EXCEPT, OPERATOR_REFINE,)
+_kw_options = ("protocol", "into", "afi",)
+_asexpr_tokens = (TOK_ASN, TOK_ASSET, TOK_OPERATOR, TOK_LPAREN, TOK_RPAREN,)
+
+_cache_policy = CacheStore("rpsl-policy")
+_cache_autnum = CacheStore("rpsl-autnum")
+
+
+class PolicyError(ValueError):
+    pass
+
+
+class _PolicyParser:
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = list(map(lambda match: (match.group(0), match.start(), match.end(),),
+                               _PATTERN_POLICY_TOKEN.finditer(text)))
+        self.position = 0
+
+    def peek(self):
+
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+
+        return None
+
+    def peek_keyword(self):
+
+        token = self.peek()
+        return None if token is None else token.lower()
+
+    def is_expression_operator(self):
+        """
+        REFINE is always an operator of the policy expression, EXCEPT only
+        before a term, otherwise it is the as-expression operator
+        """
+
+        token = self.peek()
+        if token is None or token.upper() not in _kw_operators:
+            return False
+        elif token.upper() == OPERATOR_REFINE:
+            return True
+
+        following = self.tokens[self.position + 1][0] if self.position + 1 < len(self.tokens) else None
+
+        return following is None or following == "{" or following.lower() in _kw_peering + _kw_options
+
+    def take(self):
+
+        token = self.peek()
+        if token is None:
+            raise PolicyError("unexpected end of policy")
+
+        self.position += 1
+        return token
+
+    def take_text(self, is_end):
+        """
+        Returns source text of tokens up to the first one is_end() is true for out of braces
+        """
+
+        depth = 0
+        start = self.position
+
+        while self.peek() is not None:
+            token = self.peek()
+
+            if depth == 0 and is_end(token):
+                break
+            elif token == "{":
+                depth += 1
+            elif token == "}":
+                if depth == 0:
+                    break
+                depth -= 1
+
+            self.position += 1
+
+        if start == self.position:
+            return ""
+
+        return self.text[self.tokens[start][1]:self.tokens[self.position - 1][2]]
+
+    def parse_peering(self):
+
+        start = self.position
+        words = list()
+
+        while self.peek() is not None:
+            token = self.peek()
+            keyword = token.lower()
+
+            if token in ("{", "}", ";",) or keyword in _kw_peering or keyword in _kw_filter or \
+                    keyword == _kw_action or self.is_expression_operator():
+                break
+
+            words.append(self.take())
+
+        if len(words) == 0:
+            raise PolicyError("empty peering")
+
+        def get_text(first, last):
+            return self.text[self.tokens[start + first][1]:self.tokens[start + last - 1][2]]
+
+        if len(words) == 1 and classify(words[0]) == TOK_PEERINGSET:
+            return PolicyPeering(words[0].upper(), None, None, None)
+
+        asexpr_end = 0
+        while asexpr_end < len(words) and classify(words[asexpr_end]) in _asexpr_tokens:
+            asexpr_end += 1
+
+        while 0 < asexpr_end and classify(words[asexpr_end - 1]) == TOK_OPERATOR:
+            asexpr_end -= 1
+
+        if asexpr_end == 0:
+            raise PolicyError("peering without as-expression")
+
+        router_end = len(words)
+        router_at = None
+
+        if _kw_at in map(str.lower, words[asexpr_end:]):
+            router_end = list(map(str.lower, words)).index(_kw_at, asexpr_end)
+            if router_end + 1 < len(words):
+                router_at = get_text(router_end + 1, len(words))
+
+        router = get_text(asexpr_end, router_end) if asexpr_end < router_end else None
+
+        return PolicyPeering(None, get_text(0, asexpr_end), router, router_at)
+
+    def parse_factor(self):
+
+        peerings = list()
+        actions = list()
+
+        while self.peek_keyword() in _kw_peering:
+            self.take()
+            peerings.append(self.parse_peering())
+
+            action = None
+            if self.peek_keyword() == _kw_action:
+                self.take()
+                action = self.take_text(lambda token: token.lower() in _kw_peering or token.lower() in _kw_filter)
+
+            actions.append(action)
+
+        if len(peerings) == 0:
+            raise PolicyError("factor without peering")
+
+        filter_keyword = None
+        filter_text = None
+
+        if self.peek_keyword() in _kw_filter:
+            filter_keyword = self.take().lower()
+            filter_text = self.take_text(lambda token: token == ";" or self.is_expression_operator())
+
+        if self.peek() == ";":
+            self.take()
+
+        return PolicyFactor(tuple(peerings), tuple(actions), filter_keyword, filter_text)
+
+    def parse_term(self):
+
+        if self.peek() != "{":
+            return self.parse_factor(),
+
+        self.take()
+        factors = list()
+
+        while self.peek() != "}":
+            if self.peek() is None:
+                raise PolicyError("unclosed term")
+            factors.append(self.parse_factor())
+
+        self.take()
+
+        return tuple(factors)
+
+    def parse_policy(self):
+
+        options = {"protocol": None, "into": None, "afi": None}
+
+        while self.peek_keyword() in options:
+            option = self.take().lower()
+            if option == "afi":
+                afi_list = [self.take()]
+                while afi_list[-1].endswith(",") or self.peek() is not None and self.peek().startswith(","):
+                    afi_list.append(self.take())
+                options[option] = "".join(afi_list).lower()
+            else:
+                options[option] = self.take()
+
+        terms = [(None, self.parse_term(),)]
+
+        while self.is_expression_operator():
+            operator = self.take().upper()
+            terms.append((operator, self.parse_term(),))
+
+        if self.peek() is not None:
+            raise PolicyError("unexpected '{}'".format(self.peek()))
+
+        return Policy(options["protocol"], options["into"], options["afi"], tuple(terms))
+
+
+@in_cache(_cache_policy)
+def compile_policy(policy_text):
+    """
+    Returns Policy of an import, export or default line, False if the line is not parsable
+    """
+
+    try:
+        return _PolicyParser(policy_text).parse_policy()
+    except PolicyError:
+        return False
+
+
+def compile_autnum(whois_object):
+    """
+    Returns dict of attribute to tuple of (policy text, Policy or False) of the aut-num
+    """
+
+    return dict(map(lambda attribute: (attribute, tuple(map(lambda policy_text: (policy_text,
+                                                                                 compile_policy(policy_text),),
+                                                            sorted(whois_object.get(attribute, ()))))),
+                    POLICY_ATTRIBUTES))
+
+
+def _is_compiled_from(autnum_policy, whois_object):
+
+    return all(map(lambda attribute: tuple(map(lambda policy_line: policy_line[0], autnum_policy[attribute])) ==
+                   tuple(sorted(whois_object.get(attribute, ()))), POLICY_ATTRIBUTES))
+
+
+def find_autnum_policy(asn):
+    """
+    Returns compiled aut-num of the ASn kept by get_autnum_policy or None
+    """
+
+    try:
+        return _cache_autnum[asn]
+    except KeyError:
+        return None
+
+
+def store_autnum_policy(asn, autnum_policy):
+    """
+    Keeps aut-num of the ASn compiled elsewhere, like in a forked worker, for get_autnum_policy
+    """
+
+    _cache_autnum[asn] = autnum_policy
+
+
+def get_autnum_policy(asn, whois_object):
+    """
+    compile_autnum of the aut-num object of the ASn cached per ASn,
+    the aut-num is compiled again when its policy lines are changed
+    """
+
+    autnum_policy = find_autnum_policy(asn)
+
+    if autnum_policy is None or not _is_compiled_from(autnum_policy, whois_object):
+        autnum_policy = compile_autnum(whois_object)
+        _cache_autnum[asn] = autnum_policy
+
+    return autnum_policy
+
+
+def iter_peerings(policy):
+    """
+    Generator of (factor, peering) pairs over all terms of the policy
+    """
+
+    for _, factors in policy.terms:
+        for factor in factors:
+            for peering in factor.peerings:
+                yield factor, peering
+
+
+def get_peering_asn(peering):
+    """
+    Returns set of ASn of the peering, {ASN_ANY} or None on RIPE error
+    """
+
+    if peering.peeringset is not None:
+        return rpsl.uncover_peeringset(peering.peeringset)
+
+    return rpsl.split_peering(peering.asexpr)
+
+
+def get_policy_peers(policy):
+    """
+    Returns set of ASn of all peerings of the policy, {ASN_ANY} or None on RIPE error
+    """
+
+    def lambda_get_peers(asn_list, peering):
+        if asn_list is None:
+            return None
+        elif ASN_ANY in asn_list:
+            return {ASN_ANY}
+
+        peering_asn_list = get_peering_asn(peering)
+        if peering_asn_list is None:
+            return None
+        elif ASN_ANY in peering_asn_list:
+            return {ASN_ANY}
+
+        return asn_list.union(peering_asn_list)
+
+    return reduce(lambda_get_peers, set(map(lambda item: item[1], iter_peerings(policy))), set())
+
+
+def get_line_peers(policy_line):
+    """
+    get_peerases of a (policy text, Policy or False) line of compile_autnum, lines
+    the parser does not accept are still searched by rpsl.get_peerases
+    """
+
+    policy_text, policy = policy_line
+
+    if policy is False:
+        return rpsl.get_peerases(policy_text)
+
+    return get_policy_peers(policy)
+
+
+def get_record_peers(policy_text):
+    """
+    get_peerases of a policy line through its compiled policy
+    """
+
+    return get_line_peers((policy_text, compile_policy(policy_text),))
+
+
+def get_autnum_peerings(autnum_policy):
+    """
+    Returns list of (attribute, policy text, filter keyword, filter, action, set of peering ASn)
+    of every peering of compiled aut-num policies, lines the parser does not accept are skipped,
+    None on RIPE error. Filters for any peer are selected from it without RIPE requests
+    """
+
+    autnum_peerings = list()
+
+    for attribute in POLICY_ATTRIBUTES:
+        for policy_text, policy in autnum_policy[attribute]:
+            if policy is False:
+                continue
+
+            for factor, peering in iter_peerings(policy):
+                peering_asn_list = get_peering_asn(peering)
+                if peering_asn_list is None:
+                    return None
+
+                autnum_peerings.append((attribute, policy_text, factor.filter_keyword, factor.filter,
+                                        factor.actions[factor.peerings.index(peering)], peering_asn_list,))
+
+    return autnum_peerings
+
+
+def select_peer_filters(autnum_peerings, asn):
+    """
+    Returns list of (attribute, policy text, filter keyword, filter, action) of get_autnum_peerings
+    with a peering that includes the peer ASn
+    """
+
+    autnum_filters = list()
+
+    for autnum_peering in autnum_peerings:
+        if asn in autnum_peering[5] or ASN_ANY in autnum_peering[5]:
+            if autnum_peering[:5] not in autnum_filters:
+                autnum_filters.append(autnum_peering[:5])
+
+    return autnum_filters
+
+
+def get_autnum_filters(autnum_policy, asn):
+    """
+    Returns select_peer_filters of compiled aut-num policies for the peer ASn, None on RIPE error
+    """
+
+    autnum_peerings = get_autnum_peerings(autnum_policy)
+    if autnum_peerings is None:
+        return None
+
+    return select_peer_filters(autnum_peerings, asn)
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot of expanded as-set closures and ASn neighbours
+
+A snapshot is a versioned binary file of sorted uint32 arrays: as-set names with
+the offsets of their closures in one array of ASn, and neighbour ASn with
+the offsets of their peers, powers and types. The file is mapped with mmap
+and read in place, so a snapshot of all RIPE as-sets opens in milliseconds,
+pages are shared by every process that maps it and nothing is parsed.
+rpsl and ripeapi answer from a snapshot after use_snapshot()
+"""
+
+import sys
+import os
+import getopt
+import fileinput
+import mmap
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+import rpsl
+import ripeapi
+import fetch
+import cache
+import ripedb
+from rpsllex import ASN_ANY, is_asn, is_asset, asn_to_int, format_asn
+
+USAGE_MSG = """
+Build snapshot of as-set closures and ASn neighbours
+(c) elsv-v.ru 2018
+
+Usage:
+    snapshot.py [-w <workers>] [-r <rate>] [-c <cache> [-o]] [-d <index>] <snapshot> [<file>|-]
+    snapshot.py -I <snapshot>
+
+Options:
+    -w|--workers <workers> - Number of concurrent RIPE requests, default is %d
+    -r|--rate <rate> - Max RIPE requests per second, default is %g
+    -c|--cache <cache> - Keep RIPE responses in SQLite file <cache> between runs
+    -o|--offline - Use only responses from the cache, make no RIPE requests
+    -d|--dump <index> - Look for as-set objects in index of RIPE DB dumps made by ripedb.py,
+                        all as-sets of the index are expanded if no input file is given
+    -I|--info - Print version, creation time and sizes of the snapshot
+
+Input file (or -) has an as-set name or an ASn in each line, full closures
+of as-sets and neighbours of ASn are stored
+"""
+
+SUCCESS = 0
+ERR_IO = 2
+ERR_GETOPT = 3
+ERR_GETASN = 4
+
+SNAPSHOT_MAGIC = b"ELSVSNAP"
+SNAPSHOT_VERSION = 1
+
+NEIGHBOUR_TYPES = ("left", "right", "uncertain",)
+
+SECTIONS = ("set_name_offsets", "set_names", "set_offsets", "set_members",
+            "neighbour_asns", "neighbour_offsets", "neighbour_peers", "neighbour_power", "neighbour_types",)
+
+_section_types = {"set_names": "B", "neighbour_types": "B"}
+
+# magic, version, flags, creation time, then offset and items of every section
+_header = struct.Struct("<8sIIQ" + "QQ" * len(SECTIONS))
+
+_alignment = 8
+
+
+class SnapshotError(IOError):
+    pass
+
+
+def _get_typecode(section):
+
+    return _section_types.get(section, "I")
+
+
+def write_snapshot(snapshot_name, closures, neighbours):
+    """
+    Writes dict of as-set name to ASn closure and dict of ASn to list of (ASn, type, power)
+    as in ripeapi.get_neighbours_power. Neighbours of unknown types are not stored.
+    The file is replaced at once, processes that mapped the old one keep reading it
+    """
+
+    set_names = sorted(map(str.upper, closures))
+    closures = dict(map(lambda item: (item[0].upper(), item[1],), closures.items()))
+
+    sections = dict(map(lambda section: (section, array(_get_typecode(section)),), SECTIONS))
+    sections["set_name_offsets"].append(0)
+    sections["set_offsets"].append(0)
+    sections["neighbour_offsets"].append(0)
+
+    for set_name in set_names:
+        sections["set_names"].frombytes(set_name.encode("ascii"))
+        sections["set_name_offsets"].append(len(sections["set_names"]))
+        sections["set_members"].extend(sorted(closures[set_name]))
+        sections["set_offsets"].append(len(sections["set_members"]))
+
+    for asn in sorted(neighbours):
+        peers = sorted(filter(lambda neighbour: neighbour[1] in NEIGHBOUR_TYPES, neighbours[asn]))
+
+        sections["neighbour_asns"].append(asn)
+        sections["neighbour_peers"].extend(map(lambda neighbour: neighbour[0], peers))
+        sections["neighbour_types"].extend(map(lambda neighbour: NEIGHBOUR_TYPES.index(neighbour[1]), peers))
+        sections["neighbour_power"].extend(map(lambda neighbour: neighbour[2], peers))
+        sections["neighbour_offsets"].append(len(sections["neighbour_peers"]))
+
+    if sys.byteorder != "little":
+        for section_array in sections.values():
+            section_array.byteswap()
+
+    header_fields = list()
+    section_offset = _header.size
+
+    for section in SECTIONS:
+        section_offset += -section_offset % _alignment
+        header_fields.extend((section_offset, len(sections[section]),))
+        section_offset += len(sections[section]) * sections[section].itemsize
+
+    snapshot_tmp = snapshot_name + ".tmp"
+
+    with open(snapshot_tmp, "wb") as snapshot_file:
+        snapshot_file.write(_header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, int(time.time()), *header_fields))
+
+        for section in SECTIONS:
+            snapshot_file.write(bytes(-snapshot_file.tell() % _alignment))
+            sections[section].tofile(snapshot_file)
+
+    os.replace(snapshot_tmp, snapshot_name)
+
+
+class Snapshot:
+    """
+    Read-only snapshot mapped into memory, lookups read the mapped arrays in place.
+    get_closure() gives a memoryview of sorted ASn without a copy, get_asset() a frozenset
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as snapshot_file:
+            try:
+                self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(0, "Empty snapshot", path)
+
+        try:
+            header = _header.unpack_from(self._map)
+        except struct.error:
+            self._map.close()
+            raise SnapshotError(0, "Not a snapshot", path)
+
+        magic, self.version, _, self.created = header[:4]
+
+        if magic != SNAPSHOT_MAGIC or self.version != SNAPSHOT_VERSION:
+            self._map.close()
+            raise SnapshotError(0, "Not a snapshot of version {}".format(SNAPSHOT_VERSION), path)
+
+        snapshot_view = self._view = memoryview(self._map)
+        self._sections = dict()
+
+        for section_num, section in enumerate(SECTIONS):
+            section_offset, section_items = header[4 + section_num * 2:6 + section_num * 2]
+            typecode = _get_typecode(section)
+            section_view = snapshot_view[section_offset:section_offset + section_items * struct.calcsize(typecode)]
+
+            if sys.byteorder != "little":
+                section_array = array(typecode, section_view)
+                section_array.byteswap()
+                self._sections[section] = section_array
+            else:
+                self._sections[section] = section_view.cast(typecode)
+
+        self._set_name_offsets = self._sections["set_name_offsets"]
+        self._set_names = self._sections["set_names"]
+        self._set_offsets = self._sections["set_offsets"]
+        self._set_members = self._sections["set_members"]
+        self._neighbour_asns = self._sections["neighbour_asns"]
+        self._neighbour_offsets = self._sections["neighbour_offsets"]
+
+    def _get_set_name(self, set_num):
+
+        return bytes(self._set_names[self._set_name_offsets[set_num]:self._set_name_offsets[set_num + 1]])
+
+    def _find_set(self, set_name):
+
+        try:
+            set_key = set_name.upper().encode("ascii")
+        except UnicodeEncodeError:
+            return None
+
+        low = 0
+        high = len(self._set_offsets) - 1
+
+        while low < high:
+            middle = (low + high) // 2
+            if self._get_set_name(middle) < set_key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < len(self._set_offsets) - 1 and self._get_set_name(low) == set_key:
+            return low
+
+        return None
+
+    def get_closure(self, set_name):
+        """
+        Returns memoryview of sorted ASn of the as-set closure or None if it is not in the snapshot
+        """
+
+        set_num = self._find_set(set_name)
+        if set_num is None:
+            return None
+
+        return self._set_members[self._set_offsets[set_num]:self._set_offsets[set_num + 1]]
+
+    def get_asset(self, set_name):
+        """
+        Returns frozenset of ASn like rpsl.uncover_asset or None if it is not in the snapshot
+        """
+
+        closure = self.get_closure(set_name)
+        if closure is None:
+            return None
+
+        return frozenset(closure)
+
+    def has_member(self, set_name, asn):
+        """
+        Returns True if the ASn is in the as-set closure, None if the as-set is not in the snapshot
+        """
+
+        closure = self.get_closure(set_name)
+        if closure is None:
+            return None
+
+        if 0 < len(closure) and closure[-1] == ASN_ANY:
+            return True
+
+        member_num = bisect_left(closure, asn)
+
+        return member_num < len(closure) and closure[member_num] == asn
+
+    def get_neighbours_power(self, asn):
+        """
+        Returns list of (ASn, type, power) like ripeapi.get_neighbours_power or None if the ASn is not in the snapshot
+        """
+
+        asn_num = bisect_left(self._neighbour_asns, asn)
+        if len(self._neighbour_asns) <= asn_num or self._neighbour_asns[asn_num] != asn:
+            return None
+
+        start = self._neighbour_offsets[asn_num]
+        end = self._neighbour_offsets[asn_num + 1]
+
+        return list(zip(self._sections["neighbour_peers"][start:end],
+                        map(NEIGHBOUR_TYPES.__getitem__, self._sections["neighbour_types"][start:end]),
+                        self._sections["neighbour_power"][start:end]))
+
+    def get_stats(self):
+
+        return {"version": self.version, "created": self.created, "sets": len(self._set_offsets) - 1,
+                "members": len(self._set_members), "neighbour_asns": len(self._neighbour_asns),
+                "neighbours": len(self._sections["neighbour_peers"]), "bytes": len(self._map)}
+
+    def close(self):
+        """
+        Unmaps the file, memoryviews from get_closure() must be released before
+        """
+
+        for section_view in self._sections.values():
+            if isinstance(section_view, memoryview):
+                section_view.release()
+
+        self._sections.clear()
+        self._set_name_offsets = self._set_names = self._set_offsets = self._set_members = None
+        self._neighbour_asns = self._neighbour_offsets = None
+
+        self._view.release()
+        self._map.close()
+
+
+def read_objects(input_flow_name):
+    """
+    Returns (as-set names, ASn names) from the input, one object in each line
+    """
+
+    assets = set()
+    asns = set()
+
+    for line in fileinput.input(input_flow_name):
+        object_name = line.strip().upper()
+
+        if is_asn(object_name):
+            asns.add(format_asn(asn_to_int(object_name)))
+        elif is_asset(object_name):
+            assets.add(object_name)
+
+    return sorted(assets), sorted(asns)
+
+
+def build_snapshot(snapshot_name, assets, asns, workers=fetch.DEF_WORKERS):
+    """
+    Expands as-sets and fetches neighbours of ASn, writes the snapshot, returns list of objects
+    failed on RIPE error, they are not stored
+    """
+
+    closures = dict()
+    neighbours = dict()
+    failed = list()
+
+    for asset_name, closure in fetch.fetch_stream(assets, rpsl.uncover_asset, workers=workers):
+        if closure is None:
+            failed.append(asset_name)
+        else:
+            closures[asset_name] = closure
+
+    for asn_name, neighbours_power in fetch.fetch_stream(asns, ripeapi.get_neighbours_power, workers=workers):
+        if neighbours_power is None:
+            failed.append(asn_name)
+        else:
+            neighbours[asn_to_int(asn_name)] = neighbours_power
+
+    write_snapshot(snapshot_name, closures, neighbours)
+
+    return failed
+
+
+def main():
+
+    opt_list = "w:r:c:od:I"
+    lopt_list = ("workers=", "rate=", "cache=", "offline", "dump=", "info",)
+
+    opt_workers = fetch.DEF_WORKERS
+    cache_name = None
+    dump_name = None
+    dump_index = None
+    opt_offline = False
+    opt_info = False
+
+    err_id = SUCCESS
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], opt_list, lopt_list)
+
+        for opt, arg in opts:
+            if opt in ("-w", "--workers"):
+                opt_workers = int(arg)
+                if opt_workers < 1:
+                    raise getopt.GetoptError("workers must be positive", opt)
+            elif opt in ("-r", "--rate"):
+                opt_rate = float(arg)
+                if opt_rate <= 0:
+                    raise getopt.GetoptError("rate must be positive", opt)
+                ripeapi.configure(rate=opt_rate, burst=max(1, int(opt_rate * 2)))
+            elif opt in ("-c", "--cache"):
+                cache_name = arg
+            elif opt in ("-o", "--offline"):
+                opt_offline = True
+            elif opt in ("-d", "--dump"):
+                dump_name = arg
+            elif opt in ("-I", "--info"):
+                opt_info = True
+
+        if opt_offline and cache_name is None:
+            raise getopt.GetoptError("offline mode requires cache", "offline")
+
+        if len(args) < 1 or 2 < len(args) or opt_info and len(args) != 1:
+            raise getopt.GetoptError("snapshot is required")
+
+        if len(args) == 1 and dump_name is None and not opt_info:
+            raise getopt.GetoptError("input file or dump index is required")
+
+        if opt_info:
+            snapshot = Snapshot(args[0])
+            for stat_name, stat_value in snapshot.get_stats().items():
+                print("{:<16} {}".format(stat_name, stat_value))
+            snapshot.close()
+            return err_id
+
+        if cache_name is not None:
+            cache.open_cache(cache_name, offline=opt_offline)
+
+        if dump_name is not None:
+            dump_index = ripedb.DumpIndex(dump_name)
+            ripeapi.use_dump(dump_index)
+
+        if len(args) == 2:
+            assets, asns = read_objects(args[1])
+        else:
+            assets, asns = dump_index.get_names("as-set"), list()
+
+        failed = build_snapshot(args[0], assets, asns, opt_workers)
+
+        if 0 < len(failed):
+            print("Not stored because of RIPE errors: {}".format(", ".join(failed)), file=sys.stderr)
+            err_id = ERR_GETASN
+
+    except IOError as err:
+        print("Snapshot error: {}".format(err), file=sys.stderr)
+        err_id = ERR_IO
+
+    except (getopt.GetoptError, ValueError):
+        print(USAGE_MSG % (fetch.DEF_WORKERS, ripeapi.DEF_RATE))
+        err_id = ERR_GETOPT
+
+    finally:
+        fileinput.close()
+        cache.close_cache()
+        ripeapi.use_dump(None)
+
+        if dump_index is not None:
+            dump_index.close()
+
+    return err_id
+
+
+if __name__ == '__main__':
+    exit(main())
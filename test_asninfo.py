@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ASn node attributes, RIPE data is served by a local RIPE stub
+"""
+
+import unittest
+
+import asninfo
+import ripeapi
+from ripestub import RipeStub
+
+
+def make_path_stat(number, location, count, length_sum, length_min, length_max):
+
+    return {"number": number, "location": location, "count": count,
+            "stripped": {"sum": length_sum, "min": length_min, "max": length_max,
+                         "avg": round(length_sum / count, 2) if 0 < count else 0}}
+
+
+class PrefixSummaryTest(unittest.TestCase):
+
+    def test_summary(self):
+
+        self.assertEqual(asninfo.get_prefix_summary(["192.0.2.0/24", "192.0.2.128/25", "198.51.100.0/24",
+                                                     "2001:db8::/32", "2001:db8:1::/48", "not a prefix"]),
+                         {"ipv4_prefixes": 3, "ipv6_prefixes": 2, "ipv4_addresses": 512, "ipv6_48": 65536})
+
+
+class PathLengthTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = RipeStub()
+        self.stub.path_stats = {"AS1": [make_path_stat(0, "Amsterdam", 4, 10, 2, 4),
+                                        make_path_stat(1, "London", 6, 18, 2, 5)],
+                                "AS2": [make_path_stat(0, "Amsterdam", 3, 9, 3, 3)],
+                                "AS3": []}
+        self.stub.prefixes = {"AS1": ["192.0.2.0/24"], "AS2": [], "AS3": []}
+        self.stub.failing.add("AS4")
+        self.stub.start()
+
+    def tearDown(self):
+
+        self.stub.stop()
+
+    def test_path_count(self):
+
+        self.assertEqual(ripeapi.get_as_path_length("AS1"), [("Amsterdam", 4, 10, 2, 4,), ("London", 6, 18, 2, 5,)])
+
+    def test_summary(self):
+
+        self.assertEqual(asninfo.get_path_length_summary(ripeapi.get_as_path_length("AS1")),
+                         {"path_length": 2.8, "path_length_max": 5})
+
+    def test_first_collector_only(self):
+
+        self.assertEqual(asninfo.get_path_length_summary(ripeapi.get_as_path_length("AS2")),
+                         {"path_length": 3.0, "path_length_max": 3})
+
+    def test_no_paths(self):
+
+        self.assertEqual(asninfo.get_path_length_summary(ripeapi.get_as_path_length("AS3")),
+                         {"path_length": None, "path_length_max": None})
+
+    def test_asn_info_many(self):
+
+        asn_info = asninfo.get_asn_info_many({1, 2, 4}, workers=2)
+
+        self.assertEqual(sorted(asn_info), [1, 2])
+        self.assertEqual(asn_info[1]["path_length"], 2.8)
+        self.assertEqual(asn_info[2], {"ipv4_prefixes": 0, "ipv6_prefixes": 0, "ipv4_addresses": 0, "ipv6_48": 0,
+                                       "path_length": 3.0, "path_length_max": 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of cache stores backed by an SQLite file
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import cache
+import ripeapi
+from cache import CacheStore
+from ripestub import RipeStub
+from utils import in_cache
+
+DEF_TTL = 60
+
+_cache_test = CacheStore("test", DEF_TTL)
+_responses = {"values": dict(), "calls": 0}
+
+
+@in_cache(_cache_test)
+def get_value(key):
+
+    _responses["calls"] += 1
+
+    return _responses["values"].get(key)
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_name = os.path.join(self.temp_dir.name, "cache.sqlite")
+
+        _responses["values"] = {"one": 1, "two": 2}
+        _responses["calls"] = 0
+
+        cache.open_cache(self.cache_name)
+
+    def tearDown(self):
+
+        cache.close_cache()
+        cache.clear_stores()
+        self.temp_dir.cleanup()
+
+    def reopen(self, offline=False):
+
+        cache.close_cache()
+        cache.open_cache(self.cache_name, offline=offline)
+
+
+class TTLTest(CacheTestCase):
+
+    def test_served_from_file(self):
+
+        self.assertEqual(get_value("one"), 1)
+        self.reopen()
+
+        self.assertEqual(get_value("one"), 1)
+        self.assertEqual(_responses["calls"], 1)
+
+    def test_expired(self):
+
+        self.assertEqual(get_value("one"), 1)
+        self.reopen()
+
+        _responses["values"]["one"] = 10
+
+        with mock.patch.object(cache.time, "time", return_value=time.time() + DEF_TTL + 1):
+            self.assertEqual(get_value("one"), 10)
+
+        self.assertEqual(_responses["calls"], 2)
+
+    def test_stale_on_error(self):
+
+        self.assertEqual(get_value("one"), 1)
+        self.reopen()
+
+        _responses["values"].clear()
+
+        with mock.patch.object(cache.time, "time", return_value=time.time() + DEF_TTL + 1):
+            self.assertEqual(get_value("one"), 1)
+            self.assertIsNone(get_value("two"))
+
+        self.assertEqual(_responses["calls"], 3)
+
+    def test_expire(self):
+
+        self.assertEqual(get_value("one"), 1)
+        _cache_test.expire("one")
+        self.reopen()
+
+        self.assertEqual(get_value("one"), 1)
+        self.assertEqual(_responses["calls"], 2)
+
+
+class OfflineTest(CacheTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.stub = RipeStub()
+        self.stub.whois = {"AS1": [("import", "from AS2 accept ANY")]}
+        self.stub.start()
+
+    def tearDown(self):
+
+        self.stub.stop()
+
+        super().tearDown()
+
+    def test_expired_served(self):
+
+        self.assertEqual(get_value("one"), 1)
+        self.reopen(offline=True)
+
+        with mock.patch.object(cache.time, "time", return_value=time.time() + DEF_TTL + 1):
+            self.assertEqual(get_value("one"), 1)
+
+        self.assertTrue(cache.is_offline())
+        self.assertEqual(_responses["calls"], 1)
+
+    def test_no_requests(self):
+
+        self.assertEqual(ripeapi.get_whois_top("AS1")["import"], {"from AS2 accept ANY"})
+        self.reopen(offline=True)
+
+        self.assertEqual(ripeapi.get_whois_top("AS1")["import"], {"from AS2 accept ANY"})
+        self.assertIsNone(ripeapi.get_neighbours_power("AS1"))
+        self.assertEqual(self.stub.calls, {"whois": 1})
+
+
+class AccessedTest(CacheTestCase):
+
+    def get_accessed(self):
+
+        with sqlite3.connect(self.cache_name) as db:
+            return dict(db.execute("SELECT resource, accessed FROM cache").fetchall())
+
+    def test_written_in_batches(self):
+
+        get_value("one")
+        get_value("two")
+        accessed = self.get_accessed()
+
+        self.reopen()
+
+        with mock.patch.object(cache.time, "time", return_value=time.time() + 10):
+            for _ in range(3):
+                self.assertEqual(get_value("one"), 1)
+                cache.clear_stores()
+
+            self.assertEqual(self.get_accessed(), accessed)
+
+            cache.close_cache()
+
+        self.assertLess(accessed["one"], self.get_accessed()["one"])
+        self.assertEqual(accessed["two"], self.get_accessed()["two"])
+
+    def test_batch_size(self):
+
+        get_value("one")
+        accessed = self.get_accessed()
+
+        with mock.patch.object(cache, "DEF_ACCESS_BATCH", 1), \
+                mock.patch.object(cache.time, "time", return_value=time.time() + 10):
+            cache.clear_stores()
+            get_value("one")
+
+            self.assertLess(accessed["one"], self.get_accessed()["one"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of links stored into the provider catalog by dotlinks.py against a local RIPE stub
+"""
+
+import unittest
+
+import catalog
+import dotlinks
+from test_dotlinks import DotLinksTestCase
+
+
+class StoreLinksTest(DotLinksTestCase):
+
+    def get_rows(self):
+
+        isps_catalog = catalog.open_catalog(self.get_path("isps.sqlite3"))
+
+        try:
+            return (isps_catalog.execute("SELECT asn_a, asn_b, type, power FROM links ORDER BY asn_a, asn_b").fetchall(),
+                    isps_catalog.execute("SELECT asn, peer, type, power FROM peers ORDER BY asn, type, peer").fetchall())
+        finally:
+            isps_catalog.close()
+
+    def test_runs_idempotent(self):
+
+        options = ("-D", self.get_path("isps.sqlite3"),)
+
+        self.assertEqual(self.run_dotlinks(["AS1", "AS2", "AS3"], *options)[0], dotlinks.SUCCESS)
+        links, peers = self.get_rows()
+
+        self.assertIn((1, 2, "uplinks_rir", None,), links)
+        self.assertIn((1, 2, "import", 50,), peers)
+
+        for _ in range(2):
+            self.stub.reset()
+            self.assertEqual(self.run_dotlinks(["AS1", "AS2", "AS3"], *options)[0], dotlinks.SUCCESS)
+            self.assertEqual(self.get_rows(), (links, peers,))
+
+    def test_changed_links_replaced(self):
+
+        options = ("-D", self.get_path("isps.sqlite3"),)
+
+        self.assertEqual(self.run_dotlinks(["AS1", "AS2", "AS3"], *options)[0], dotlinks.SUCCESS)
+
+        self.stub.whois["AS1"] = [("import", "from AS3 accept ANY"), ("export", "to AS3 announce AS1")]
+        self.stub.reset()
+
+        self.assertEqual(self.run_dotlinks(["AS1", "AS2", "AS3"], *options)[0], dotlinks.SUCCESS)
+        links, peers = self.get_rows()
+
+        self.assertEqual(links, [(1, 2, "uplinks", None,), (1, 3, "peers", None,), (3, 2, "downlins_rir", None,)])
+        self.assertNotIn((1, 2, "import", 50,), peers)
+        self.assertIn((1, 3, "import", None,), peers)
+
+
+if __name__ == '__main__':
+    unittest.main()
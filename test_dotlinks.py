@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of dotlinks.py against a local RIPE stub
+"""
+
+import io
+import os
+import random
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+import dotlinks
+import fetch
+from ripestub import RipeStub
+
+DEF_SEED = 2018
+DEF_GRAPHS = 50
+
+THRESHOLDS = (0, 10, 20, 40,)
+THRESHOLD_POWERS = (0, 5, 10, 15, 20, 40, 60,)
+
+
+def make_stub():
+
+    stub = RipeStub()
+
+    stub.whois = {"AS1": [("import", "from AS2 accept ANY"), ("export", "to AS2 announce AS1")],
+                  "AS2": [("import", "from AS1 accept ANY"), ("export", "to AS1 announce AS-TWO"),
+                          ("import", "from AS3 accept ANY")],
+                  "AS3": [("import", "from PRNG-X accept ANY"), ("export", "to AS2 announce AS3")]}
+    stub.neighbours = {"AS1": [(2, "left", 50)], "AS2": [(1, "right", 50), (3, "right", 20)],
+                       "AS3": [(2, "left", 30)]}
+    stub.assets = {"AS-TWO": ["AS2", "AS-THREE"], "AS-THREE": ["AS3", "AS-TWO"]}
+    stub.peeringsets = {"PRNG-X": ["AS1 OR AS-TWO"]}
+
+    return stub
+
+
+class DotLinksTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = make_stub().start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+
+        self.stub.stop()
+        self.temp_dir.cleanup()
+
+    def get_path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def run_dotlinks(self, asn_list, *options):
+        """
+        Returns (exit code, output) of dotlinks.main with options for the ASn list, STDERR is kept in self.stderr
+        """
+
+        input_name = self.get_path("input.txt")
+        output_name = self.get_path("output.dot")
+
+        with open(input_name, "w") as input_file:
+            input_file.write("\n".join(asn_list) + "\n")
+
+        self.stderr = io.StringIO()
+
+        with mock.patch.object(sys, "argv", ["dotlinks.py", "-O", output_name] + list(options) + [input_name]), \
+                redirect_stderr(self.stderr):
+            err_id = dotlinks.main()
+
+        if not os.path.exists(output_name):
+            return err_id, ""
+
+        with open(output_name) as output_file:
+            return err_id, output_file.read()
+
+
+def get_dot_links_pairwise(asn_links):
+    """
+    Pairwise scan get_dot_links was built on, every pair of ASn is checked in asn_links order
+    """
+
+    asn_list = list(asn_links)
+
+    dot_links = dict(map(lambda link_type: (link_type, set(),), dotlinks._ltype_internal + dotlinks._ltype_external))
+
+    for asn_index, asn in enumerate(asn_list):
+        record = asn_links[asn]
+
+        for asnpeer in asn_list[asn_index + 1:]:
+            record_peer = asn_links[asnpeer]
+
+            is_peering = asnpeer in set().union(*map(lambda rtype: record[rtype], dotlinks._rtype_mentioned)) or \
+                asn in set().union(*map(lambda rtype: record_peer[rtype], dotlinks._rtype_mentioned))
+            if not is_peering:
+                continue
+
+            in_import = asnpeer in record["import"]
+            in_export = asn in record_peer["export"]
+            in_mpimport = asnpeer in record["mp-import"]
+            in_mpexport = asn in record_peer["mp-export"]
+
+            is_rir_mutual = (in_import and in_export and in_mpimport and in_mpexport) or \
+                            (in_import and in_export and not in_mpimport and not in_mpexport) or \
+                            (not in_import and not in_export and in_mpimport and in_mpexport)
+
+            is_uplink = asn in record_peer["downlinks"] and asnpeer in record["uplinks"]
+            is_downlink = asn in record_peer["uplinks"] and asnpeer in record["downlinks"]
+
+            if is_uplink and is_rir_mutual:
+                dot_links["uplinks_rir"].add((asn, asnpeer,))
+            elif is_downlink and is_rir_mutual:
+                dot_links["downlins_rir"].add((asnpeer, asn,))
+            elif is_rir_mutual:
+                dot_links["peers_rir"].add(tuple(sorted((asnpeer, asn,))))
+            elif is_uplink:
+                dot_links["uplinks"].add((asn, asnpeer,))
+            elif is_downlink:
+                dot_links["downlinks"].add((asnpeer, asn,))
+            else:
+                dot_links["peers"].add(tuple(sorted((asnpeer, asn,))))
+
+    return dot_links
+
+
+def make_random_links(rand, asn_count):
+    """
+    Returns asn_links of asn_count ASn in random order, random pairs mention each other
+    by random record types on both sides, some pairs are with ASn out of asn_links
+    """
+
+    asn_list = rand.sample(range(1, asn_count * 4), asn_count)
+    asn_known = asn_list + list(range(asn_count * 4, asn_count * 5))
+
+    asn_links = dict(map(lambda asn: (asn, dict(map(lambda rtype: (rtype, set(),), dotlinks._rtype_mentioned)),),
+                         asn_list))
+
+    for _ in range(asn_count * 3):
+        asn, asnpeer = rand.sample(asn_known, 2)
+
+        for rtype_asn, rtype_peer in (("import", "export",), ("mp-import", "mp-export",),
+                                      ("uplinks", "downlinks",), ("downlinks", "uplinks",), ("peers", "peers",)):
+            if asn in asn_links and rand.random() < 0.5:
+                asn_links[asn][rtype_asn].add(asnpeer)
+            if asnpeer in asn_links and rand.random() < 0.5:
+                asn_links[asnpeer][rtype_peer].add(asn)
+
+    return asn_links
+
+
+def make_random_neighbours(rand, asn_count):
+    """
+    Returns dict of ASn to (policy record, RIPE neighbours as (ASn, type, power)) of asn_count ASn,
+    powers are often equal to thresholds. Like in RIPE, a neighbour is listed once by each side
+    """
+
+    asn_list = rand.sample(range(1, asn_count * 4), asn_count)
+    asn_known = asn_list + list(range(asn_count * 4, asn_count * 5))
+
+    asn_graph = dict(map(lambda asn: (asn, (dict(map(lambda rtype: (rtype, set(),), dotlinks._rtype_policy)),
+                                            list(),),), asn_list))
+
+    for _ in range(asn_count * 3):
+        asn, asnpeer = rand.sample(asn_known, 2)
+        peer_type = rand.choice(("left", "right", "uncertain",))
+        power = rand.choice(THRESHOLD_POWERS)
+
+        for rtype_asn, rtype_peer in (("import", "export",), ("mp-import", "mp-export",),):
+            if asn in asn_graph and rand.random() < 0.3:
+                asn_graph[asn][0][rtype_asn].add(asnpeer)
+            if asnpeer in asn_graph and rand.random() < 0.3:
+                asn_graph[asnpeer][0][rtype_peer].add(asn)
+
+        if asnpeer in map(lambda neighbour: neighbour[0], asn_graph.get(asn, ((), (),))[1]) or \
+                asn in map(lambda neighbour: neighbour[0], asn_graph.get(asnpeer, ((), (),))[1]):
+            continue
+
+        if asn in asn_graph and rand.random() < 0.7:
+            asn_graph[asn][1].append((asnpeer, peer_type, power,))
+        if asnpeer in asn_graph and rand.random() < 0.7:
+            asn_graph[asnpeer][1].append((asn, {"left": "right", "right": "left"}.get(peer_type, peer_type),
+                                          rand.choice((power, rand.choice(THRESHOLD_POWERS),)),))
+
+    return asn_graph
+
+
+def make_threshold_links(asn_graph, power_min):
+    """
+    Returns asn_links of make_random_neighbours with neighbours above power_min like get_asn_links makes them
+    """
+
+    asn_links = dict()
+
+    for asn, (policy_record, neighbours_power) in asn_graph.items():
+        asn_record = dict(map(lambda item: (item[0], set(item[1]),), policy_record.items()))
+
+        for rtype, peer_type in (("uplinks", "left",), ("downlinks", "right",), ("peers", "uncertain",),):
+            asn_record[rtype] = set(map(lambda neighbour: neighbour[0],
+                                        filter(lambda neighbour: neighbour[1] == peer_type and power_min < neighbour[2],
+                                               neighbours_power)))
+
+        asn_record["power"] = dotlinks.get_peer_power(neighbours_power)
+        asn_links[asn] = asn_record
+
+    return asn_links
+
+
+class FetchStreamTest(unittest.TestCase):
+
+    def test_input_order(self):
+
+        items = list(range(100))
+
+        self.assertEqual(list(fetch.fetch_stream(items, lambda item: -item, workers=4, window=8)),
+                         list(map(lambda item: (item, -item,), items)))
+
+
+class DotLinksBuilderTest(unittest.TestCase):
+
+    def test_same_as_pairwise_scan(self):
+
+        rand = random.Random(DEF_SEED)
+
+        for graph_index in range(DEF_GRAPHS):
+            asn_links = make_random_links(rand, rand.randrange(2, 60))
+
+            self.assertEqual(dotlinks.get_dot_links(asn_links), get_dot_links_pairwise(asn_links), graph_index)
+
+    def test_dense_graph(self):
+
+        rand = random.Random(DEF_SEED)
+        asn_list = list(range(1, 30))
+
+        asn_links = dict(map(lambda asn: (asn, dict(map(lambda rtype: (rtype, set(rand.sample(asn_list, 20)),),
+                                                        dotlinks._rtype_mentioned)),), asn_list))
+
+        self.assertEqual(dotlinks.get_dot_links(asn_links), get_dot_links_pairwise(asn_links))
+
+
+class ThresholdLinksTest(unittest.TestCase):
+
+    def test_same_as_dot_links_per_threshold(self):
+
+        rand = random.Random(DEF_SEED)
+
+        for graph_index in range(DEF_GRAPHS):
+            asn_graph = make_random_neighbours(rand, rand.randrange(2, 40))
+            asn_links = make_threshold_links(asn_graph, THRESHOLDS[0])
+
+            weighted_links = dotlinks.get_weighted_links(asn_links, THRESHOLDS, opt_all=True)
+
+            for threshold in THRESHOLDS:
+                dot_links = dotlinks.get_dot_links(make_threshold_links(asn_graph, threshold), opt_all=True)
+
+                self.assertEqual(set(map(lambda link: link[:2], filter(lambda link: link[2] == threshold,
+                                                                      weighted_links))),
+                                 set((link_type, link,) for link_type, links in dot_links.items() for link in links),
+                                 (graph_index, threshold,))
+
+    def test_power(self):
+
+        rand = random.Random(DEF_SEED)
+        asn_links = make_threshold_links(make_random_neighbours(rand, 40), THRESHOLDS[0])
+
+        for link_type, link, threshold, power in dotlinks.get_weighted_links(asn_links, THRESHOLDS, opt_all=True):
+            if link_type in dotlinks._ltype_external:
+                asn = link[0] if link[0] in asn_links else link[1]
+                self.assertEqual(power, asn_links[asn]["power"].get(sum(link) - asn, 0))
+            else:
+                self.assertEqual(power, dotlinks.get_link_power(asn_links, *link))
+
+
+class FetchErrorTest(DotLinksTestCase):
+
+    def test_links(self):
+
+        err_id, output = self.run_dotlinks(["AS1", "AS2", "AS3"])
+
+        self.assertEqual(err_id, dotlinks.SUCCESS)
+        self.assertIn("\"AS1\" -> \"AS2\" [class=\"uplinks_rir\"", output)
+        self.assertIn("\"AS3\" -> \"AS2\" [class=\"downlins_rir\"", output)
+
+    def test_failed_asn_aborts(self):
+
+        self.stub.failing.add("AS2")
+
+        err_id, output = self.run_dotlinks(["AS1", "AS2", "AS3"])
+
+        self.assertEqual(err_id, dotlinks.ERR_GETASN)
+        self.assertNotIn("->", output)
+
+    def test_failed_asset_aborts(self):
+
+        self.stub.failing.add("AS-TWO")
+
+        err_id, _ = self.run_dotlinks(["AS1", "AS2", "AS3"])
+
+        self.assertEqual(err_id, dotlinks.ERR_GETASN)
+
+    def test_stream_closed_before_cache(self):
+
+        self.stub.failing.add("AS1")
+
+        events = list()
+        fetch_stream = fetch.fetch_stream
+        close_cache = dotlinks.cache.close_cache
+
+        def fetch_stream_closed(*args, **kwargs):
+            try:
+                yield from fetch_stream(*args, **kwargs)
+            finally:
+                events.append("stream")
+
+        def close_cache_after():
+            events.append("cache")
+            close_cache()
+
+        with mock.patch.object(fetch, "fetch_stream", fetch_stream_closed), \
+                mock.patch.object(dotlinks.cache, "close_cache", close_cache_after):
+            err_id, _ = self.run_dotlinks(["AS1", "AS2", "AS3"], "-c", self.get_path("cache.sqlite"))
+
+            self.assertEqual(err_id, dotlinks.ERR_GETASN)
+            self.assertEqual(events[-2:], ["stream", "cache"])
+
+            events.clear()
+
+            err_id, _ = self.run_dotlinks(["AS1", "AS2", "AS3"], "-i", self.get_path("state.sqlite"))
+
+            self.assertEqual(err_id, dotlinks.ERR_GETASN)
+            self.assertEqual(events[-2:], ["stream", "cache"])
+
+
+class IOErrorTest(DotLinksTestCase):
+
+    def test_cache_open_error(self):
+
+        cache_name = self.get_path("missing/cache.sqlite")
+
+        err_id, _ = self.run_dotlinks(["AS1"], "-c", cache_name)
+
+        self.assertEqual(err_id, dotlinks.ERR_IO)
+        self.assertEqual(self.stderr.getvalue(), "I/O error in '{}': Cache open error\n".format(cache_name))
+
+    def test_input_error(self):
+
+        input_name = self.get_path("missing.txt")
+
+        with mock.patch.object(sys, "argv", ["dotlinks.py", input_name]), redirect_stderr(io.StringIO()) as stderr:
+            err_id = dotlinks.main()
+
+        self.assertEqual(err_id, dotlinks.ERR_IO)
+        self.assertEqual(stderr.getvalue(), "I/O error in '{}': No such file or directory\n".format(input_name))
+
+
+class ResilientTest(DotLinksTestCase):
+
+    def test_failed_asn_retried(self):
+
+        self.stub.failing.add("AS3")
+
+        with mock.patch.object(dotlinks.time, "sleep") as sleep:
+            err_id, output = self.run_dotlinks(["AS1", "AS2", "AS3"], "-R", "-x", "2")
+
+        self.assertEqual(err_id, dotlinks.ERR_PARTIAL)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertIn("\"AS1\" -> \"AS2\" [class=\"uplinks_rir\"", output)
+
+    def test_offline_not_retried(self):
+
+        cache_name = self.get_path("cache.sqlite")
+
+        err_id, _ = self.run_dotlinks(["AS1", "AS2"], "-c", cache_name)
+        self.assertEqual(err_id, dotlinks.SUCCESS)
+
+        with mock.patch.object(dotlinks.time, "sleep") as sleep:
+            err_id, output = self.run_dotlinks(["AS1", "AS2", "AS3"], "-R", "-c", cache_name, "-o")
+
+        self.assertEqual(err_id, dotlinks.ERR_PARTIAL)
+        sleep.assert_not_called()
+        self.assertIn("\"AS1\" -> \"AS2\" [class=\"uplinks_rir\"", output)
+
+    def test_negative_retries(self):
+
+        err_id, _ = self.run_dotlinks(["AS1"], "-R", "-x", "-1")
+
+        self.assertEqual(err_id, dotlinks.ERR_GETOPT)
+
+
+class IncrementalTest(DotLinksTestCase):
+
+    def test_changed_autnum_with_cache(self):
+        """
+        A changed aut-num is requested again even if the cache still keeps the old one
+        """
+
+        self.stub.last_updated = {"AS1": "2018-01-01T00:00:00", "AS2": "2018-01-01T00:00:00",
+                                  "AS3": "2018-01-01T00:00:00"}
+        options = ("-i", self.get_path("state.sqlite"), "-c", self.get_path("cache.sqlite"),)
+
+        err_id, output = self.run_dotlinks(["AS1", "AS2", "AS3"], *options)
+        self.assertEqual(err_id, dotlinks.SUCCESS)
+        self.assertIn("\"AS1\" -> \"AS2\" [class=\"uplinks_rir\"", output)
+
+        self.stub.whois["AS1"] = [("import", "from AS3 accept ANY"), ("export", "to AS3 announce AS1")]
+        self.stub.last_updated["AS1"] = "2018-02-01T00:00:00"
+
+        for _ in range(2):
+            err_id, output = self.run_dotlinks(["AS1", "AS2", "AS3"], *options)
+            self.assertEqual(err_id, dotlinks.SUCCESS)
+
+            self.stub.reset()
+            _, output_fresh = self.run_dotlinks(["AS1", "AS2", "AS3"])
+
+            self.assertEqual(sorted(output.splitlines()), sorted(output_fresh.splitlines()))
+            self.assertNotIn("\"AS1\" -> \"AS2\" [class=\"uplinks_rir\"", output)
+
+
+if __name__ == '__main__':
+    unittest.main()
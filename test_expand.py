@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of policy expansion in forked processes against a local RIPE stub
+"""
+
+import random
+import unittest
+
+import dotlinks
+import expand
+import fetch
+import rpsl
+import rpslpolicy
+from test_dotlinks import DotLinksTestCase, make_stub
+
+DEF_SEED = 2018
+DEF_ASN_COUNT = 60
+
+
+def make_large_stub():
+    """
+    make_stub with more ASn, their policies mention ASn, as-sets and peering-sets of the stub
+    """
+
+    rand = random.Random(DEF_SEED)
+    stub = make_stub()
+
+    stub.assets["AS-NESTED"] = ["AS-TWO", "AS7", "as-three"]
+    stub.peeringsets["PRNG-Y"] = ["AS5 OR AS-NESTED", "PRNG-X"]
+
+    peerings = ["AS-TWO", "AS-NESTED", "PRNG-X", "prng-y", "AS-TWO EXCEPT AS3", "(AS1 OR AS-THREE) AND AS-TWO"]
+
+    for asn in range(4, DEF_ASN_COUNT + 1):
+        peers = rand.sample(range(1, DEF_ASN_COUNT + 1), 3)
+
+        stub.whois["AS{}".format(asn)] = [("import", "from AS{} accept ANY".format(peers[0])),
+                                          ("export", "to AS{} announce AS{}".format(peers[1], asn)),
+                                          ("import", "from {} accept ANY".format(rand.choice(peerings))),
+                                          ("mp-export", "afi any to {} announce ANY".format(rand.choice(peerings)))]
+        stub.neighbours["AS{}".format(asn)] = list(map(lambda peer: (peer, rand.choice(("left", "right",)),
+                                                                     rand.randint(1, 100)), peers))
+
+    return stub
+
+
+@unittest.skipUnless(expand.is_supported(), "fork is not supported")
+class ExpandStreamTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = make_stub().start()
+
+    def tearDown(self):
+
+        self.stub.stop()
+
+    def test_policies_compiled_by_workers(self):
+
+        misses = rpslpolicy.compile_policy.cache_info()["misses"]
+
+        asn_records = list(expand.expand_stream([1, 2, 3], dotlinks.get_asn_links, workers=2, processes=2))
+
+        self.assertEqual(list(map(lambda item: item[0], asn_records)), [1, 2, 3])
+        self.assertEqual(rpslpolicy.compile_policy.cache_info()["misses"], misses)
+
+        autnum_policy = rpslpolicy.find_autnum_policy("AS1")
+        self.assertEqual(list(map(lambda policy_line: policy_line[0], autnum_policy["import"])),
+                         ["from AS2 accept ANY"])
+
+
+    def test_same_records(self):
+
+        self.stub.stop()
+        self.stub = make_large_stub().start()
+
+        asn_list = list(range(1, DEF_ASN_COUNT + 1))
+        asn_records = list(fetch.fetch_stream(asn_list, dotlinks.get_asn_links))
+
+        self.stub.reset()
+
+        self.assertEqual(list(expand.expand_stream(asn_list, dotlinks.get_asn_links, processes=3, chunk=16)),
+                         asn_records)
+
+    def test_sets_uncovered_by_workers(self):
+
+        list(expand.expand_stream([1, 2, 3], dotlinks.get_asn_links, processes=2))
+
+        self.assertEqual(len(rpsl._cache_closure), 0)
+        self.assertEqual(len(rpsl._cache_uncovered), 0)
+
+
+@unittest.skipUnless(expand.is_supported(), "fork is not supported")
+class ProcessesTest(DotLinksTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.stub.stop()
+        self.stub = make_large_stub().start()
+
+    def test_same_output(self):
+
+        asn_list = list(map("AS{}".format, range(1, DEF_ASN_COUNT + 1)))
+
+        err_id, output_single = self.run_dotlinks(asn_list, "-P", "1")
+        self.assertEqual(err_id, dotlinks.SUCCESS)
+
+        for processes in ("2", "4",):
+            self.stub.reset()
+
+            err_id, output = self.run_dotlinks(asn_list, "-P", processes)
+            self.assertEqual(err_id, dotlinks.SUCCESS)
+            self.assertEqual(output, output_single)
+
+        self.assertEqual(len(rpsl._cache_closure), 0)
+
+        # records unpickled from workers may iterate their sets in another order than records made in place
+        self.stub.reset()
+        self.assertEqual(sorted(self.run_dotlinks(asn_list)[1].splitlines()), sorted(output_single.splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
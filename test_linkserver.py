@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of linkserver.py queries against a local RIPE stub
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+import linkserver
+from test_dotlinks import make_stub
+
+
+class LinkServerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = make_stub().start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        self.input_name = os.path.join(self.temp_dir.name, "input.txt")
+        with open(self.input_name, "w") as input_file:
+            input_file.write("AS1\nAS2\nAS3\nAS4\n")
+
+        self.stub.failing.add("AS4")
+
+        self.server = linkserver.LinkServer(self.input_name, opt_workers=2)
+
+    def tearDown(self):
+
+        self.stub.stop()
+        self.temp_dir.cleanup()
+
+    def test_not_resolved_yet(self):
+
+        self.assertEqual(self.server.query("/asn/AS1")[0], 503)
+        self.assertEqual(self.server.query("/status")[1]["asns"], 0)
+
+    def test_queries(self):
+
+        self.assertTrue(asyncio.run(self.server.refresh()))
+
+        status, data = self.server.query("/status")
+        self.assertEqual(status, 200)
+        self.assertEqual(data["asns"], 3)
+        self.assertEqual(data["unresolved"], ["AS4"])
+
+        status, data = self.server.query("/link/AS2/AS1")
+        self.assertEqual(status, 200)
+        self.assertEqual(data, {"type": "uplinks_rir", "source": "AS1", "target": "AS2"})
+
+        status, data = self.server.query("/asn/as3")
+        self.assertEqual(status, 200)
+        self.assertEqual(data["asn"], "AS3")
+        self.assertIn({"type": "downlins_rir", "source": "AS3", "target": "AS2"}, data["links"])
+
+        self.assertEqual(self.server.query("/asn/AS9")[0], 404)
+        self.assertEqual(self.server.query("/link/AS1/AS9")[0], 404)
+        self.assertEqual(self.server.query("/asn/AS-FOO")[0], 400)
+        self.assertEqual(self.server.query("/unknown")[0], 400)
+
+    def test_filters(self):
+
+        self.assertTrue(asyncio.run(self.server.refresh()))
+
+        status, data = self.server.query("/filters/AS2/AS1")
+        self.assertEqual(status, 200)
+        self.assertEqual(data["filters"],
+                         [{"attribute": "import", "policy": "from AS1 accept ANY", "keyword": "accept",
+                           "filter": "ANY", "action": None},
+                          {"attribute": "export", "policy": "to AS1 announce AS-TWO", "keyword": "announce",
+                           "filter": "AS-TWO", "action": None}])
+
+        self.assertEqual(list(map(lambda item: item["policy"], self.server.query("/filters/AS3/AS1")[1]["filters"])),
+                         ["from PRNG-X accept ANY"])
+        self.assertEqual(self.server.query("/filters/AS3/AS9")[1]["filters"], [])
+        self.assertEqual(self.server.query("/filters/AS4/AS1")[0], 404)
+
+    def test_filters_without_ripe(self):
+
+        self.assertTrue(asyncio.run(self.server.refresh()))
+
+        self.stub.failing.update(("AS1", "AS2", "AS3", "AS-TWO", "AS-THREE", "PRNG-X",))
+        self.stub.reset()
+        calls = dict(self.stub.calls)
+
+        status, data = self.server.query("/filters/AS3/AS1")
+        self.assertEqual(status, 200)
+        self.assertEqual(list(map(lambda item: item["policy"], data["filters"])), ["from PRNG-X accept ANY"])
+        self.assertEqual(self.server.query("/filters/AS2/AS3")[0], 200)
+
+        self.assertEqual(self.stub.calls, calls)
+
+    def test_failed_refresh_keeps_graph(self):
+
+        self.assertTrue(asyncio.run(self.server.refresh()))
+
+        self.stub.failing.update(("AS1", "AS2", "AS3",))
+        self.stub.reset()
+
+        self.assertFalse(asyncio.run(self.server.refresh()))
+        self.assertEqual(self.server.query("/link/AS1/AS2")[0], 200)
+        self.assertEqual(self.server.query("/status")[1]["refresh_errors"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Golden file tests of link writers, expected outputs are testdata/links[_weighted].<format>
+"""
+
+import io
+import os
+import unittest
+
+import linkwriter
+
+TESTDATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testdata")
+
+LINKS = (("uplinks_rir", (1, 2,),),
+         ("peers", (1, 3,),),
+         ("downlinks_ext", (4200000001, 3,),),
+         ("peers_ext", (3, 4294967295,),),)
+
+WEIGHTED_LINKS = (("uplinks_rir", (1, 2,), 10, 50,),
+                  ("uplinks_rir", (1, 2,), 30, 50,),
+                  ("peers", (1, 3,), 10, 20,),
+                  ("peers", (2, 3,), 30, 40,),)
+
+_extensions = {linkwriter.FORMAT_DOT: "dot",
+               linkwriter.FORMAT_JSONL: "jsonl",
+               linkwriter.FORMAT_CSV: "csv",
+               linkwriter.FORMAT_GRAPHML: "graphml"}
+
+
+def write_links(link_format, links, weighted=False, buffer_size=linkwriter.DEF_BUFFER_SIZE):
+
+    output = io.StringIO()
+
+    link_writer = linkwriter.LinkWriter(output, link_format, buffer_size=buffer_size, weighted=weighted)
+    link_writer.write_links(links)
+    link_writer.close()
+
+    return output.getvalue()
+
+
+def read_golden(name, link_format):
+
+    with open(os.path.join(TESTDATA_DIR, "{}.{}".format(name, _extensions[link_format]))) as golden_file:
+        return golden_file.read()
+
+
+class LinkWriterTest(unittest.TestCase):
+
+    def test_links(self):
+
+        for link_format in linkwriter.FORMATS:
+            with self.subTest(link_format=link_format):
+                self.assertEqual(write_links(link_format, LINKS), read_golden("links", link_format))
+
+    def test_weighted_links(self):
+
+        for link_format in linkwriter.FORMATS:
+            with self.subTest(link_format=link_format):
+                self.assertEqual(write_links(link_format, WEIGHTED_LINKS, weighted=True),
+                                 read_golden("links_weighted", link_format))
+
+    def test_small_buffer(self):
+
+        for link_format in linkwriter.FORMATS:
+            with self.subTest(link_format=link_format):
+                self.assertEqual(write_links(link_format, LINKS, buffer_size=1), read_golden("links", link_format))
+
+    def test_dot_links(self):
+
+        output = io.StringIO()
+
+        link_writer = linkwriter.LinkWriter(output, linkwriter.FORMAT_CSV)
+        link_writer.write_dot_links({"peers": {(1, 3,)}, "uplinks_rir": {(1, 2,)}})
+        link_writer.close()
+
+        self.assertEqual(output.getvalue(), "source,target,type\nAS1,AS3,peers\nAS1,AS2,uplinks_rir\n")
+
+    def test_unknown_format(self):
+
+        self.assertRaises(ValueError, linkwriter.LinkWriter, io.StringIO(), "gml")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of ripeapi retries with backoff and batch lookups against a local RIPE stub
+"""
+
+import unittest
+
+import ripeapi
+from ripestub import RipeStub
+
+DEF_RETRIES = 3
+DEF_BACKOFF = 0.001
+DEF_TIMEOUT = 0.1
+
+NEIGHBOURS = [(2, "left", 50)]
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = RipeStub()
+        self.stub.whois = {"AS1": [("import", "from AS2 accept ANY")]}
+        self.stub.neighbours = {"AS1": NEIGHBOURS}
+        self.stub.start()
+
+        ripeapi.configure(retries=DEF_RETRIES, backoff=DEF_BACKOFF, timeout=DEF_TIMEOUT)
+        ripeapi.reset_stats()
+
+    def tearDown(self):
+
+        self.stub.stop()
+
+        ripeapi.configure(backoff=ripeapi.DEF_BACKOFF, timeout=ripeapi.DEF_TIMEOUT)
+        ripeapi.reset_stats()
+
+    def get_retries(self):
+
+        return ripeapi.get_stats()["asn-neighbours"]["retries"]
+
+    def test_server_error_retried(self):
+
+        self.stub.failing_times["AS1"] = 2
+
+        self.assertEqual(ripeapi.get_neighbours_power("AS1"), NEIGHBOURS)
+        self.assertEqual(self.stub.calls, {"asn-neighbours": 3})
+        self.assertEqual(self.get_retries(), 2)
+
+    def test_timeout_retried(self):
+
+        self.stub.delayed_times["AS1"] = 1
+
+        self.assertEqual(ripeapi.get_neighbours_power("AS1"), NEIGHBOURS)
+        self.assertEqual(self.stub.calls, {"asn-neighbours": 2})
+        self.assertEqual(self.get_retries(), 1)
+
+    def test_gives_up(self):
+
+        self.stub.failing.add("AS1")
+
+        self.assertIsNone(ripeapi.get_neighbours_power("AS1"))
+        self.assertEqual(self.stub.calls, {"asn-neighbours": DEF_RETRIES + 1})
+        self.assertEqual(ripeapi.get_stats()["asn-neighbours"]["errors"], 1)
+
+    def test_client_error_not_retried(self):
+
+        # the stub answers 404 for an unknown aut-num
+        ripeapi.get_whois_top("AS2")
+
+        self.assertEqual(self.stub.calls, {"whois": 1})
+        self.assertEqual(ripeapi.get_stats()["whois"]["retries"], 0)
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = RipeStub()
+        self.stub.whois = {"AS1": [("import", "from AS2 accept ANY")], "AS3": [("export", "to AS2 announce AS3")]}
+        self.stub.neighbours = {"AS1": NEIGHBOURS, "AS3": [(2, "right", 5)]}
+        self.stub.failing.add("AS2")
+        self.stub.start()
+
+    def tearDown(self):
+
+        self.stub.stop()
+
+    def test_failed_item_reported(self):
+
+        self.assertEqual(ripeapi.get_whois_many(["AS1", "AS2", "AS3", "AS1"]),
+                         {"AS1": {"aut-num": {"AS1"}, "import": {"from AS2 accept ANY"}},
+                          "AS2": None,
+                          "AS3": {"aut-num": {"AS3"}, "export": {"to AS2 announce AS3"}}})
+        self.assertEqual(self.stub.calls, {"whois": 3})
+
+        self.assertEqual(ripeapi.get_neighbours_many(["AS3", "AS2", "AS1"], power_min=10),
+                         {"AS1": {"left": {2}, "right": set(), "uncertain": set()},
+                          "AS2": None,
+                          "AS3": {"left": set(), "right": set(), "uncertain": set()}})
+
+        # the failed ASn is requested again with the next batch, the rest is cached
+        self.stub.failing.clear()
+        self.stub.neighbours["AS2"] = NEIGHBOURS
+
+        self.assertEqual(ripeapi.get_neighbours_many(["AS1", "AS2"])["AS2"],
+                         {"left": {2}, "right": set(), "uncertain": set()})
+        self.assertEqual(self.stub.calls, {"whois": 3, "asn-neighbours": 4})
+
+
+if __name__ == '__main__':
+    unittest.main()
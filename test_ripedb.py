@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of RIPE DB dump parsing and the local index on a tiny dump testdata/ripe.db.test.gz
+"""
+
+import os
+import tempfile
+import unittest
+
+import ripeapi
+import ripedb
+from ripestub import RipeStub
+
+DUMP_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testdata", "ripe.db.test.gz")
+
+DUMP_AUTNUM = [("aut-num", "AS1"), ("as-name", "ONE"), ("import", "from AS2 accept ANY"),
+               ("import", "from AS3 accept ANY"), ("export", "to AS2 announce AS1"), ("mnt-by", "MNT-ONE")]
+DUMP_ASSET = [("as-set", "as-two"), ("members", "AS2, as-three"), ("members", "AS4, AS5")]
+DUMP_PEERINGSET = [("peering-set", "prng-x"), ("peering", "AS1 OR as-two"),
+                   ("remarks", "last object without an empty line after it")]
+
+
+class ParseObjectsTest(unittest.TestCase):
+
+    def test_lines(self):
+
+        lines = ["% header\n", "\n", "As-Set:  AS-ONE # name\n", "Members: AS1,\n", "\tAS2\n", "+\n",
+                 "members: AS3\n", "# comment\n", "not an attribute\n", "\r\n", "\n", "as-set: AS-TWO\r\n"]
+
+        self.assertEqual(list(ripedb.parse_objects(lines)),
+                         [[("as-set", "AS-ONE"), ("members", "AS1, AS2"), ("members", "AS3")],
+                          [("as-set", "AS-TWO")]])
+
+    def test_dump(self):
+
+        self.assertEqual(list(ripedb.read_dump(DUMP_NAME)), [DUMP_AUTNUM, DUMP_ASSET, DUMP_PEERINGSET])
+
+    def test_dump_classes(self):
+
+        self.assertEqual(list(ripedb.read_dump(DUMP_NAME, ("as-set",))), [DUMP_ASSET])
+
+
+class DumpIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index = ripedb.DumpIndex(os.path.join(self.temp_dir.name, "index.sqlite"))
+        self.index.load(ripedb.read_dump(DUMP_NAME), batch=2)
+
+    def tearDown(self):
+
+        self.index.close()
+        self.temp_dir.cleanup()
+
+
+class DumpIndexTest(DumpIndexTestCase):
+
+    def test_get(self):
+
+        self.assertEqual(self.index.get("aut-num", "AS1"), DUMP_AUTNUM)
+        self.assertEqual(self.index.get("as-set", "AS-TWO"), DUMP_ASSET)
+        self.assertEqual(self.index.get("peering-set", "Prng-X"), DUMP_PEERINGSET)
+        self.assertIsNone(self.index.get("aut-num", "AS2"))
+        self.assertIsNone(self.index.get("inetnum", "192.0.2.0 - 192.0.2.255"))
+
+    def test_get_names(self):
+
+        self.assertEqual(self.index.get_names("as-set"), ["AS-TWO"])
+        self.assertEqual(self.index.get_names("aut-num"), ["AS1"])
+
+
+class UseDumpTest(DumpIndexTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.stub = RipeStub().start()
+        ripeapi.use_dump(self.index)
+
+    def tearDown(self):
+
+        ripeapi.use_dump(None)
+        self.stub.stop()
+
+        super().tearDown()
+
+    def test_objects_from_dump(self):
+
+        self.assertEqual(ripeapi.get_whois_top("AS1")["import"], {"from AS2 accept ANY", "from AS3 accept ANY"})
+        self.assertEqual(ripeapi.get_asset_members("AS-TWO"), {"AS2", "as-three", "AS4", "AS5"})
+        self.assertEqual(ripeapi.get_peeringset_expr("PRNG-X"), {"AS1 OR as-two"})
+
+        self.assertEqual(self.stub.calls, {})
+
+    def test_missing_objects_requested(self):
+
+        self.assertEqual(ripeapi.get_asset_members("AS-THREE"), set())
+        self.assertEqual(self.stub.calls, {"as-set": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of as-expression evaluation and as-set closures against a local RIPE stub
+"""
+
+import unittest
+
+import rpsl
+from rpsllex import ASN_ANY
+from ripestub import RipeStub
+
+
+def make_stub():
+
+    stub = RipeStub()
+
+    stub.assets = {"AS-ONE": ["AS1", "AS2"],
+                   "AS-TWO": ["AS2", "AS3"],
+                   "AS-ALL": ["AS4", "AS-ANY"],
+                   "AS-NESTED": ["AS5", "as-all"],
+                   "AS-BROKEN": ["AS6", "AS-MISSING"],
+                   "AS-CYCLE-A": ["AS11", "AS-CYCLE-B"],
+                   "AS-CYCLE-B": ["AS12", "as-cycle-a", "AS-ONE"],
+                   "AS-TOP": ["AS13", "AS-CYCLE-B"]}
+    stub.failing.add("AS-MISSING")
+
+    return stub
+
+
+class RpslTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.stub = make_stub().start()
+        rpsl.reset_unresolved()
+
+    def tearDown(self):
+
+        self.stub.stop()
+        rpsl.reset_unresolved()
+
+
+class AsExprTest(RpslTestCase):
+
+    def assertPeering(self, peering, asn_list):
+
+        self.assertEqual(rpsl.split_peering(peering), asn_list, peering)
+
+    def test_or(self):
+
+        self.assertPeering("AS1 OR AS-TWO", {1, 2, 3})
+        self.assertPeering("AS-ONE OR AS-TWO OR AS7", {1, 2, 3, 7})
+
+    def test_and(self):
+
+        self.assertPeering("AS-ONE AND AS-TWO", {2})
+        self.assertPeering("AS1 AND AS-TWO", set())
+
+    def test_except(self):
+
+        self.assertPeering("AS-ONE EXCEPT AS2", {1})
+        self.assertPeering("(AS1 OR AS2) EXCEPT AS2", {1})
+        self.assertPeering("AS-TWO EXCEPT AS-ONE", {3})
+
+    def test_precedence(self):
+
+        self.assertPeering("AS1 OR AS-ONE AND AS-TWO", {1, 2})
+        self.assertPeering("(AS1 OR AS-ONE) AND AS-TWO", {2})
+        self.assertPeering("AS-TWO EXCEPT AS3 OR AS3", {2, 3})
+        self.assertPeering("AS-TWO EXCEPT (AS3 OR AS2)", set())
+        self.assertPeering("AS-ONE EXCEPT AS1 EXCEPT AS2", set())
+
+    def test_any(self):
+
+        self.assertPeering("AS-ANY", {ASN_ANY})
+        self.assertPeering("AS1 OR AS-ANY", {ASN_ANY})
+        self.assertPeering("AS-ANY AND AS-ONE", {1, 2})
+        self.assertPeering("AS-ONE AND AS-ANY", {1, 2})
+        self.assertPeering("AS-ANY EXCEPT AS1", {ASN_ANY})
+        self.assertPeering("AS-ONE EXCEPT AS-ANY", set())
+        self.assertPeering("AS-ONE OR AS-ALL", {ASN_ANY})
+
+    def test_lower_case(self):
+
+        self.assertPeering("as-one and as-two", {2})
+        self.assertPeering("as1 or as-two except as3", {1, 2})
+
+    def test_not_parsable(self):
+
+        for peering in ("AS1 OR", "(AS1 OR AS2", "AS1 OR AS2)", "AS1 AS2", "OR AS1", "AS1 OR ()"):
+            self.assertIs(rpsl.compile_asexpr(peering), False, peering)
+            self.assertPeering(peering, set())
+
+    def test_failed_fetch(self):
+
+        self.assertPeering("AS-MISSING", None)
+        self.assertPeering("AS1 OR AS-MISSING", None)
+        self.assertPeering("AS-ONE AND AS-BROKEN", None)
+        self.assertIn("AS-MISSING", rpsl.get_unresolved()["as-set"])
+
+
+
+class AssetClosureTest(RpslTestCase):
+
+    def test_cycle(self):
+
+        self.assertEqual(rpsl.uncover_asset("AS-CYCLE-A"), {1, 2, 11, 12})
+        self.assertEqual(rpsl.uncover_asset("as-cycle-b"), {1, 2, 11, 12})
+
+    def test_shared_component(self):
+
+        closure = rpsl.uncover_asset("AS-TOP")
+        self.assertEqual(closure, {1, 2, 11, 12, 13})
+
+        calls = dict(self.stub.calls)
+
+        closure_a = rpsl.uncover_asset("AS-CYCLE-A")
+        self.assertIs(rpsl.uncover_asset("AS-CYCLE-B"), closure_a)
+        self.assertEqual(closure_a, {1, 2, 11, 12})
+        self.assertEqual(self.stub.calls, calls)
+
+    def test_nested_any(self):
+
+        self.assertEqual(rpsl.uncover_asset("AS-NESTED"), {ASN_ANY})
+        self.assertEqual(rpsl.uncover_asset("AS-ALL"), {ASN_ANY})
+
+    def test_failed_member(self):
+
+        self.assertIsNone(rpsl.uncover_asset("AS-BROKEN"))
+
+    def test_depth(self):
+
+        self.assertEqual(rpsl.uncover_asset("AS-TOP", 0), {13})
+        self.assertEqual(rpsl.uncover_asset("AS-TOP", 1), {12, 13})
+        self.assertEqual(rpsl.uncover_asset("AS-TOP", 2), {1, 2, 11, 12, 13})
+        self.assertEqual(rpsl.uncover_asset("AS-NESTED", 0), {5})
+        self.assertEqual(rpsl.uncover_asset("AS-NESTED", 1), {ASN_ANY})
+
+        self.assertIn(("AS-TOP", 0,), rpsl._cache_asset_deep)
+        self.assertIn(("AS-TOP", 1,), rpsl._cache_asset_deep)
+
+        calls = dict(self.stub.calls)
+
+        self.assertEqual(rpsl.uncover_asset("AS-TOP", 1), {12, 13})
+        self.assertEqual(self.stub.calls, calls)
+
+        # a depth limited walk is not the full closure
+        self.assertEqual(rpsl.uncover_asset("AS-TOP"), {1, 2, 11, 12, 13})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of RPSL tokens and ASn parsing
+"""
+
+import unittest
+
+import rpsllex
+
+
+class ParseAsnTest(unittest.TestCase):
+
+    def test_asn(self):
+
+        self.assertEqual(rpsllex.parse_asn("AS65000"), 65000)
+        self.assertEqual(rpsllex.parse_asn("as15"), 15)
+
+    def test_32bit_asn(self):
+
+        self.assertEqual(rpsllex.parse_asn("AS4200000001"), 4200000001)
+        self.assertEqual(rpsllex.parse_asn("AS1234567"), 1234567)
+        self.assertEqual(rpsllex.classify("AS4200000001"), rpsllex.TOK_ASN)
+
+    def test_not_asn(self):
+
+        for text in ("AS1 x", "AS-FOO", "AS", "AS99999999999", "AS4294967295", ""):
+            self.assertIsNone(rpsllex.parse_asn(text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
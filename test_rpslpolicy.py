@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of compiled RPSL policies
+"""
+
+import unittest
+from unittest import mock
+
+import cache
+import rpslpolicy
+from rpslpolicy import Policy, PolicyFactor, PolicyPeering
+
+
+class CompilePolicyTest(unittest.TestCase):
+
+    def test_policy(self):
+
+        self.assertEqual(rpslpolicy.compile_policy("afi ipv6.unicast from AS1 action pref=100; accept AS-ONE"),
+                         Policy(None, None, "ipv6.unicast",
+                                ((None, (PolicyFactor((PolicyPeering(None, "AS1", None, None),), ("pref=100;",),
+                                                      "accept", "AS-ONE"),),),)))
+
+    def test_not_parsable(self):
+
+        self.assertIs(rpslpolicy.compile_policy("from accept"), False)
+
+
+class AutnumPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+
+        cache.clear_stores()
+
+    def test_cached_per_asn(self):
+
+        whois_object = {"import": {"from AS2 accept ANY"}, "export": {"to AS2 announce AS1"}}
+
+        autnum_policy = rpslpolicy.get_autnum_policy("AS1", whois_object)
+
+        with mock.patch.object(rpslpolicy, "compile_autnum") as compile_autnum:
+            self.assertIs(rpslpolicy.get_autnum_policy("AS1", whois_object), autnum_policy)
+            compile_autnum.assert_not_called()
+
+    def test_compiled_again_when_changed(self):
+
+        rpslpolicy.get_autnum_policy("AS1", {"import": {"from AS2 accept ANY"}})
+        autnum_policy = rpslpolicy.get_autnum_policy("AS1", {"import": {"from AS3 accept ANY"}})
+
+        self.assertEqual(list(map(lambda policy_line: policy_line[0], autnum_policy["import"])),
+                         ["from AS3 accept ANY"])
+
+    def test_filters(self):
+
+        autnum_policy = rpslpolicy.get_autnum_policy("AS1", {"import": {"from AS2 accept AS-TWO",
+                                                                        "from AS3 accept ANY",
+                                                                        "from AS-ANY action pref=10; accept ANY"},
+                                                             "export": {"to AS2 announce AS1", "garbage to"}})
+
+        self.assertEqual(rpslpolicy.get_autnum_filters(autnum_policy, 2),
+                         [("import", "from AS-ANY action pref=10; accept ANY", "accept", "ANY", "pref=10;",),
+                          ("import", "from AS2 accept AS-TWO", "accept", "AS-TWO", None,),
+                          ("export", "to AS2 announce AS1", "announce", "AS1", None,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
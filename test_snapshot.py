@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of snapshot files written by write_snapshot and read through Snapshot
+"""
+
+import os
+import tempfile
+import unittest
+
+import rpsl
+import ripeapi
+import snapshot
+from rpsllex import ASN_ANY
+from ripestub import RipeStub
+
+CLOSURES = {"AS-ONE": {3, 1, 2}, "as-big": set(range(100, 4000, 7)), "AS-ANY-INSIDE": {ASN_ANY}, "AS-EMPTY": set()}
+NEIGHBOURS = {1: [(2, "left", 50), (3, "right", 20), (9, "unknown", 5)],
+              4200000001: [(1, "uncertain", 0)],
+              2: []}
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_name = os.path.join(self.temp_dir.name, "links.snapshot")
+
+        snapshot.write_snapshot(self.snapshot_name, CLOSURES, NEIGHBOURS)
+        self.snapshot = snapshot.Snapshot(self.snapshot_name)
+
+    def tearDown(self):
+
+        self.snapshot.close()
+        self.temp_dir.cleanup()
+
+
+class RoundTripTest(SnapshotTestCase):
+
+    def test_closures(self):
+
+        for set_name, closure in CLOSURES.items():
+            self.assertEqual(list(self.snapshot.get_closure(set_name)), sorted(closure), set_name)
+            self.assertEqual(self.snapshot.get_asset(set_name.lower()), closure, set_name)
+
+        self.assertIsNone(self.snapshot.get_closure("AS-MISSING"))
+        self.assertIsNone(self.snapshot.get_asset("AS-ÜNICODE"))
+
+    def test_has_member(self):
+
+        self.assertTrue(self.snapshot.has_member("AS-ONE", 2))
+        self.assertFalse(self.snapshot.has_member("AS-ONE", 4))
+        self.assertTrue(self.snapshot.has_member("AS-BIG", 107))
+        self.assertFalse(self.snapshot.has_member("AS-EMPTY", 1))
+        self.assertTrue(self.snapshot.has_member("AS-ANY-INSIDE", 65000))
+        self.assertIsNone(self.snapshot.has_member("AS-MISSING", 1))
+
+    def test_neighbours(self):
+
+        self.assertEqual(self.snapshot.get_neighbours_power(1), [(2, "left", 50), (3, "right", 20)])
+        self.assertEqual(self.snapshot.get_neighbours_power(4200000001), [(1, "uncertain", 0)])
+        self.assertEqual(self.snapshot.get_neighbours_power(2), [])
+        self.assertIsNone(self.snapshot.get_neighbours_power(3))
+
+    def test_stats(self):
+
+        stats = self.snapshot.get_stats()
+
+        self.assertEqual(stats["version"], snapshot.SNAPSHOT_VERSION)
+        self.assertEqual(stats["sets"], len(CLOSURES))
+        self.assertEqual(stats["members"], sum(map(len, CLOSURES.values())))
+        self.assertEqual(stats["neighbour_asns"], 3)
+        self.assertEqual(stats["neighbours"], 3)
+
+    def test_not_snapshot(self):
+
+        not_snapshot_name = os.path.join(self.temp_dir.name, "not.snapshot")
+        with open(not_snapshot_name, "wb") as not_snapshot_file:
+            not_snapshot_file.write(b"not a snapshot")
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.Snapshot, not_snapshot_name)
+
+
+class UseSnapshotTest(SnapshotTestCase):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.stub = RipeStub()
+        self.stub.assets = {"AS-TOP": ["AS5", "AS-ONE", "AS-BIG"]}
+        self.stub.start()
+
+        rpsl.use_snapshot(self.snapshot)
+        ripeapi.use_snapshot(self.snapshot)
+
+    def tearDown(self):
+
+        rpsl.use_snapshot(None)
+        ripeapi.use_snapshot(None)
+        self.stub.stop()
+
+        super().tearDown()
+
+    def test_member_closures_not_copied(self):
+
+        self.assertEqual(rpsl.uncover_asset("AS-TOP"), {5}.union(CLOSURES["AS-ONE"], CLOSURES["as-big"]))
+        self.assertEqual(self.stub.calls, {"as-set": 1})
+
+        self.assertNotIn("AS-ONE", rpsl._cache_closure)
+        self.assertNotIn("AS-BIG", rpsl._cache_closure)
+
+    def test_closure(self):
+
+        self.assertEqual(rpsl.uncover_asset("AS-ONE"), CLOSURES["AS-ONE"])
+        self.assertEqual(rpsl.uncover_asset("AS-ANY-INSIDE"), {ASN_ANY})
+        self.assertEqual(self.stub.calls, {})
+
+    def test_neighbours_not_cached(self):
+
+        self.assertEqual(ripeapi.get_neighbours_power("AS1"), [(2, "left", 50), (3, "right", 20)])
+        self.assertEqual(ripeapi.get_neighbours("AS1", 30), {"left": {2}, "right": set(), "uncertain": set()})
+        self.assertEqual(ripeapi.get_neighbours_many(["AS1", "AS3"]), {"AS1": {"left": {2}, "right": {3},
+                                                                               "uncertain": set()},
+                                                                       "AS3": {"left": set(), "right": set(),
+                                                                               "uncertain": set()}})
+
+        self.assertNotIn("AS1", ripeapi._cache_neighbours)
+        self.assertIn("AS3", ripeapi._cache_neighbours)
+        self.assertEqual(self.stub.calls, {"asn-neighbours": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
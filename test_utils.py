@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of in_cache single-flight calls and LRUStore
+"""
+
+import threading
+import time
+import unittest
+
+from utils import in_cache, LRUStore
+
+DEF_JOIN_TIMEOUT = 5
+DEF_POLL_DELAY = 0.01
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_recursive_flights_in_two_threads(self):
+        """
+        PRNG-A and PRNG-B reference each other, every thread leads one and recurses into the other
+        """
+
+        store = dict()
+        members = {"PRNG-A": "PRNG-B", "PRNG-B": "PRNG-A"}
+        barrier = threading.Barrier(2, timeout=DEF_JOIN_TIMEOUT)
+
+        @in_cache(store)
+        def uncover(name, path=()):
+            if len(path) == 0:
+                barrier.wait()
+
+            if members[name] in path:
+                return {name}
+
+            return {name}.union(uncover(members[name], path + (name,)))
+
+        results = dict()
+        threads = list(map(lambda name: threading.Thread(target=lambda: results.update({name: uncover(name)}),
+                                                         daemon=True), members))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(DEF_JOIN_TIMEOUT)
+
+        self.assertFalse(any(map(threading.Thread.is_alive, threads)))
+        self.assertEqual(results, {"PRNG-A": {"PRNG-A", "PRNG-B"}, "PRNG-B": {"PRNG-A", "PRNG-B"}})
+
+    def test_waiters_share_result(self):
+
+        calls = list()
+        started = threading.Event()
+        release = threading.Event()
+
+        @in_cache(dict())
+        def slow(name):
+            calls.append(name)
+            started.set()
+            release.wait(DEF_JOIN_TIMEOUT)
+            return name.lower()
+
+        results = dict()
+        leader = threading.Thread(target=lambda: results.update(leader=slow("AS-X")), daemon=True)
+        leader.start()
+        self.assertTrue(started.wait(DEF_JOIN_TIMEOUT))
+
+        waiter = threading.Thread(target=lambda: results.update(waiter=slow("AS-X")), daemon=True)
+        waiter.start()
+
+        # the leader is released only when the waiter is blocked on its flight
+        deadline = time.monotonic() + DEF_JOIN_TIMEOUT
+        while slow.cache_info()["waits"] == 0 and time.monotonic() < deadline:
+            time.sleep(DEF_POLL_DELAY)
+
+        self.assertEqual(slow.cache_info()["waits"], 1)
+
+        release.set()
+        leader.join(DEF_JOIN_TIMEOUT)
+        waiter.join(DEF_JOIN_TIMEOUT)
+
+        self.assertEqual(calls, ["AS-X"])
+        self.assertEqual(results, {"leader": "as-x", "waiter": "as-x"})
+        self.assertEqual(slow.cache_info()["misses"], 1)
+
+
+class LRUStoreTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+
+        store = LRUStore(max_entries=2, max_bytes=None)
+        store["a"] = 1
+        store["b"] = 2
+        store.get("a")
+        store["c"] = 3
+
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertEqual(store.get_stats()["evictions"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,22 +1,252 @@
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+from itertools import islice
+
+import instrument
+
+DEF_CACHE_ENTRIES = 1 << 17
+DEF_CACHE_BYTES = 1 << 28
+DEF_SIZE_SAMPLE = 8
+
+# flights led by the current thread across all in_cache functions
+_flights_held = threading.local()
+
+
+def get_size(value, deep=2):
+    """
+    Approximate size in bytes of the value, items of containers up to deep levels
+    are estimated by a few first items, so big sets cost the same as small ones
+    """
+
+    size = sys.getsizeof(value)
+
+    if deep <= 0 or not isinstance(value, (dict, set, frozenset, list, tuple,)) or len(value) == 0:
+        return size
+
+    if isinstance(value, dict):
+        items = list(islice(value.items(), DEF_SIZE_SAMPLE))
+        items_size = sum(map(lambda item: sys.getsizeof(item[0]) + get_size(item[1], deep - 1), items))
+    elif deep == 1:
+        items = list(islice(value, DEF_SIZE_SAMPLE))
+        items_size = sum(map(sys.getsizeof, items))
+    else:
+        items = list(islice(value, DEF_SIZE_SAMPLE))
+        items_size = sum(map(lambda item: get_size(item, deep - 1), items))
+
+    return size + items_size * len(value) // len(items)
+
+
+class LRUStore:
+    """
+    Dict-like store for in_cache bounded by entries and approximate bytes,
+    least recently used values are evicted first, safe to share between threads.
+    A value stored under many keys, like a closure shared by a cycle of as-sets, is counted once
+    """
+
+    def __init__(self, max_entries=DEF_CACHE_ENTRIES, max_bytes=DEF_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        self._shared = dict()
+        self._bytes = 0
+
+        self.evictions = 0
+
+    def _evict(self):
+
+        while 0 < len(self._values) and \
+                ((self.max_entries is not None and self.max_entries < len(self._values)) or
+                 (self.max_bytes is not None and self.max_bytes < self._bytes)):
+            _, value = self._values.popitem(last=False)
+            self._release(value)
+            self.evictions += 1
+
+    def _release(self, value):
+
+        shared = self._shared.get(id(value))
+        if shared is None:
+            return
+
+        shared[0] -= 1
+        if shared[0] == 0:
+            del self._shared[id(value)]
+            self._bytes -= shared[1]
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __getitem__(self, key):
+
+        # reads take no lock, single OrderedDict calls are atomic and a value
+        # evicted between them is just a KeyError, the same as a miss
+        value = self._values[key]
+        self._values.move_to_end(key)
+
+        return value
+
+    def get(self, key, default=None):
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+
+        size = get_size(value) if self.max_bytes is not None else 0
+
+        with self._lock:
+            if key in self._values:
+                self._release(self._values[key])
+
+            shared = self._shared.get(id(value))
+            if shared is None:
+                self._shared[id(value)] = [1, size]
+                self._bytes += size
+            else:
+                shared[0] += 1
+
+            self._values[key] = value
+            self._values.move_to_end(key)
+
+            self._evict()
+
+    def __delitem__(self, key):
+
+        with self._lock:
+            self._release(self._values.pop(key))
+
+    def pop(self, key, default=None):
+
+        with self._lock:
+            if key not in self._values:
+                return default
+
+            value = self._values.pop(key)
+            self._release(value)
+
+        return value
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+
+        with self._lock:
+            self._values.clear()
+            self._shared.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+
+        with self._lock:
+            return {"entries": len(self._values), "bytes": self._bytes, "evictions": self.evictions}
+
+
 def in_cache(cache_store:dict, cached_arg_num=0, cached_arg_name=None):
+    """
+    Concurrent calls with the same cached argument are single-flight: the first one calls
+    the function, others wait for its result. A thread already leading a flight does not wait,
+    it calls the function itself, so recursive sets led by two threads do not deadlock.
+    cache_info() of the decorated function returns hits, misses and waits
+    """
 
     def get_decorator(cached_func):
 
+        store_name = cached_func.__module__ + "." + cached_func.__name__
+
+        flights = dict()
+        flights_lock = threading.Lock()
+        stats = {"hits": 0, "misses": 0, "waits": 0}
+
+        def count(stat):
+
+            # GIL keeps the counters consistent enough for statistics without a lock on the hit path
+            stats[stat] += 1
+
+            if instrument.is_enabled() and stat != "waits":
+                instrument.count_cache(store_name, stat == "hits")
+
+        def call_cached(cached_var, args, kwargs):
+
+            try:
+                cached_data = cache_store[cached_var]
+            except KeyError:
+                pass
+            else:
+                count("hits")
+                return cached_data
+
+            count("misses")
+
+            func_data = cached_func(*args, **kwargs)
+
+            if func_data is None and hasattr(cache_store, "stale"):
+                return cache_store.stale(cached_var)
+
+            if func_data is not None:
+                cache_store[cached_var] = func_data
+
+            return func_data
+
+        @wraps(cached_func)
         def calling_func(*args, **kwargs):
             if cached_arg_name is not None and cached_arg_name in kwargs:
                 cached_var = kwargs[cached_arg_name]
             else:
                 cached_var = args[cached_arg_num]
 
-            if cached_var is not None and cached_var in cache_store:
-                return cache_store[cached_var]
+            if cached_var is None:
+                return cached_func(*args, **kwargs)
 
-            func_data = cached_func(*args, **kwargs)
+            try:
+                cached_data = cache_store[cached_var]
+            except KeyError:
+                pass
+            else:
+                count("hits")
+                return cached_data
 
-            if func_data is not None and cached_var is not None:
-                cache_store[cached_var] = func_data
+            held = getattr(_flights_held, "count", 0)
 
-            return func_data
+            with flights_lock:
+                flight = flights.get(cached_var)
+                if flight is None:
+                    flight = flights[cached_var] = {"done": threading.Lock(), "data": None}
+                    flight["done"].acquire()
+                    is_leader = True
+                else:
+                    is_leader = False
+
+            if not is_leader:
+                # waiting while leading another flight may close a cycle with the thread we wait for
+                if 0 < held:
+                    return call_cached(cached_var, args, kwargs)
+
+                count("waits")
+                with flight["done"]:
+                    return flight["data"]
+
+            _flights_held.count = held + 1
+
+            try:
+                flight["data"] = call_cached(cached_var, args, kwargs)
+            finally:
+                _flights_held.count = held
+                with flights_lock:
+                    del flights[cached_var]
+                flight["done"].release()
+
+            return flight["data"]
+
+        def cache_info():
+            return dict(stats, entries=len(cache_store))
+
+        calling_func.cache_info = cache_info
 
         return calling_func
 